@@ -0,0 +1,337 @@
+import json
+import os
+import re
+import sys
+import time
+from bs4 import BeautifulSoup, NavigableString
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+# 送料情報を取得するための複数のセレクタ
+POSTAGE_SELECTORS = [
+    "span.PricepostageValue",
+    "span.Price__postageValue",
+    "dd.Price__postage",
+    "span[data-react-unit-name='PostageValue']"
+]
+
+# ページに埋め込まれたJSONで送料を表すキー
+POSTAGE_JSON_KEYS = ('postagePrice', 'shippingPrice', 'totalPostage', 'postage')
+POSTAGE_SCRIPT_PATTERN = re.compile(r'"(?:postagePrice|shippingPrice|totalPostage|postage)"\s*:\s*"?([\d,]+)"?')
+
+SELLER_URL_PREFIX = 'https://auctions.yahoo.co.jp/seller/'
+
+# アクセスが多すぎる場合に返される制限ページの文言（オークションページの代わりに200で返ることがある）
+BLOCK_PAGE_PATTERNS = re.compile(
+    r'アクセスが集中|しばらく時間をおいて|一時的にご利用いただけません|Too Many Requests|unusual traffic', re.IGNORECASE)
+
+# 解析結果のキー（送料はSeleniumでの取得が必要な場合があるため別に扱う）
+PARSED_FIELDS = ('title', 'transaction_id', 'seller_id', 'seller_name', 'transaction_date', 'price',
+                 'tax_included_price')
+
+
+def parse_postage_text(postage_text):
+    """送料の表示文字列を数値文字列または'着払い'に変換する（送料無料は'0'）。解釈できない場合はNoneを返す"""
+    if '送料無料' in postage_text:
+        return '0'
+    postage_match = re.search(r'([\d,]+)円', postage_text)
+    if postage_match:
+        return postage_match.group(1).replace(',', '')
+    if '着払い' in postage_text or '落札者負担' in postage_text:
+        return '着払い'
+    return None
+
+
+def find_postage_in_json(data):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in POSTAGE_JSON_KEYS and isinstance(value, (int, str)) and re.fullmatch(r'[\d,]+', str(value)):
+                return str(value).replace(',', '')
+            found = find_postage_in_json(value)
+            if found is not None:
+                return found
+    elif isinstance(data, list):
+        for item in data:
+            found = find_postage_in_json(item)
+            if found is not None:
+                return found
+    return None
+
+
+def find_postage_in_scripts(scripts):
+    """(type属性, 本文) のリストから、埋め込みのページデータ（JSON / script内の変数）の送料を探す"""
+    for script_type, script_text in scripts:
+        if not script_text:
+            continue
+        if script_type == 'application/json':
+            try:
+                total_postage = find_postage_in_json(json.loads(script_text))
+            except ValueError:
+                total_postage = None
+            if total_postage is not None:
+                return total_postage
+        postage_match = POSTAGE_SCRIPT_PATTERN.search(script_text)
+        if postage_match:
+            return postage_match.group(1).replace(',', '')
+    return None
+
+
+def is_block_page(html):
+    """アクセス制限のページかどうか（オークションページのタイトルがなく、制限の文言がある）"""
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='ignore')
+    return 'ProductTitle' not in html and BLOCK_PAGE_PATTERNS.search(html[:20000]) is not None
+
+
+def digits_only(text):
+    return re.sub(r'[^\d]', '', text)
+
+
+def build_result(title, auction_id, seller_link, end_date, price_text, tax_text, postage_texts, scripts):
+    """各バックエンドが取り出した文字列から、共通の形式の解析結果を作る
+
+    seller_link: (href, リンクの文字列) またはNone
+    price_text / tax_text: 要素がなければNone
+    postage_texts: POSTAGE_SELECTORSの順に見つかった送料の文字列
+    scripts: 送料を探すための (type属性, 本文) のリスト（必要になるまで評価しないcallableも可）
+    """
+    if seller_link:
+        seller_id = seller_link[0].split('/seller/')[-1]
+        seller = seller_link[1].strip()
+    else:
+        seller_id = 'N/A'
+        seller = 'N/A'
+
+    price = digits_only(price_text.strip()) if price_text is not None else 'N/A'
+    tax_included_price = digits_only(tax_text.strip()) if tax_text is not None else '0'
+    # tax_included_priceが'0'の場合、priceの値を使用
+    if tax_included_price == '0':
+        tax_included_price = price
+
+    total_postage, postage_source = None, None
+    for postage_text in postage_texts:
+        total_postage = parse_postage_text(postage_text)
+        if total_postage is not None:
+            postage_source = 'static_html'
+            break
+    else:
+        total_postage = find_postage_in_scripts(scripts() if callable(scripts) else scripts)
+        # 送料の要素があっても解釈できない表記（読み込み中の仮の表示など）の場合は、ブラウザで取り直す
+        if total_postage is not None:
+            postage_source = 'page_data'
+
+    return {
+        'title': title.strip() if title is not None else 'N/A',
+        'transaction_id': auction_id.strip() if auction_id is not None else 'N/A',
+        'seller_id': seller_id,
+        'seller_name': seller,
+        'transaction_date': end_date.strip() if end_date is not None else 'N/A',
+        'price': price,
+        'tax_included_price': tax_included_price,
+        'total_postage': total_postage,
+        'postage_source': postage_source
+    }
+
+
+def parse_with_bs4(html):
+    """BeautifulSoup（html.parser）による解析。他のバックエンドの基準となる実装"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    def select_text(selector):
+        element = soup.select_one(selector)
+        return element.text if element else None
+
+    seller_link = soup.select_one(f'a[href^="{SELLER_URL_PREFIX}"][data-cl-params*="seller"]')
+    price_element = soup.select_one('dd.Price__value')
+    price_text = None
+    if price_element:
+        first = price_element.contents[0] if price_element.contents else ''
+        price_text = str(first) if isinstance(first, NavigableString) else ''
+
+    postage_texts = []
+    for selector in POSTAGE_SELECTORS:
+        element = soup.select_one(selector)
+        if element:
+            postage_texts.append(element.get_text(strip=True))
+
+    return build_result(
+        select_text('div.ProductTitle__title h1'),
+        select_text('th:-soup-contains("オークションID") + td'),
+        (seller_link['href'], seller_link.text) if seller_link and 'href' in seller_link.attrs else None,
+        select_text('th:-soup-contains("終了日時") + td'),
+        price_text,
+        select_text('span.Price__tax'),
+        postage_texts,
+        lambda: [(script.get('type'), script.string or script.get_text()) for script in soup.find_all('script')]
+    )
+
+
+def xpath_class(element, class_name):
+    return f"//{element}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+# POSTAGE_SELECTORSと同じ順序のXPath
+LXML_POSTAGE_XPATHS = [
+    xpath_class('span', 'PricepostageValue'),
+    xpath_class('span', 'Price__postageValue'),
+    xpath_class('dd', 'Price__postage'),
+    "//span[@data-react-unit-name='PostageValue']"
+]
+
+
+def parse_with_lxml(html):
+    """lxmlによる解析。必要な要素だけをXPathで直接取り出す"""
+    root = lxml.html.fromstring(html)
+
+    def first(xpath):
+        elements = root.xpath(xpath)
+        return elements[0] if elements else None
+
+    def first_text(xpath):
+        element = first(xpath)
+        return element.text_content() if element is not None else None
+
+    def th_value(label):
+        return first_text(f"//th[contains(., '{label}')]/following-sibling::*[1][self::td]")
+
+    seller_link = first(f"//a[starts-with(@href, '{SELLER_URL_PREFIX}') and contains(@data-cl-params, 'seller')]")
+    price_element = first(xpath_class('dd', 'Price__value'))
+    price_text = (price_element.text or '') if price_element is not None else None
+
+    postage_texts = []
+    for xpath in LXML_POSTAGE_XPATHS:
+        element = first(xpath)
+        if element is not None:
+            postage_texts.append(''.join(text.strip() for text in element.itertext()))
+
+    return build_result(
+        first_text(xpath_class('div', 'ProductTitle__title') + '//h1'),
+        th_value('オークションID'),
+        (seller_link.get('href'), seller_link.text_content()) if seller_link is not None else None,
+        th_value('終了日時'),
+        price_text,
+        first_text(xpath_class('span', 'Price__tax')),
+        postage_texts,
+        lambda: [(script.get('type'), script.text_content()) for script in root.iter('script')]
+    )
+
+
+def parse_with_selectolax(html):
+    """selectolaxによる解析。th要素の検索はCSSセレクタで候補を絞ってから文字列で判定する"""
+    tree = SelectolaxParser(html)
+
+    def first_text(selector):
+        node = tree.css_first(selector)
+        return node.text() if node else None
+
+    def th_value(label):
+        for th in tree.css('th'):
+            if label in th.text():
+                sibling = th.next
+                while sibling is not None and sibling.tag in ('-text', '-comment'):
+                    sibling = sibling.next
+                if sibling is not None and sibling.tag == 'td':
+                    return sibling.text()
+        return None
+
+    seller_link = tree.css_first(f'a[href^="{SELLER_URL_PREFIX}"][data-cl-params*="seller"]')
+    price_element = tree.css_first('dd.Price__value')
+    price_text = None
+    if price_element:
+        child = price_element.child
+        price_text = child.text_content if child is not None and child.tag == '-text' else ''
+
+    postage_texts = []
+    for selector in POSTAGE_SELECTORS:
+        node = tree.css_first(selector)
+        if node:
+            postage_texts.append(node.text(strip=True))
+
+    return build_result(
+        first_text('div.ProductTitle__title h1'),
+        th_value('オークションID'),
+        (seller_link.attributes.get('href'), seller_link.text()) if seller_link else None,
+        th_value('終了日時'),
+        price_text,
+        first_text('span.Price__tax'),
+        postage_texts,
+        lambda: [(script.attributes.get('type'), script.text()) for script in tree.css('script')]
+    )
+
+
+PARSER_BACKENDS = {'html.parser': parse_with_bs4}
+if lxml is not None:
+    PARSER_BACKENDS['lxml'] = parse_with_lxml
+if SelectolaxParser is not None:
+    PARSER_BACKENDS['selectolax'] = parse_with_selectolax
+
+
+def resolve_backend(backend='auto'):
+    """'auto'の場合は使えるバックエンドのうち最も速いものを選ぶ"""
+    if backend == 'auto':
+        for name in ('lxml', 'selectolax', 'html.parser'):
+            if name in PARSER_BACKENDS:
+                return name
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown or unavailable parser backend: {backend}")
+    return backend
+
+
+def parse_auction_html(html, backend='auto'):
+    """オークションページのHTML（strまたはbytes）を解析し、各項目の辞書を返す
+
+    見つからなかった項目は'N/A'。HTMLから送料が読み取れなかった場合、
+    total_postage / postage_source はNoneになる。
+    """
+    return PARSER_BACKENDS[resolve_backend(backend)](html)
+
+
+def compare_backends(paths, backends=None):
+    """保存済みのページでバックエンドごとの解析結果と時間を比較する
+
+    html.parserの結果を基準とし、ページごとに (パス, {バックエンド: (秒, 一致したか)}) を返す。
+    """
+    backends = backends or list(PARSER_BACKENDS)
+    report = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            html = f.read()
+        start = time.perf_counter()
+        expected = parse_with_bs4(html)
+        timings = {'html.parser': (time.perf_counter() - start, True)}
+        for backend in backends:
+            if backend == 'html.parser':
+                continue
+            start = time.perf_counter()
+            result = PARSER_BACKENDS[backend](html)
+            timings[backend] = (time.perf_counter() - start, result == expected)
+        report.append((path, timings))
+    return report
+
+
+if __name__ == "__main__":
+    # 使い方: python auction_parser.py 保存したページ.html ... （ディレクトリも指定可）
+    page_paths = []
+    for arg in sys.argv[1:]:
+        if os.path.isdir(arg):
+            page_paths.extend(os.path.join(arg, name) for name in sorted(os.listdir(arg)) if name.endswith('.html'))
+        else:
+            page_paths.append(arg)
+
+    mismatches = 0
+    for page_path, page_timings in compare_backends(page_paths):
+        base_time = page_timings['html.parser'][0]
+        columns = []
+        for name, (elapsed, matched) in page_timings.items():
+            mismatches += 0 if matched else 1
+            columns.append(f"{name}: {elapsed * 1000:.1f}ms x{base_time / elapsed:.1f}{'' if matched else ' MISMATCH'}")
+        print(f"{page_path}  " + "  ".join(columns))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,80 @@
+import re
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# 履歴の種類ごとの書き込み先シート名
+HISTORY_SHEETS = {
+    'purchase': 'ヤフオク購入履歴',
+    'sale': 'ヤフオク売却履歴'
+}
+
+# 終了日時の表記（例: "2024.03.10（日）22:00", "2024年3月10日（日）22時00分", "3月10日（日）22時0分", "2024/03/10 22:00:00"）
+END_DATE_PATTERN = re.compile(
+    r'(?:(\d{4})\s*[./年-]\s*)?(\d{1,2})\s*[./月-]\s*(\d{1,2})\s*日?\s*'
+    r'(?:[（(][^）)]*[）)])?\s*(\d{1,2})\s*[:時]\s*(\d{1,2})'
+)
+
+
+def parse_end_date(text, now=None):
+    """終了日時の文字列をdatetimeに変換する。解釈できない場合はNoneを返す
+
+    年が省略されている場合は現在の年とし、半年以上先になる場合は前年とみなす。
+    """
+    if not text:
+        return None
+    match = END_DATE_PATTERN.search(text)
+    if not match:
+        return None
+    now = now or datetime.now()
+    year, month, day, hour, minute = match.groups()
+    try:
+        end_date = datetime(int(year) if year else now.year, int(month), int(day), int(hour), int(minute))
+    except ValueError:
+        return None
+    if not year and end_date - now > timedelta(days=183):
+        end_date = end_date.replace(year=end_date.year - 1)
+    return end_date
+
+
+# オークションURL中のオークションID（例: https://page.auctions.yahoo.co.jp/jp/auction/x123456789）
+AUCTION_ID_PATTERN = re.compile(r'/auction/([a-zA-Z]?\d+)')
+# 旧形式のURL（例: https://page.auctions.yahoo.co.jp/show/qa?aID=x123456789）のオークションID
+AUCTION_ID_QUERY_PATTERN = re.compile(r'[?&]aID=([a-zA-Z]?\d+)')
+
+
+def extract_auction_id(url):
+    """URLからオークションIDを取り出す。見つからなければNoneを返す"""
+    match = AUCTION_ID_PATTERN.search(url or '') or AUCTION_ID_QUERY_PATTERN.search(url or '')
+    if match:
+        return match.group(1)
+    return None
+
+
+# オークションページのホスト（PC版・スマートフォン版など）
+YAHOO_AUCTION_HOST_PATTERN = re.compile(r'(^|\.)auctions\.yahoo\.co\.jp$')
+CANONICAL_AUCTION_URL = 'https://page.auctions.yahoo.co.jp/jp/auction/{}'
+# 流入元の計測用で、ページの内容に影響しないクエリパラメータ（名前そのもの・接頭辞）
+TRACKING_PARAMS = {'fr', 'ref', 'from', 'spm', 'yclid', 'gclid', 'fbclid'}
+TRACKING_PARAM_PREFIXES = ('utm_', 'cpt_', 'sc_')
+
+
+def auction_key(url):
+    """同じオークションを指すURLが同じ値になるキー（オークションID、なければ正規化したURL）を返す"""
+    return extract_auction_id(url) or normalize_auction_url(url)
+
+
+def normalize_auction_url(url):
+    """Yahoo!オークションのURLをPC版の正規のURLに変換する
+
+    スマートフォン版・旧形式・計測用のパラメータ付きのURLも同じURLになる。
+    オークションIDが取れない、またはYahoo!オークション以外のURLは、フラグメントと計測用のパラメータだけ取り除く。
+    """
+    url = (url or '').strip()
+    parts = urlsplit(url)
+    if YAHOO_AUCTION_HOST_PATTERN.search(parts.hostname or ''):
+        auction_id = extract_auction_id(url)
+        if auction_id:
+            return CANONICAL_AUCTION_URL.format(auction_id)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PARAM_PREFIXES)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
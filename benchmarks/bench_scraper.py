@@ -0,0 +1,246 @@
+"""スクレイパーのオフラインベンチマーク
+
+Yahoo!オークションとGoogleスプレッドシートに接続せずに、smart_scrapingの処理速度を測定する。
+
+- corpus/ の保存済みオークションページ（送料ありのページと、Seleniumでの取得が必要なページ）を
+  ローカルのHTTPサーバーから、指定した遅延をつけて配信する
+- シートの読み書きはメモリ上のFakeSheetsServiceで代替する
+- 1秒あたりの行数、1行あたりの処理時間（p50 / p99）、取得・解析・レンダリング・書き込みの時間配分を表示する
+- --parse-processes を指定すると解析を別プロセスで行い、プロセス間の受け渡しにかかった時間も表示する
+
+使い方:
+    python benchmarks/bench_scraper.py --rows 200 --workers 8 --parser lxml --latency 0.05
+    python benchmarks/bench_scraper.py --rows 2000 --workers 8 --latency 0 --parse-processes 0 4
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yahoo_ac_scraper  # noqa: E402
+from auction_parser import PARSER_BACKENDS  # noqa: E402
+from fake_sheets import FakeSheetsService  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+from metrics import start_run  # noqa: E402
+from parse_pool import ParsePool  # noqa: E402
+from sinks import SheetsSink  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+SHEET_NAME = 'ベンチマーク'
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/benchmark/edit'
+TAGS = ['url', 'title', 'transaction_id', 'seller_id', 'seller_name', 'transaction_date', 'price',
+        'tax_included_price', 'total_postage', 'postage_source']
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                pages.append(f.read())
+    return pages
+
+
+def start_corpus_server(pages, latency=0.0, jitter=0.0):
+    """/jp/auction/b<番号> へのリクエストに corpus のページを順番に返すHTTPサーバーを起動する"""
+
+    class CorpusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = re.search(r'/auction/b(\d+)', self.path)
+            if not match:
+                self.send_error(404)
+                return
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+            body = pages[int(match.group(1)) % len(pages)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CorpusHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_sheet(base_url, rows):
+    values = [['ヘッダー'] * len(TAGS), list(TAGS)]
+    for index in range(rows):
+        values.append([f'{base_url}/jp/auction/b{index}'])
+    return FakeSheetsService({SHEET_NAME: values})
+
+
+class StageTimer:
+    """関数を包んで処理段階ごとの合計時間を記録し、計測値の'row'から1行ごとの処理時間を集める"""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.row_latencies = []
+        self.lock = threading.Lock()
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.totals[stage] += elapsed
+        return timed
+
+    def collect_rows(self, metrics):
+        """metricsに記録される'row'の時間を、ヒストグラムの区切りに丸めずにそのまま集める"""
+        original_record = metrics.record
+
+        def record(stage, seconds):
+            if stage == 'row':
+                with self.lock:
+                    self.row_latencies.append(seconds)
+            original_record(stage, seconds)
+        metrics.record = record
+
+
+def percentile(values, ratio):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def run_benchmark(rows=200, workers=4, parser_backend='auto', latency=0.02, jitter=0.0, render=False,
+                  requests_per_second=0, flush_rows=50, parse_processes=0):
+    pages = load_corpus()
+    metrics = start_run()
+    # 子プロセスは最初の投入で起動するため、計測を始める前に全て起動して解析の準備を済ませておく
+    parse_pool = ParsePool(parse_processes, parser_backend) if parse_processes else None
+    if parse_pool:
+        parse_pool.warm_up()
+    server = start_corpus_server(pages, latency, jitter)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    service = build_sheet(base_url, rows)
+    http_client = HttpClient(pool_size=max(workers, 1))
+    timer = StageTimer()
+
+    # 計測用に各段階の関数を包む
+    timer.collect_rows(metrics)
+    original_parse = yahoo_ac_scraper.parse_auction_html
+    original_render = yahoo_ac_scraper.extract_postage_with_selenium
+    original_flush = SheetsSink.flush
+    http_client.get = timer.wrap('fetch', http_client.get)
+    yahoo_ac_scraper.parse_auction_html = timer.wrap('parse', original_parse)
+    yahoo_ac_scraper.extract_postage_with_selenium = timer.wrap('render', original_render)
+    SheetsSink.flush = timer.wrap('write', original_flush)
+    try:
+        start = time.perf_counter()
+        new_count, skipped_count, details = yahoo_ac_scraper.smart_scraping(
+            service, SPREADSHEET_URL, SHEET_NAME, 3, None, lambda: True,
+            max_workers=workers, requests_per_second=requests_per_second, flush_rows=flush_rows,
+            http_client=http_client, parser_backend=parser_backend,
+            browser_profile='scraping' if render else None, parse_pool=parse_pool)
+        elapsed = time.perf_counter() - start
+    finally:
+        yahoo_ac_scraper.parse_auction_html = original_parse
+        yahoo_ac_scraper.extract_postage_with_selenium = original_render
+        SheetsSink.flush = original_flush
+        http_client.close()
+        server.shutdown()
+        if parse_pool:
+            parse_pool.close()
+
+    stages = metrics.summary()['stages']
+    counters = metrics.summary()['counters']
+    if parse_pool:
+        # 段階に分けた場合は解析が別プロセスで行われるため、解析時間は子プロセスでの計測値から取る
+        timer.totals['parse'] = stages.get('parse_cpu', {}).get('total', 0.0)
+    p50_row_latency = percentile(timer.row_latencies, 0.50)
+    p99_row_latency = percentile(timer.row_latencies, 0.99)
+
+    return {
+        'rows': rows,
+        'workers': workers,
+        'parser_backend': parser_backend,
+        'parse_processes': parse_processes,
+        'latency': latency,
+        'render': render,
+        'new_count': new_count,
+        'skipped_count': skipped_count,
+        'failed': details['failed'],
+        'elapsed': elapsed,
+        'rows_per_second': rows / elapsed if elapsed else 0.0,
+        'p50_row_latency': p50_row_latency,
+        'p99_row_latency': p99_row_latency,
+        'stage_seconds': {stage: timer.totals.get(stage, 0.0) for stage in ('fetch', 'parse', 'render', 'write')},
+        'sheets_requests': dict(service.request_counts),
+        # 解析を別プロセスで行った場合の、受け渡しを含めた時間と受け渡したバイト数
+        'parse_wait_seconds': stages.get('parse_wait', {}).get('total', 0.0),
+        'parse_return_seconds': stages.get('parse_return', {}).get('total', 0.0),
+        'parse_bytes_in': counters.get('parse_bytes_in', 0),
+        'parse_bytes_out': counters.get('parse_bytes_out', 0)
+    }
+
+
+def print_report(result):
+    print(f"rows={result['rows']} workers={result['workers']} parser={result['parser_backend']} "
+          f"parse_processes={result['parse_processes']} latency={result['latency'] * 1000:.0f}ms "
+          f"render={result['render']}")
+    print(f"  elapsed:        {result['elapsed']:.2f}s ({result['rows_per_second']:.1f} rows/s)")
+    print(f"  row latency:    p50 {result['p50_row_latency'] * 1000:.1f}ms  "
+          f"p99 {result['p99_row_latency'] * 1000:.1f}ms")
+    stage_total = sum(result['stage_seconds'].values()) or 1.0
+    print("  time split:     " + "  ".join(
+        f"{stage} {seconds:.2f}s ({seconds / stage_total:.0%})" for stage, seconds in result['stage_seconds'].items()))
+    print(f"  results:        new {result['new_count']}, skipped {result['skipped_count']}, "
+          f"failed {result['failed']}")
+    print(f"  sheets requests: {result['sheets_requests']}")
+    if result['parse_processes']:
+        pages = max(result['new_count'], 1)
+        print(f"  parse pool:     wait {result['parse_wait_seconds'] / pages * 1000:.1f}ms/page  "
+              f"cpu {result['stage_seconds']['parse'] / pages * 1000:.1f}ms/page  "
+              f"return {result['parse_return_seconds'] / pages * 1000:.2f}ms/page  "
+              f"({result['parse_bytes_in'] / 1024 / 1024:.1f}MB in, {result['parse_bytes_out'] / 1024:.0f}KB out)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="スクレイパーのオフラインベンチマーク")
+    parser.add_argument('--rows', type=int, default=200, help="処理する行数")
+    parser.add_argument('--workers', type=int, nargs='+', default=[4], help="ワーカー数（複数指定で比較）")
+    parser.add_argument('--parser', nargs='+', default=['auto'], choices=['auto', *PARSER_BACKENDS],
+                        help="HTMLパーサー（複数指定で比較）")
+    parser.add_argument('--latency', type=float, default=0.02, help="ローカルサーバーの応答遅延（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="応答遅延のばらつき（秒）")
+    parser.add_argument('--rps', type=float, default=0, help="1秒あたりのリクエスト数の上限（0で無制限）")
+    parser.add_argument('--render', action='store_true', help="送料がHTMLにないページをChromeでレンダリングする")
+    parser.add_argument('--parse-processes', type=int, nargs='+', default=[0],
+                        help="HTMLの解析に使うプロセス数（0でスレッド内、複数指定で比較）")
+    parser.add_argument('--json', help="結果をJSON Lines形式で追記するファイル")
+    args = parser.parse_args(argv)
+    # 行ごとのログを抑えてレポートだけを表示する
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for parser_backend in args.parser:
+        for workers in args.workers:
+            for parse_processes in args.parse_processes:
+                result = run_benchmark(args.rows, workers, parser_backend, args.latency, args.jitter, args.render,
+                                       args.rps, parse_processes=parse_processes)
+                print_report(result)
+                if args.json:
+                    with open(args.json, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+if __name__ == "__main__":
+    main()
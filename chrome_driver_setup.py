@@ -1,4 +1,7 @@
 import os
+import re
+import shutil
+import subprocess
 import requests
 import zipfile
 import io
@@ -6,16 +9,51 @@ import platform
 import logging
 import json
 import time
+import threading
+from contextlib import contextmanager
 from tqdm import tqdm
+from http_client import get_http_client
+from metrics import get_metrics
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import WebDriverException, TimeoutException, SessionNotCreatedException
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 CHROME_DRIVER_FOLDER = os.path.join(os.path.expanduser("~"), ".chrome_driver")
 CHROME_DRIVER_PATH = os.path.join(CHROME_DRIVER_FOLDER, "chromedriver")
 JSON_ENDPOINT = "https://googlechromelabs.github.io/chrome-for-testing/known-good-versions-with-downloads.json"
+# バージョン一覧と、検出したChrome・ChromeDriverのバージョンのキャッシュ
+RESOLUTION_CACHE_PATH = os.path.join(CHROME_DRIVER_FOLDER, "driver_resolution.json")
+RESOLUTION_CACHE_TTL = 24 * 60 * 60
+# Linuxで探すChrome / Chromiumの実行ファイル名
+LINUX_CHROME_BINARIES = ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome']
+
+# ブラウザのプロファイル
+# scraping: 送料の文字列だけを読むための軽量設定（ヘッドレス、不要なリソースをブロック、DOM構築後に制御を返す）
+BROWSER_PROFILES = {
+    'default': {'headless': False, 'block_resources': False, 'page_load_strategy': 'normal'},
+    'scraping': {'headless': True, 'block_resources': True, 'page_load_strategy': 'eager'},
+}
+# scrapingプロファイルでブロックするURLのパターン
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*.mp4', '*.webm', '*.mp3',
+    '*doubleclick.net*', '*googlesyndication.com*', '*google-analytics.com*', '*googletagmanager.com*',
+    '*googleadservices.com*', '*yads.yahoo.co.jp*', '*yads.c.yimg.jp*', '*b.yjtag.jp*',
+    '*facebook.net*', '*twitter.com*', '*criteo.com*', '*criteo.net*'
+]
+
+# プロセス内で解決済みの (ChromeDriverのパス, Chromeのパス)
+_resolved_driver = None
+_resolve_lock = threading.Lock()
 
 
 def get_platform():
@@ -30,25 +68,88 @@ def get_platform():
         raise OSError("Unsupported operating system")
 
 
+def find_chrome_binary():
+    """インストールされているChrome / Chromiumの実行ファイルのパスを返す（Windowsはレジストリで判定するためNone）"""
+    system = platform.system()
+    if system == "Darwin":  # macOS
+        candidates = ['/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+                      '/Applications/Chromium.app/Contents/MacOS/Chromium']
+        return next((path for path in candidates if os.path.exists(path)), None)
+    elif system == "Linux":
+        for name in LINUX_CHROME_BINARIES:
+            path = shutil.which(name)
+            if path:
+                return path
+    return None
+
+
 def get_chrome_version():
-    if platform.system() == "Darwin":  # macOS
-        cmd = r'/Applications/Google\ Chrome.app/Contents/MacOS/Google\ Chrome --version'
-    elif platform.system() == "Windows":
-        cmd = r'reg query "HKEY_CURRENT_USER\Software\Google\Chrome\BLBeacon" /v version'
+    system = platform.system()
+    if system == "Windows":
+        cmd = ['reg', 'query', r'HKEY_CURRENT_USER\Software\Google\Chrome\BLBeacon', '/v', 'version']
+    elif system in ("Darwin", "Linux"):
+        chrome_binary = find_chrome_binary()
+        if not chrome_binary:
+            raise OSError("Google Chrome / Chromium is not installed")
+        cmd = [chrome_binary, '--version']
     else:
         raise OSError("Unsupported operating system")
 
-    output = os.popen(cmd).read()
-    version = output.strip().split()[-1]
+    output = subprocess.run(cmd, capture_output=True, text=True, timeout=30).stdout
+    match = re.search(r'(\d+\.\d+\.\d+\.\d+)', output)
+    if not match:
+        raise OSError(f"Could not detect Chrome version from: {output.strip()}")
+    version = match.group(1)
     logging.info(f"Detected Chrome version: {version}")
     return version
 
 
-def get_matching_driver_version(chrome_version):
+def load_resolution_cache():
     try:
-        response = requests.get(JSON_ENDPOINT)
+        with open(RESOLUTION_CACHE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_resolution_cache(cache):
+    os.makedirs(CHROME_DRIVER_FOLDER, exist_ok=True)
+    temp_path = RESOLUTION_CACHE_PATH + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(temp_path, RESOLUTION_CACHE_PATH)
+
+
+def get_manifest(cache=None):
+    """Chrome for Testingのバージョン一覧を返す。ディスクのキャッシュがTTL内ならダウンロードしない"""
+    cache = load_resolution_cache() if cache is None else cache
+    manifest = cache.get('manifest')
+    if manifest and time.time() - cache.get('manifest_fetched_at', 0) < RESOLUTION_CACHE_TTL:
+        return manifest
+    try:
+        response = get_http_client().get(JSON_ENDPOINT)
         response.raise_for_status()
-        data = response.json()
+        manifest = response.json()
+    except requests.RequestException as e:
+        if manifest:
+            # オフラインの場合は期限切れでも手元のキャッシュを使う
+            logging.warning(f"Error fetching ChromeDriver manifest, using cached copy: {e}")
+            return manifest
+        raise
+    # ChromeDriverの情報だけを残してキャッシュを小さくする
+    manifest = {'versions': [
+        {'version': version['version'], 'downloads': {'chromedriver': version['downloads']['chromedriver']}}
+        for version in manifest['versions'] if version.get('downloads', {}).get('chromedriver')
+    ]}
+    cache['manifest'] = manifest
+    cache['manifest_fetched_at'] = time.time()
+    save_resolution_cache(cache)
+    return manifest
+
+
+def get_matching_driver_version(chrome_version, manifest=None):
+    try:
+        data = manifest or get_manifest()
         chrome_major_minor = '.'.join(chrome_version.split('.')[:2])  # 例: "128.0"
         compatible_versions = []
         for version in data['versions']:
@@ -65,11 +166,9 @@ def get_matching_driver_version(chrome_version):
         return None
 
 
-def get_download_url_from_json(version):
+def get_download_url_from_json(version, manifest=None):
     try:
-        response = requests.get(JSON_ENDPOINT)
-        response.raise_for_status()
-        data = response.json()
+        data = manifest or get_manifest()
         platform_name = get_platform()
         logging.info(f"Searching for ChromeDriver version {version} for platform {platform_name}")
         for v in data['versions']:
@@ -88,11 +187,11 @@ def get_download_url_from_json(version):
         return None
 
 
-def download_driver(version):
+def download_driver(version, manifest=None):
     if not os.path.exists(CHROME_DRIVER_FOLDER):
         os.makedirs(CHROME_DRIVER_FOLDER)
 
-    url = get_download_url_from_json(version)
+    url = get_download_url_from_json(version, manifest)
     if not url:
         logging.error(f"Unable to find download URL for ChromeDriver version {version}")
         return False
@@ -100,7 +199,7 @@ def download_driver(version):
     logging.info(f"Attempting to download ChromeDriver from: {url}")
 
     try:
-        response = requests.get(url, stream=True)
+        response = get_http_client().get(url, stream=True)
         response.raise_for_status()
         total_size = int(response.headers.get('content-length', 0))
         block_size = 1024  # 1 KB
@@ -136,36 +235,117 @@ def download_driver(version):
     return False
 
 
-def download_with_retry(version, max_retries=3, delay=5):
+def download_with_retry(version, max_retries=3, delay=5, manifest=None):
     for attempt in range(max_retries):
-        if download_driver(version):
+        if download_driver(version, manifest):
             return True
         logging.warning(f"Download attempt {attempt + 1} failed. Retrying in {delay} seconds...")
         time.sleep(delay)
     return False
 
 
-def get_chrome_driver():
-    try:
-        chrome_version = get_chrome_version()
-        driver_version = get_matching_driver_version(chrome_version)
+def resolve_chrome_driver(refresh=False):
+    """使用するChromeとChromeDriverを決定し、(ChromeDriverのパス, Chromeのパス) を返す
 
+    前回の結果をディスクにキャッシュし、Chromeのバージョンが変わっておらず
+    TTL内であれば、ネットワークアクセスやChromeDriverの起動なしで決定する。
+    """
+    global _resolved_driver
+    with _resolve_lock:
+        if _resolved_driver and not refresh:
+            return _resolved_driver
+
+        chrome_version = get_chrome_version()
+        chrome_binary = find_chrome_binary()
+        cache = load_resolution_cache()
+        if (not refresh
+                and cache.get('chrome_version') == chrome_version
+                and cache.get('platform') == get_platform()
+                and time.time() - cache.get('resolved_at', 0) < RESOLUTION_CACHE_TTL
+                and os.path.exists(CHROME_DRIVER_PATH)):
+            logging.info(f"Using cached ChromeDriver {cache.get('driver_version')} for Chrome {chrome_version}")
+            _resolved_driver = (CHROME_DRIVER_PATH, chrome_binary)
+            return _resolved_driver
+
+        manifest = get_manifest(cache)
+        driver_version = get_matching_driver_version(chrome_version, manifest)
         if not driver_version:
             raise Exception("Unable to determine appropriate ChromeDriver version")
 
         if not os.path.exists(CHROME_DRIVER_PATH) or get_driver_version() != driver_version:
             logging.info(f"Downloading ChromeDriver {driver_version}")
-            if not download_with_retry(driver_version):
+            if not download_with_retry(driver_version, manifest=manifest):
                 raise Exception("Failed to download ChromeDriver after multiple attempts")
 
-        chrome_options = Options()
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
+        cache.update({
+            'chrome_version': chrome_version,
+            'chrome_binary': chrome_binary,
+            'driver_version': driver_version,
+            'platform': get_platform(),
+            'resolved_at': time.time()
+        })
+        save_resolution_cache(cache)
+        _resolved_driver = (CHROME_DRIVER_PATH, chrome_binary)
+        return _resolved_driver
+
+
+def build_chrome_options(profile='default', chrome_binary=None):
+    settings = BROWSER_PROFILES[profile]
+    chrome_options = Options()
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    if chrome_binary:
+        chrome_options.binary_location = chrome_binary
+    chrome_options.page_load_strategy = settings['page_load_strategy']
+
+    if settings['headless']:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1280,800")
+        chrome_options.add_argument("--disable-gpu")
+    if settings['block_resources']:
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.managed_default_content_settings.media_stream': 2,
+            'profile.managed_default_content_settings.notifications': 2
+        })
+    return chrome_options
+
+
+def block_resources(driver):
+    """画像・メディア・フォントとサードパーティのホストへのリクエストをブロックする"""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        logging.warning(f"Could not enable resource blocking: {e}")
 
-        service = ChromeService(executable_path=CHROME_DRIVER_PATH)
-        driver = webdriver.Chrome(service=service, options=chrome_options)
 
-        logging.info("Chrome driver initialized successfully")
+def get_chrome_driver(profile='default'):
+    """ChromeDriverを起動する
+
+    profile: 'default'（通常のChrome）または'scraping'（ヘッドレス・リソースブロック・eager読み込み）
+    """
+    try:
+        driver_path, chrome_binary = resolve_chrome_driver()
+        chrome_options = build_chrome_options(profile, chrome_binary)
+
+        service = ChromeService(executable_path=driver_path)
+        try:
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+        except SessionNotCreatedException:
+            # キャッシュしたChromeDriverが合わなくなった場合は解決し直して1回だけ再試行する
+            logging.warning("Cached ChromeDriver is not compatible, resolving again")
+            driver_path, chrome_binary = resolve_chrome_driver(refresh=True)
+            service = ChromeService(executable_path=driver_path)
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+
+        if BROWSER_PROFILES[profile]['block_resources']:
+            block_resources(driver)
+
+        logging.info(f"Chrome driver initialized successfully (profile: {profile})")
         return driver
 
     except Exception as e:
@@ -175,7 +355,7 @@ def get_chrome_driver():
 
 def get_driver_version():
     try:
-        output = os.popen(f"{CHROME_DRIVER_PATH} --version").read()
+        output = subprocess.run([CHROME_DRIVER_PATH, '--version'], capture_output=True, text=True, timeout=30).stdout
         return output.split()[1]
     except Exception as e:
         logging.error(f"Error getting ChromeDriver version: {e}")
@@ -191,6 +371,136 @@ def quit_driver(driver):
         logging.error(f"Error quitting Chrome driver: {e}")
 
 
+class ChromeDriverSession:
+    """1回の実行の間、ChromeDriverを使い回すためのセッション管理
+
+    指定ページ数を処理したとき、またはメモリ使用量が上限を超えたときに
+    ブラウザを再起動する。クラッシュを検出した場合も作り直す。
+    """
+
+    def __init__(self, max_pages=200, max_memory_mb=1500, profile='default'):
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.profile = profile
+        self.driver = None
+        self.page_count = 0
+        self.restart_count = 0
+
+    def get_driver(self):
+        if self.driver is None:
+            with get_metrics().span('browser_start'):
+                self.driver = get_chrome_driver(self.profile)
+            self.page_count = 0
+        elif self._needs_recycle():
+            self.restart()
+        return self.driver
+
+    def load(self, url):
+        """URLを開いてドライバーを返す。クラッシュしていた場合は作り直して1回だけ再試行する"""
+        for attempt in range(2):
+            driver = self.get_driver()
+            try:
+                with get_metrics().span('browser_page_load'):
+                    driver.get(url)
+                self.page_count += 1
+                return driver
+            except TimeoutException:
+                raise
+            except WebDriverException as e:
+                if attempt or self._is_alive():
+                    raise
+                logging.warning(f"Chrome driver crashed, restarting: {e}")
+                self.restart()
+
+    def restart(self):
+        self.close()
+        self.restart_count += 1
+        get_metrics().increment('browser_restart')
+        with get_metrics().span('browser_start'):
+            self.driver = get_chrome_driver(self.profile)
+        self.page_count = 0
+
+    def close(self):
+        if self.driver:
+            quit_driver(self.driver)
+        self.driver = None
+
+    def _needs_recycle(self):
+        if self.max_pages and self.page_count >= self.max_pages:
+            logging.info(f"Recycling Chrome driver after {self.page_count} pages")
+            return True
+        if not self._is_alive():
+            logging.warning("Chrome driver is not responding, restarting")
+            return True
+        memory_mb = self._memory_usage_mb()
+        if self.max_memory_mb and memory_mb > self.max_memory_mb:
+            logging.info(f"Recycling Chrome driver (memory usage: {memory_mb:.0f} MB)")
+            return True
+        return False
+
+    def _is_alive(self):
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def _memory_usage_mb(self):
+        # psutilがあればChromeのプロセスツリー全体、なければ現在のページのJSヒープで判断する
+        try:
+            if psutil:
+                process = psutil.Process(self.driver.service.process.pid)
+                processes = [process] + process.children(recursive=True)
+                return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+            used = self.driver.execute_script(
+                "return window.performance.memory ? window.performance.memory.usedJSHeapSize : 0")
+            return (used or 0) / (1024 * 1024)
+        except Exception:
+            return 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ChromeDriverPool:
+    """並列処理用のChromeDriverSessionのプール
+
+    ワーカーごとに空いているセッションを1つ貸し出す。ブラウザはセッションが
+    実際にページを開くまで起動しないため、Seleniumを使わない行ではコストがかからない。
+    """
+
+    def __init__(self, max_pages=200, max_memory_mb=1500, profile='default'):
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.profile = profile
+        self.sessions = []
+        self.idle_sessions = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        with self.lock:
+            if self.idle_sessions:
+                session = self.idle_sessions.pop()
+            else:
+                session = ChromeDriverSession(max_pages=self.max_pages, max_memory_mb=self.max_memory_mb,
+                                              profile=self.profile)
+                self.sessions.append(session)
+        try:
+            yield session
+        finally:
+            with self.lock:
+                self.idle_sessions.append(session)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions:
+                session.close()
+
+
 if __name__ == "__main__":
     driver = get_chrome_driver()
     if driver:
@@ -0,0 +1,231 @@
+"""コマンドラインからのスクレイピング実行（cronなど画面のない環境向け）
+
+使い方:
+    python cli.py "https://docs.google.com/spreadsheets/d/.../edit" --history purchase --start-row 3 --workers 4
+    python cli.py "https://docs.google.com/spreadsheets/d/.../edit" --history both --workers 4
+
+複数のシート（--history both、--sheetの複数指定、複数のスプレッドシートのURL）を指定すると、
+ワーカー・ブラウザ・レート制限を共有して1回の実行でまとめて処理する。
+
+進捗と結果は標準出力に1行1件のJSONで出力し、ログは標準エラー出力（または--log-file）に出す。
+tkinterは読み込まず、Seleniumも送料の取得にブラウザが必要になるまで読み込まない。
+
+終了コード:
+    0   全ての行を処理した
+    1   取得またはシートへの書き込みに失敗した行があった
+    2   引数の誤り
+    3   設定・入力の誤り（シートのURL、'url'タグがない、認証が必要など）
+    4   予期せぬエラー
+    130 中断された（Ctrl+C）
+"""
+import time
+
+# 起動時間の計測の基準（他のモジュールを読み込む前に記録する）
+STARTED_AT = time.perf_counter()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import signal  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+
+from auction_utils import HISTORY_SHEETS  # noqa: E402
+
+EXIT_OK = 0
+EXIT_ROW_FAILURES = 1
+EXIT_USAGE = 2
+EXIT_CONFIG_ERROR = 3
+EXIT_ERROR = 4
+EXIT_INTERRUPTED = 130
+
+# HTMLパーサーの名前（auction_parserを読み込むとbs4・lxmlも読み込まれ起動が遅くなるため、ここに書く。
+# インストールされていないパーサーはrun_jobの最初にエラーになる）
+PARSER_CHOICES = ('auto', 'lxml', 'selectolax', 'html.parser')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ヤフオクの取引ページをスクレイピングしてシートに書き込む")
+    parser.add_argument('spreadsheet_urls', nargs='+', metavar='spreadsheet_url',
+                        help="スプレッドシートのURL（複数指定可）")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--history', choices=sorted(HISTORY_SHEETS) + ['both'], default='purchase',
+                        help="履歴の種類（書き込み先のシートを決める。bothで購入・売却の両方。既定: purchase）")
+    target.add_argument('--sheet', action='append', dest='sheets', help="シート名を直接指定する（複数指定可）")
+    parser.add_argument('--start-row', type=int, default=3, help="開始行（既定: 3）")
+    parser.add_argument('--end-row', type=int, help="終了行（省略時は最終行まで）")
+
+    scraping = parser.add_argument_group("取得")
+    scraping.add_argument('--workers', type=int, default=1, help="同時に処理する行数（既定: 1）")
+    scraping.add_argument('--rps', type=float, default=1.0, help="1秒あたりのリクエスト数の上限（0で無制限）")
+    scraping.add_argument('--no-adaptive', action='store_true',
+                          help="アクセス制限に応じたレート・同時実行数の自動調整を行わない")
+    scraping.add_argument('--parser', default='auto', choices=PARSER_CHOICES, help="HTMLパーサー（既定: auto）")
+    scraping.add_argument('--parse-processes', type=int, default=0,
+                          help="HTMLの解析に使うプロセス数（-1でCPUのコア数、既定: 0でワーカーのスレッド内で解析）")
+    scraping.add_argument('--no-browser', action='store_true', help="送料がHTMLにない場合もChromeを使わない")
+    scraping.add_argument('--force-refresh', action='store_true', help="取得済みの行も含めて全て取得し直す")
+    scraping.add_argument('--no-cache', action='store_true', help="ページキャッシュを使わない")
+    scraping.add_argument('--resume', action='store_true',
+                          help="前回中断した実行の続きから再開する（書き込めなかった結果も書き込む）")
+    scraping.add_argument('--no-journal', action='store_true', help="進捗を実行ジャーナルに記録しない")
+
+    bulk = parser.add_argument_group("一括取得（出品者の終了したオークションの一覧から取得する）")
+    bulk.add_argument('--bulk', action='store_true', help="一覧ページからまとめて取得し、足りない項目だけ詳細ページで補う")
+    bulk.add_argument('--seller', action='append', dest='sellers',
+                      help="対象の出品者ID（複数指定可。省略時はシートのseller_id列から）")
+    bulk.add_argument('--no-append', action='store_true', help="シートにないオークションを末尾に追加しない")
+    bulk.add_argument('--max-listing-pages', type=int, default=20, help="出品者ごとに読む一覧のページ数の上限")
+
+    io = parser.add_argument_group("入出力")
+    io.add_argument('--input-csv', help="シートの代わりにCSVファイルから読み込む")
+    output = io.add_mutually_exclusive_group()
+    output.add_argument('--output-csv', help="シートの代わりにCSVファイルへ追記する")
+    output.add_argument('--output-jsonl', help="シートの代わりにJSON Linesファイルへ追記する")
+    io.add_argument('--flush-rows', type=int, default=50, help="シートにまとめて書き込む行数（既定: 50）")
+    io.add_argument('--flush-interval', type=float, default=10.0, help="シートに書き込む間隔（秒、既定: 10）")
+    io.add_argument('--no-store', action='store_true', help="結果をローカルの取引データベースに保存しない")
+    io.add_argument('--export-summary', action='store_true',
+                    help="実行後に月別・出品者別の集計を「ヤフオク集計」シートに書き出す")
+    io.add_argument('--interactive-auth', action='store_true',
+                    help="保存済みのトークンが使えない場合にブラウザで認証する（既定ではエラーで終了）")
+
+    report = parser.add_argument_group("出力・ログ")
+    report.add_argument('--progress', choices=('json', 'none'), default='json',
+                        help="行ごとの進捗をJSON Linesで標準出力に出すか（既定: json）")
+    report.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+    report.add_argument('--log-file', help="ログの出力先ファイル（省略時は標準エラー出力）")
+    report.add_argument('--metrics-jsonl', help="実行のサマリーを追記するJSON Linesファイル")
+    report.add_argument('--metrics-prometheus', help="Prometheusのtextfile形式で書き出すファイル")
+    return parser
+
+
+# 複数のシートを処理する場合は、シートごとのスレッドから進捗を出力する
+emit_lock = threading.Lock()
+
+
+def emit(event):
+    line = json.dumps(event, ensure_ascii=False) + '\n'
+    with emit_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def build_source_and_sink(args):
+    # シート以外を使う場合だけsinksを読み込む
+    source = sink = None
+    if args.input_csv or args.output_csv or args.output_jsonl:
+        from sinks import CsvSource, CsvSink, JsonlSink
+        if args.input_csv:
+            source = CsvSource(args.input_csv)
+        if args.output_csv:
+            sink = CsvSink(args.output_csv)
+        elif args.output_jsonl:
+            sink = JsonlSink(args.output_jsonl)
+    return source, sink
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # 行番号の確認（画面と同じ条件。argparseの誤りと同じく終了コード2で終了する）
+    if args.start_row < 3:
+        parser.error("開始行は3以上である必要があります（1行目はヘッダー、2行目はタグ）。")
+    if args.end_row is not None and args.end_row < args.start_row:
+        parser.error("終了行は開始行以上である必要があります。")
+    if args.workers < 1:
+        parser.error("--workersは1以上である必要があります。")
+    if args.parse_processes < -1:
+        parser.error("--parse-processesは-1（CPUのコア数）、0（スレッド内で解析）または1以上である必要があります。")
+
+    # 他のモジュールを読み込む前にログの出力先を決める（標準出力は進捗のJSON専用）
+    if args.log_file:
+        log_handler = logging.FileHandler(args.log_file, encoding='utf-8')
+    else:
+        log_handler = logging.StreamHandler(sys.stderr)
+    logging.basicConfig(level=getattr(logging, args.log_level), handlers=[log_handler],
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # 1回目のCtrl+C（SIGINT / SIGTERM）では実行中の行を書き込んでから止め、2回目で強制終了する
+    state = {'interrupted': False}
+
+    def request_stop(signum, frame):
+        if state['interrupted']:
+            raise KeyboardInterrupt
+        state['interrupted'] = True
+        logging.warning("中断を受け付けました。処理中の行を書き込んでから終了します。")
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    if args.sheets:
+        sheet_names = args.sheets
+    elif args.history == 'both':
+        sheet_names = list(HISTORY_SHEETS.values())
+    else:
+        sheet_names = [HISTORY_SHEETS[args.history]]
+    targets = [(spreadsheet_url, sheet_name, args.start_row, args.end_row)
+               for spreadsheet_url in args.spreadsheet_urls for sheet_name in sheet_names]
+    start = time.time()
+    source = sink = None
+    from sheets_auth import SheetsAuthError
+    try:
+        import yahoo_ac_scraper
+        from metrics import record_startup
+        record_startup('cli', time.perf_counter() - STARTED_AT)
+
+        source, sink = build_source_and_sink(args)
+        bulk_options = {}
+        if args.bulk:
+            bulk_options = {'bulk': True, 'seller_ids': args.sellers, 'append': not args.no_append,
+                            'max_pages': args.max_listing_pages}
+        new_count, skipped_count, details = yahoo_ac_scraper.run_job(
+            targets, lambda: not state['interrupted'],
+            force_refresh=args.force_refresh, use_cache=not args.no_cache, resume=args.resume,
+            use_journal=not args.no_journal, interactive_auth=args.interactive_auth,
+            use_store=not args.no_store, export_summary=args.export_summary,
+            metrics_jsonl_path=args.metrics_jsonl, metrics_prometheus_path=args.metrics_prometheus,
+            max_workers=args.workers, requests_per_second=args.rps, adaptive=not args.no_adaptive,
+            parser_backend=args.parser, parse_processes=args.parse_processes,
+            browser_profile=None if args.no_browser else 'scraping',
+            flush_rows=args.flush_rows, flush_interval=args.flush_interval,
+            source=source, sink=sink,
+            on_progress=emit if args.progress == 'json' else None, **bulk_options)
+    except KeyboardInterrupt:
+        emit({'event': 'error', 'error': 'interrupted', 'elapsed': round(time.time() - start, 3)})
+        return EXIT_INTERRUPTED
+    except (ValueError, SheetsAuthError) as e:
+        emit({'event': 'error', 'error': str(e), 'elapsed': round(time.time() - start, 3)})
+        return EXIT_CONFIG_ERROR
+    except Exception as e:
+        emit({'event': 'error', 'error': str(e), 'elapsed': round(time.time() - start, 3)})
+        return EXIT_ERROR
+    finally:
+        if sink is not None:
+            sink.close()
+
+    emit({
+        'event': 'summary',
+        'sheet': ', '.join(sheet_names),
+        'new': new_count,
+        'skipped': skipped_count,
+        'failed': details['failed'],
+        'unwritten': details.get('unwritten', 0),
+        'duplicates_collapsed': details['duplicates_collapsed'],
+        'skip_reasons': details['skip_reasons'],
+        'sheets': details['sheets'],
+        'interrupted': state['interrupted'],
+        'elapsed': round(time.time() - start, 3)
+    })
+    if state['interrupted']:
+        return EXIT_INTERRUPTED
+    if details['failed']:
+        return EXIT_ROW_FAILURES
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    # PyInstallerのonefileでspawnした解析用の子プロセスが、コマンドを実行し直さずに処理を始めるようにする
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import re
+import threading
+from collections import Counter
+
+A1_CELL_PATTERN = re.compile(r'^([A-Za-z]*)(\d*)$')
+
+
+def column_to_index(letters):
+    """列文字（A, B, ..., Z, AA, ...）を0始まりの列番号に変換する"""
+    index = 0
+    for char in letters.upper():
+        index = index * 26 + (ord(char) - 64)
+    return index - 1
+
+
+def parse_a1_range(range_name):
+    """'シート名!B3:D10' 形式の範囲を (シート名, 開始行, 開始列, 終了行, 終了列) に分解する
+
+    行・列は0始まりで、終了は含まない。省略された端はNoneになる。
+    """
+    sheet_name, _, cells = range_name.rpartition('!')
+    sheet_name = sheet_name.strip("'")
+    start, _, end = cells.partition(':')
+    start_col, start_row = A1_CELL_PATTERN.match(start).groups()
+    if ':' in cells:
+        end_col, end_row = A1_CELL_PATTERN.match(end).groups()
+    else:
+        end_col, end_row = start_col, start_row
+    return (
+        sheet_name,
+        int(start_row) - 1 if start_row else 0,
+        column_to_index(start_col) if start_col else 0,
+        int(end_row) if end_row else None,
+        column_to_index(end_col) + 1 if end_col else None
+    )
+
+
+class FakeRequest:
+    def __init__(self, func):
+        self.func = func
+
+    def execute(self, *args, **kwargs):
+        return self.func()
+
+
+class FakeSheetsService:
+    """Sheets API（spreadsheets().values()）をメモリ上で再現するテスト・ベンチマーク用のスタブ
+
+    sheets: {シート名: [[セルの値, ...], ...]} の形式で初期データを渡す。
+    request_counts に呼び出されたAPIごとの回数を記録する。
+    failing_methods にAPIの名前（'batchUpdate' など）を入れると、その呼び出しは例外を送出する（書き込みの失敗の再現用）。
+    """
+
+    def __init__(self, sheets=None):
+        self.sheets = {name: [list(row) for row in rows] for name, rows in (sheets or {}).items()}
+        self.request_counts = Counter()
+        self.failing_methods = set()
+        self.lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range, **kwargs):
+        return FakeRequest(lambda: self._get_values(range))
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        def execute():
+            self._count('batchGet')
+            return {
+                'spreadsheetId': spreadsheetId,
+                'valueRanges': [self._get_values(range_name, 'batchGet') for range_name in ranges]
+            }
+        return FakeRequest(execute)
+
+    def update(self, spreadsheetId, range, body, valueInputOption=None, **kwargs):
+        def execute():
+            self._count('update')
+            self._set_values(range, body.get('values', []))
+            return {'spreadsheetId': spreadsheetId, 'updatedRange': range}
+        return FakeRequest(execute)
+
+    def batchUpdate(self, spreadsheetId, body, **kwargs):
+        def execute():
+            self._count('batchUpdate')
+            for data in body.get('data', []):
+                self._set_values(data['range'], data.get('values', []))
+            return {'spreadsheetId': spreadsheetId, 'totalUpdatedRanges': len(body.get('data', []))}
+        return FakeRequest(execute)
+
+    def clear(self, spreadsheetId, range, body=None, **kwargs):
+        def execute():
+            self._count('clear')
+            self._clear_values(range)
+            return {'spreadsheetId': spreadsheetId, 'clearedRange': range}
+        return FakeRequest(execute)
+
+    def _count(self, method):
+        with self.lock:
+            self.request_counts[method] += 1
+        if method in self.failing_methods:
+            raise RuntimeError(f"{method} failed (FakeSheetsService.failing_methods)")
+
+    def _get_values(self, range_name, method='get'):
+        if method == 'get':
+            self._count(method)
+        sheet_name, start_row, start_col, end_row, end_col = parse_a1_range(range_name)
+        with self.lock:
+            grid = self.sheets.get(sheet_name, [])
+            values = []
+            for row in grid[start_row:end_row]:
+                cells = row[start_col:end_col]
+                # 実際のAPIと同様に末尾の空セル・空行は返さない
+                while cells and cells[-1] == '':
+                    cells = cells[:-1]
+                values.append(list(cells))
+            while values and not values[-1]:
+                values.pop()
+        result = {'range': range_name, 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+    def _set_values(self, range_name, values):
+        sheet_name, start_row, start_col, _, _ = parse_a1_range(range_name)
+        with self.lock:
+            grid = self.sheets.setdefault(sheet_name, [])
+            for row_offset, row_values in enumerate(values):
+                row_index = start_row + row_offset
+                while len(grid) <= row_index:
+                    grid.append([])
+                row = grid[row_index]
+                for col_offset, value in enumerate(row_values):
+                    col_index = start_col + col_offset
+                    while len(row) <= col_index:
+                        row.append('')
+                    row[col_index] = '' if value is None else str(value)
+
+    def _clear_values(self, range_name):
+        sheet_name, start_row, start_col, end_row, end_col = parse_a1_range(range_name)
+        with self.lock:
+            for row in self.sheets.get(sheet_name, [])[start_row:end_row]:
+                for col_index in range(start_col, min(len(row), end_col if end_col is not None else len(row))):
+                    row[col_index] = ''
+
+    def cell(self, sheet_name, row_num, col_index):
+        """1始まりの行番号と0始まりの列番号でセルの値を返す"""
+        with self.lock:
+            grid = self.sheets.get(sheet_name, [])
+            if row_num - 1 < len(grid) and col_index < len(grid[row_num - 1]):
+                return grid[row_num - 1][col_index]
+            return ''
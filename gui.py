@@ -2,16 +2,34 @@ import re
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
-import yahoo_ac_scraper
+from auction_utils import HISTORY_SHEETS
+from progress import ProgressQueue, ProgressTracker
+
+# スクレイパー本体（Selenium・Google APIなど）は読み込みに時間がかかるため、
+# ウィンドウを表示してから別スレッドで読み込む
+
+# 進捗イベントをまとめて画面に反映する間隔（ミリ秒）と、1回に反映するイベント数の上限
+PROGRESS_INTERVAL_MS = 200
+PROGRESS_MAX_EVENTS = 500
+# 行ごとのログに残す行数
+LOG_MAX_LINES = 500
+
+ROW_STATUS_LABELS = {'written': "書き込み", 'unchanged': "変更なし", 'skipped': "スキップ", 'failed': "失敗"}
 
 class YahooAuctionScraperGUI:
     def __init__(self, master):
         self.master = master
         master.title("Yahoo!オークションスクレイパー")
-        master.geometry("600x700")  # ウィンドウサイズを少し大きくしました
+        master.geometry("600x820")  # 進捗とログの表示のため縦に広げています
 
         self.is_scraping = False
+        self.scraper = None
+        self.scraping_thread = None
+        self.progress_queue = ProgressQueue()
+        self.tracker = ProgressTracker()
+        self.log_sheet_names = False
         self.create_widgets()
+        master.after(100, self.preload_scraper)
 
     def create_widgets(self):
         # スプレッドシートURL入力
@@ -37,6 +55,9 @@ class YahooAuctionScraperGUI:
             side="left", padx=5)
         ttk.Radiobutton(self.history_frame, text="売却履歴", variable=self.history_type, value="sale").pack(side="left",
                                                                                                             padx=5)
+        # 購入・売却の両方のシートを1回の実行で処理する
+        ttk.Radiobutton(self.history_frame, text="両方", variable=self.history_type, value="both").pack(
+            side="left", padx=5)
 
         # 行選択フレーム
         self.row_selection_frame = ttk.LabelFrame(self.master, text="処理する行の選択")
@@ -51,6 +72,16 @@ class YahooAuctionScraperGUI:
         self.end_row = ttk.Entry(self.row_selection_frame, width=10)
         self.end_row.grid(row=0, column=3, padx=5, pady=5)
 
+        # 取得済みの行も再取得するかどうか
+        self.force_refresh = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.row_selection_frame, text="取得済みの行も再取得する", variable=self.force_refresh).grid(
+            row=1, column=0, columnspan=4, padx=5, pady=5, sticky="w")
+
+        # 前回中断した実行の続きから再開するかどうか
+        self.resume = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.row_selection_frame, text="前回中断したところから再開する", variable=self.resume).grid(
+            row=2, column=0, columnspan=4, padx=5, pady=5, sticky="w")
+
         # スクレイピング開始ボタン
         self.start_button = ttk.Button(self.master, text="スクレイピング開始", command=self.start_scraping)
         self.start_button.pack(pady=10)
@@ -59,17 +90,54 @@ class YahooAuctionScraperGUI:
         self.stop_button = ttk.Button(self.master, text="処理を中断する", command=self.stop_scraping, state='disabled')
         self.stop_button.pack(pady=10)
 
-        # プログレスバー
+        # プログレスバー（総行数が分かるまでは処理中の表示だけ）
         self.progress = ttk.Progressbar(self.master, length=400, mode='indeterminate')
-        self.progress.pack(pady=20)
+        self.progress.pack(pady=(10, 5))
+
+        # 処理済みの行数・処理速度・残り時間と、状態ごとの件数
+        self.stats_label = ttk.Label(self.master, text="", justify="center")
+        self.stats_label.pack(pady=5)
 
         # ステータス表示
         self.status_label = ttk.Label(self.master, text="")
-        self.status_label.pack(pady=10)
+        self.status_label.pack(pady=5)
+
+        # 行ごとの処理結果のログ（古い行から消し、LOG_MAX_LINES行まで残す）
+        log_frame = ttk.Frame(self.master)
+        log_frame.pack(pady=5)
+        self.log_text = tk.Text(log_frame, height=10, width=58, state='disabled')
+        log_scrollbar = ttk.Scrollbar(log_frame, command=self.log_text.yview)
+        self.log_text.config(yscrollcommand=log_scrollbar.set)
+        self.log_text.pack(side="left")
+        log_scrollbar.pack(side="right", fill="y")
 
         # 結果表示エリア
-        self.result_text = tk.Text(self.master, height=10, width=60)
-        self.result_text.pack(pady=20)
+        self.result_text = tk.Text(self.master, height=7, width=60)
+        self.result_text.pack(pady=10)
+
+    def load_scraper(self):
+        if self.scraper is None:
+            import yahoo_ac_scraper
+            self.scraper = yahoo_ac_scraper
+        return self.scraper
+
+    def preload_scraper(self):
+        self.status_label.config(text="準備しています...")
+
+        def preload():
+            try:
+                self.load_scraper()
+            except Exception as e:
+                # 読み込みに失敗した場合はスクレイピング開始時にもう一度読み込み、エラーを表示する
+                self.master.after(0, self.set_idle_status, f"準備に失敗しました: {str(e)}")
+                return
+            self.master.after(0, self.set_idle_status, "準備ができました")
+
+        threading.Thread(target=preload, daemon=True).start()
+
+    def set_idle_status(self, message):
+        if not self.is_scraping:
+            self.status_label.config(text=message)
 
     def start_scraping(self):
         url = self.spreadsheet_url.get().strip()
@@ -102,11 +170,22 @@ class YahooAuctionScraperGUI:
         self.is_scraping = True
         self.start_button['state'] = 'disabled'
         self.stop_button['state'] = 'normal'
+        self.progress.config(mode='indeterminate', value=0)
         self.progress.start()
         self.status_label.config(text="スクレイピングを開始しています...")
+        self.progress_queue = ProgressQueue()
+        self.tracker = ProgressTracker()
+        # 複数のシートを処理する場合は、ログの行にシート名をつける
+        self.log_sheet_names = self.history_type.get() == 'both'
+        self.stats_label.config(text="")
+        self.log_text.config(state='normal')
+        self.log_text.delete(1.0, tk.END)
+        self.log_text.config(state='disabled')
 
         # スクレイピングを別スレッドで実行
-        threading.Thread(target=self.run_scraping, args=(url, start_row, end_row, self.history_type.get()), daemon=True).start()
+        self.scraping_thread = threading.Thread(target=self.run_scraping, args=(url, start_row, end_row, self.history_type.get(), self.force_refresh.get(), self.resume.get()), daemon=True)
+        self.scraping_thread.start()
+        self.master.after(PROGRESS_INTERVAL_MS, self.poll_progress)
 
     def stop_scraping(self):
         self.is_scraping = False
@@ -119,14 +198,34 @@ class YahooAuctionScraperGUI:
     def zen_to_han(self, text):
         return text.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
 
-    def run_scraping(self, url, start_row, end_row, history_type):
+    def run_scraping(self, url, start_row, end_row, history_type, force_refresh=False, resume=False):
         try:
-            sheet_name = "ヤフオク購入履歴" if history_type == "purchase" else "ヤフオク売却履歴"
-            new_count, skipped_count = yahoo_ac_scraper.main(url, start_row, end_row, sheet_name, lambda: self.is_scraping)
+            if self.scraper is None:
+                self.master.after(0, lambda: self.status_label.config(text="準備しています..."))
+            scraper = self.load_scraper()
+            self.master.after(0, lambda: self.status_label.config(text="スクレイピング中..."))
+            if history_type == 'both':
+                sheet_names = list(HISTORY_SHEETS.values())
+            else:
+                sheet_names = [HISTORY_SHEETS[history_type]]
+            targets = [(url, sheet_name, start_row, end_row) for sheet_name in sheet_names]
+            new_count, skipped_count, details = scraper.run_job(targets, lambda: self.is_scraping, force_refresh,
+                                                                resume=resume, on_progress=self.progress_queue)
 
+            if details.get('unwritten'):
+                # 書き込めなかった結果は実行ジャーナルに残っているため、再開すれば書き込める
+                message = (f"シートに書き込めなかった行が{details['unwritten']}行あります。"
+                           f"「前回中断したところから再開する」で書き込み直してください。")
+            else:
+                message = "スクレイピングが完了しました。"
             if self.is_scraping:
                 self.master.after(0, self.update_result,
-                                  f"新たにスクレイピングしたURL数: {new_count}\nスキップしたURL数: {skipped_count}\n\nスクレイピングが完了しました。")
+                                  f"新たにスクレイピングしたURL数: {new_count}\nスキップしたURL数: {skipped_count}\n"
+                                  f"{self.format_skip_reasons(details['skip_reasons'])}"
+                                  f"失敗したURL数: {details['failed']}\n"
+                                  f"重複をまとめたURL数: {details['duplicates_collapsed']}\n"
+                                  f"{self.format_sheet_counts(details['sheets'])}\n"
+                                  f"{message}")
             else:
                 self.master.after(0, self.update_result, "スクレイピングが中断されました。")
         except Exception as e:
@@ -134,6 +233,91 @@ class YahooAuctionScraperGUI:
         finally:
             self.master.after(0, self.finish_scraping)
 
+    def poll_progress(self):
+        """スクレイピングのスレッドから届いた進捗をまとめて画面に反映する
+
+        行ごとにTkのイベントを送ると、多数のワーカーで速く処理している間に画面が固まるため、
+        PROGRESS_INTERVAL_MSごとにキューに溜まった分を1回で反映する。
+        """
+        events = self.progress_queue.drain(PROGRESS_MAX_EVENTS)
+        if events:
+            log_lines = []
+            for received_at, event in events:
+                self.tracker.update(event, received_at)
+                line = self.format_event(event)
+                if line:
+                    log_lines.append(line)
+            self.append_log(log_lines)
+            self.update_progress()
+        # スレッドが終わっても、キューに残った進捗を反映し終えるまで続ける
+        if events or (self.scraping_thread and self.scraping_thread.is_alive()):
+            self.master.after(PROGRESS_INTERVAL_MS, self.poll_progress)
+
+    def format_event(self, event):
+        if event['event'] == 'start':
+            return f"シート「{event['sheet']}」の処理を開始しました"
+        if event['event'] != 'row':
+            return None
+        line = f"行 {event['row']}: {ROW_STATUS_LABELS.get(event['status'], event['status'])}"
+        if self.log_sheet_names:
+            line = f"{event['sheet']} {line}"
+        if event.get('reason'):
+            line += f"（{self.format_skip_reason(event['reason'])}）"
+        if event['status'] == 'failed':
+            line += f" {event.get('url', '')}"
+        return line
+
+    def append_log(self, lines):
+        if not lines:
+            return
+        self.log_text.config(state='normal')
+        self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > LOG_MAX_LINES:
+            self.log_text.delete(1.0, f"{line_count - LOG_MAX_LINES + 1}.0")
+        self.log_text.config(state='disabled')
+        self.log_text.see(tk.END)
+
+    def update_progress(self):
+        tracker = self.tracker
+        if tracker.total:
+            # 総行数が分かったら、処理済みの割合を表示する
+            if str(self.progress['mode']) != 'determinate':
+                self.progress.stop()
+                self.progress.config(mode='determinate')
+            self.progress.config(maximum=tracker.total, value=min(tracker.done, tracker.total))
+            done_text = f"{tracker.done} / {tracker.total} 行（{tracker.done / tracker.total:.0%}）"
+        else:
+            done_text = f"{tracker.done} 行"
+        eta = tracker.eta()
+        eta_text = f"  残り {self.format_duration(eta)}" if eta is not None else ""
+        counts = tracker.counts
+        self.stats_label.config(
+            text=f"{done_text}  {tracker.rate():.1f} 行/秒{eta_text}\n"
+                 f"書き込み {counts['written']}  変更なし {counts['unchanged']}  "
+                 f"スキップ {counts['skipped']}  失敗 {counts['failed']}")
+
+    def format_duration(self, seconds):
+        seconds = int(seconds)
+        if seconds < 60:
+            return f"約{seconds}秒"
+        if seconds < 3600:
+            return f"約{seconds // 60}分"
+        return f"約{seconds // 3600}時間{seconds % 3600 // 60}分"
+
+    def format_skip_reason(self, reason):
+        return {'empty_url': "URLが空", 'complete': "取得済み", 'ended': "終了済みで取得済み",
+                'resumed': "前回の実行で処理済み", 'write_error': "シートに書き込めませんでした"}.get(reason, reason)
+
+    def format_sheet_counts(self, sheets):
+        if len(sheets) < 2:
+            return ''
+        return ''.join(f"{sheet['sheet']}: 新規 {sheet['new']} / スキップ {sheet['skipped']} / 失敗 {sheet['failed']}\n"
+                       for sheet in sheets)
+
+    def format_skip_reasons(self, skip_reasons):
+        return ''.join(f"  - {self.format_skip_reason(reason)}: {count}\n" for reason, count in skip_reasons.items())
+
     def update_result(self, message):
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, message)
@@ -141,6 +325,8 @@ class YahooAuctionScraperGUI:
     def finish_scraping(self):
         self.is_scraping = False
         self.progress.stop()
+        if str(self.progress['mode']) != 'determinate':
+            self.progress.config(mode='determinate', value=0)
         self.start_button['state'] = 'normal'
         self.stop_button['state'] = 'disabled'
         self.status_label.config(text="処理が完了しました")
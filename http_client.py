@@ -0,0 +1,108 @@
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import get_metrics
+
+try:
+    import brotli  # noqa: F401  urllib3がbr圧縮を展開できるかどうかの確認
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+# (接続タイムアウト, 読み込みタイムアウト) 秒
+DEFAULT_TIMEOUT = (5, 30)
+# リトライ対象のHTTPステータス
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# アクセスが多すぎることを示すHTTPステータス
+THROTTLE_STATUS_CODES = {429, 503}
+
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'ja,en-US;q=0.8,en;q=0.6',
+    'Accept-Encoding': 'gzip, deflate, br' if BROTLI_AVAILABLE else 'gzip, deflate',
+    'Connection': 'keep-alive'
+}
+
+
+class HttpClient:
+    """コネクションプールを共有し、タイムアウトとリトライを備えたHTTPクライアント
+
+    5xx・429・接続エラーの場合は、ジッター付きの指数バックオフで最大max_retries回再試行する。
+    retry_throttled=Falseで呼び出すと、アクセス制限（THROTTLE_STATUS_CODES）の応答は再試行せずにそのまま返す
+    （呼び出し側のレート制限で速度を落として再試行する場合）。
+    requests.Sessionを使うため、同じホストへの接続はKeep-Aliveで再利用される。
+    """
+
+    def __init__(self, pool_size=32, timeout=DEFAULT_TIMEOUT, max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 headers=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_count = 0
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def backoff_delay(self, attempt, response=None):
+        # Retry-Afterが指定されていればそれに従う
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        # フルジッター: 0 〜 base * 2^attempt の間でランダムに待つ
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, url, retry_throttled=True, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"Request to {url} failed ({e}). Retrying in {delay:.1f} seconds...")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                if not retry_throttled and response.status_code in THROTTLE_STATUS_CODES:
+                    return response
+                delay = self.backoff_delay(attempt, response)
+                logging.warning(f"Request to {url} returned {response.status_code}. "
+                                f"Retrying in {delay:.1f} seconds...")
+                response.close()
+            with self.lock:
+                self.retry_count += 1
+            get_metrics().increment('http_retry')
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """プロセス全体で共有する既定のHttpClientを返す"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
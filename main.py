@@ -1,10 +1,27 @@
-import tkinter as tk
-from gui import YahooAuctionScraperGUI
+import time
+
+# 起動時間の計測の基準（他のモジュールを読み込む前に記録する）
+STARTED_AT = time.perf_counter()
+
+import tkinter as tk  # noqa: E402
+from gui import YahooAuctionScraperGUI  # noqa: E402
 
 def main():
     root = tk.Tk()
     app = YahooAuctionScraperGUI(root)
+
+    # ウィンドウが表示されるまでの時間を記録する
+    def on_map(event):
+        if event.widget is root:
+            root.unbind('<Map>')
+            from metrics import record_startup
+            record_startup('gui', time.perf_counter() - STARTED_AT)
+
+    root.bind('<Map>', on_map)
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # PyInstallerのonefileでspawnした解析用の子プロセスが、GUIを起動し直さずに処理を始めるようにする
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()
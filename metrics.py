@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 処理時間のヒストグラムの区切り（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bucket_counts = [0] * len(DURATION_BUCKETS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def quantile(self, ratio):
+        """ヒストグラムから分位点の上限を概算する"""
+        if not self.count:
+            return 0.0
+        target = ratio * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(DURATION_BUCKETS, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return self.max
+
+
+class Metrics:
+    """1回の実行の計測値（処理段階ごとの時間とカウンター）
+
+    処理段階（fetch, parse, browser_start, render, sheet_read, write など）の時間を span で、
+    リトライ・キャッシュヒット・セレクタのフォールバックなどの回数を increment で記録する。
+    ロック1回と加算だけなので、常に有効にしておいてよい。
+    """
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or time.strftime('%Y%m%d-%H%M%S')
+        self.started_at = time.time()
+        self.stages = defaultdict(StageStats)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].add(seconds)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def summary(self):
+        with self.lock:
+            return {
+                'run_id': self.run_id,
+                'started_at': self.started_at,
+                'elapsed': time.time() - self.started_at,
+                'stages': {
+                    stage: {
+                        'count': stats.count,
+                        'total': round(stats.total, 6),
+                        'mean': round(stats.total / stats.count, 6) if stats.count else 0.0,
+                        'p50': stats.quantile(0.5),
+                        'p99': stats.quantile(0.99),
+                        'max': round(stats.max, 6)
+                    }
+                    for stage, stats in self.stages.items()
+                },
+                'counters': dict(self.counters)
+            }
+
+    def log_summary(self):
+        summary = self.summary()
+        logging.info(f"Run {summary['run_id']} finished in {summary['elapsed']:.1f}s")
+        for stage, stats in sorted(summary['stages'].items(), key=lambda item: -item[1]['total']):
+            logging.info(f"  {stage}: {stats['count']} calls, total {stats['total']:.2f}s, "
+                         f"mean {stats['mean'] * 1000:.1f}ms, p50<={stats['p50'] * 1000:.0f}ms, "
+                         f"p99<={stats['p99'] * 1000:.0f}ms")
+        if summary['counters']:
+            logging.info(f"  counters: {summary['counters']}")
+        return summary
+
+    def export_jsonl(self, path):
+        """実行のサマリーをJSON Lines形式で1行追記する"""
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.summary(), ensure_ascii=False) + '\n')
+
+    def export_prometheus(self, path):
+        """Prometheusのテキスト形式（node_exporterのtextfile collector向け）で書き出す"""
+        lines = []
+        with self.lock:
+            lines.append('# TYPE yahooac_stage_seconds histogram')
+            for stage, stats in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(DURATION_BUCKETS, stats.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'yahooac_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'yahooac_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.count}')
+                lines.append(f'yahooac_stage_seconds_sum{{stage="{stage}"}} {stats.total:.6f}')
+                lines.append(f'yahooac_stage_seconds_count{{stage="{stage}"}} {stats.count}')
+            lines.append('# TYPE yahooac_events_total counter')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'yahooac_events_total{{event="{name}"}} {value}')
+            lines.append('# TYPE yahooac_run_started_timestamp_seconds gauge')
+            lines.append(f'yahooac_run_started_timestamp_seconds {self.started_at:.0f}')
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        # 収集側が書きかけのファイルを読まないよう、書き終えてから置き換える
+        os.replace(temp_path, path)
+
+
+_current_metrics = Metrics()
+_current_lock = threading.Lock()
+
+
+def get_metrics():
+    """現在の実行の計測値を返す"""
+    return _current_metrics
+
+
+def start_run(run_id=None):
+    """新しい実行の計測を開始し、そのMetricsを返す"""
+    global _current_metrics
+    with _current_lock:
+        _current_metrics = Metrics(run_id)
+        return _current_metrics
+
+
+def record_startup(kind, seconds, path=None):
+    """起動にかかった時間をログに出し、アプリのデータディレクトリの startup_times.jsonl に追記する
+
+    kindは 'gui'（ウィンドウが表示されるまで）や 'cli'（スクレイピングを始められるまで）。
+    psutilがあれば、インタープリタの起動を含むプロセス開始からの時間も記録する。
+    """
+    record = {'kind': kind, 'time': time.time(), 'seconds': round(seconds, 4)}
+    try:
+        import psutil
+        record['since_process_start'] = round(time.time() - psutil.Process().create_time(), 4)
+    except ImportError:
+        pass
+    logging.info(f"Startup ({kind}) took {seconds:.2f}s")
+    if path is None:
+        from sheets_auth import get_app_data_dir
+        path = os.path.join(get_app_data_dir(), 'startup_times.jsonl')
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        logging.warning(f"Could not record startup time: {e}")
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+from sheets_auth import app_data_dir
+from auction_utils import extract_auction_id, parse_end_date
+
+# キャッシュファイルの既定の場所（token.jsonと同じアプリのデータディレクトリ）
+DEFAULT_CACHE_PATH = os.path.join(app_data_dir, 'page_cache.sqlite3')
+
+
+class PageCache:
+    """取得したオークションページ（圧縮HTML）と解析結果をディスクに保存するキャッシュ
+
+    キーはオークションID（URLから取り出せない場合はURL）。
+    終了済みのオークションは期限なし、開催中のものはlive_ttl秒で期限切れになる。
+    合計サイズがmax_bytesを超えると、最後に使われたのが古い順に削除する。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=500 * 1024 * 1024, live_ttl=600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.live_ttl = live_ttl
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                html BLOB,
+                result TEXT,
+                ended INTEGER NOT NULL DEFAULT 0,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)')
+        self.connection.commit()
+
+    def cache_key(self, url):
+        return extract_auction_id(url) or url
+
+    def get(self, url):
+        """キャッシュされた {'html': str or None, 'result': dict or None} を返す。ない・期限切れならNone"""
+        key = self.cache_key(url)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT html, result, ended, fetched_at FROM pages WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            html, result, ended, fetched_at = row
+            if not ended and time.time() - fetched_at > self.live_ttl:
+                return None
+            self.connection.execute('UPDATE pages SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+        return {
+            'html': zlib.decompress(html).decode('utf-8') if html else None,
+            'result': json.loads(result) if result else None
+        }
+
+    def put_html(self, url, html):
+        compressed = zlib.compress(html.encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            self.connection.execute('''
+                INSERT INTO pages (key, url, html, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET url = excluded.url, html = excluded.html, result = NULL,
+                    ended = 0, fetched_at = excluded.fetched_at, accessed_at = excluded.accessed_at,
+                    size = excluded.size
+            ''', (self.cache_key(url), url, compressed, now, now, len(compressed)))
+            self.connection.commit()
+        self.evict()
+
+    def put_result(self, url, result):
+        # 終了日時を過ぎていれば、以後変わらないので期限なしで保存する
+        end_date = parse_end_date(result.get('transaction_date'))
+        ended = 1 if end_date and end_date <= datetime.now() else 0
+        result_json = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.connection.execute('''
+                INSERT INTO pages (key, url, result, ended, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET result = excluded.result, ended = excluded.ended,
+                    accessed_at = excluded.accessed_at, size = LENGTH(COALESCE(html, '')) + excluded.size
+            ''', (self.cache_key(url), url, result_json, ended, now, now, len(result_json)))
+            self.connection.commit()
+
+    def evict(self):
+        with self.lock:
+            total_size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+            if total_size <= self.max_bytes:
+                return
+            # 上限の9割まで、最後に使われたのが古いものから削除する
+            target_size = self.max_bytes * 0.9
+            rows = self.connection.execute('SELECT key, size FROM pages ORDER BY accessed_at').fetchall()
+            removed_keys = []
+            for key, size in rows:
+                if total_size <= target_size:
+                    break
+                removed_keys.append((key,))
+                total_size -= size
+            self.connection.executemany('DELETE FROM pages WHERE key = ?', removed_keys)
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from auction_parser import parse_auction_html, resolve_backend
+from metrics import get_metrics
+
+
+def parse_page(html, backend='auto'):
+    """子プロセスで1ページを解析し、(解析結果, 解析の開始時刻, 終了時刻, 解析結果のバイト数) を返す
+
+    時刻はプロセスをまたいで比べるためtime.time()で測る。
+    """
+    started = time.time()
+    parsed = parse_auction_html(html, backend)
+    return parsed, started, time.time(), len(pickle.dumps(parsed))
+
+
+def ready(backend='auto', delay=0.05):
+    """子プロセスで解析の準備（モジュールの読み込み）を済ませ、プロセスIDを返す（ParsePool.warm_up用）
+
+    delay秒待ってから返し、起動の早いプロセスが全ての呼び出しを引き受けないようにする。
+    """
+    parse_auction_html('<html></html>', backend)
+    time.sleep(delay)
+    return os.getpid()
+
+
+class ParsePool:
+    """HTMLの解析を別プロセスで行うプール（解析がGILに縛られず、コア数に応じて並列になる）
+
+    ページはバイト列で渡し、戻ってくるのは小さな解析結果の辞書だけにする。
+    受け渡しの負担を測るため、投入から子プロセスで解析が始まるまで（ページの送信と空きプロセスの待ち）を
+    'parse_wait'、子プロセスでの解析を'parse_cpu'、解析結果が親プロセスに戻るまでを'parse_return'、
+    全体を'parse_roundtrip'として記録し、受け渡したバイト数を'parse_bytes_in' / 'parse_bytes_out'に数える。
+    """
+
+    def __init__(self, max_workers=None, backend='auto'):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # 使えないHTMLパーサーは子プロセスでの解析ごとに失敗するため、ここで確認する
+        resolve_backend(backend)
+        self.backend = backend
+        # スレッドを使っている親プロセスをforkしないよう、どの環境でもspawnで起動する
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, html):
+        """HTML（strまたはbytes）の解析を投入し、解析結果の辞書を返すFutureを返す"""
+        if isinstance(html, str):
+            html = html.encode('utf-8')
+        metrics = get_metrics()
+        metrics.increment('parse_bytes_in', len(html))
+        submitted = time.time()
+        parsed_future = Future()
+
+        def on_done(future):
+            # 中断で取り消された場合は、wait()で待っている側に取り消しを知らせるだけにする
+            if not parsed_future.set_running_or_notify_cancel():
+                return
+            try:
+                parsed, started, finished, size = future.result()
+            except BaseException as e:
+                parsed_future.set_exception(e)
+                return
+            returned = time.time()
+            metrics.record('parse_wait', max(0.0, started - submitted))
+            metrics.record('parse_cpu', finished - started)
+            metrics.record('parse_return', max(0.0, returned - finished))
+            metrics.record('parse_roundtrip', returned - submitted)
+            metrics.increment('parse_bytes_out', size)
+            parsed_future.set_result(parsed)
+
+        self.executor.submit(parse_page, html, self.backend).add_done_callback(on_done)
+        return parsed_future
+
+    def warm_up(self, timeout=60.0):
+        """全ての子プロセスを起動し、解析の準備ができるまで待つ。準備ができたプロセスの数を返す
+
+        ProcessPoolExecutorは投入に応じて子プロセスを起動するため、起動と読み込みの時間は最初の解析にかかる。
+        計測（ベンチマーク）から除く場合などに、投入する前に呼ぶ。
+        """
+        pids = set()
+        deadline = time.monotonic() + timeout
+        while len(pids) < self.max_workers and time.monotonic() < deadline:
+            futures = [self.executor.submit(ready, self.backend) for _ in range(self.max_workers)]
+            pids.update(future.result() for future in futures)
+        return len(pids)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,75 @@
+import queue
+import time
+from collections import deque
+
+# 処理速度を求める直近の期間（秒）
+RATE_WINDOW = 10.0
+
+
+class ProgressQueue:
+    """スクレイピングのスレッドから進捗イベントを受け取り、画面のスレッドでまとめて取り出すキュー
+
+    インスタンスをそのままon_progressとして渡せる。処理速度を正しく求められるよう、
+    イベントは受け取った時刻と組にして取り出す。
+    """
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+
+    def __call__(self, event):
+        self.queue.put((time.monotonic(), event))
+
+    def drain(self, max_events=1000):
+        """溜まっている (時刻, イベント) を最大max_events件取り出して返す（待たない）"""
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+
+class ProgressTracker:
+    """進捗イベントから処理済みの行数、状態ごとの件数、処理速度、残り時間を集計する"""
+
+    def __init__(self):
+        self.total = None
+        self.done = 0
+        self.counts = {'written': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+        self.started_at = None
+        # (時刻, 処理済みの行数) の直近の記録
+        self.samples = deque()
+
+    def update(self, event, now=None):
+        now = now or time.monotonic()
+        if event['event'] == 'start':
+            if self.started_at is None:
+                self.started_at = now
+                self.samples.append((now, self.done))
+            if event.get('rows') is not None:
+                self.total = (self.total or 0) + event['rows']
+        elif event['event'] == 'total':
+            # 行数が後から分かった場合（総数が分からないまま始めたシートの分を足す）
+            self.total = (self.total or 0) + event['rows']
+        elif event['event'] == 'row':
+            self.done += 1
+            status = event.get('status')
+            self.counts[status] = self.counts.get(status, 0) + 1
+            self.samples.append((now, self.done))
+            while len(self.samples) > 2 and now - self.samples[0][0] > RATE_WINDOW:
+                self.samples.popleft()
+
+    def rate(self):
+        """直近RATE_WINDOW秒の1秒あたりの処理行数"""
+        if len(self.samples) < 2:
+            return 0.0
+        (first_time, first_done), (last_time, last_done) = self.samples[0], self.samples[-1]
+        return (last_done - first_done) / (last_time - first_time) if last_time > first_time else 0.0
+
+    def eta(self):
+        """残りの行の処理にかかる秒数の見込み。総数か処理速度が分からなければNone"""
+        rate = self.rate()
+        if self.total is None or not rate:
+            return None
+        return max(0, self.total - self.done) / rate
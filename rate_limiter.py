@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（スレッドセーフ）
+
+    rate: 1秒あたりに補充されるトークン数（= 1秒あたりのリクエスト数）
+    capacity: 一度に連続して送れるリクエスト数の上限
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """トークンが貯まるまで待ってから消費する"""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def set_rate(self, rate):
+        with self.lock:
+            # それまでの補充分を古いレートで計算してから切り替える
+            now = time.monotonic()
+            if self.rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.rate = rate
+
+
+class InFlightLimiter:
+    """複数のシート（処理の流れ）で共有する、投入中の処理の数の上限
+
+    上限は同時実行数の調整に合わせて変わるため、try_acquireのたびに渡す。
+    1つの流れには上限を参加中の流れの数で割った数までしか割り当てないため、どの流れも交互に投入できる。
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.members = 0
+        self.condition = threading.Condition()
+
+    def join(self):
+        with self.condition:
+            self.members += 1
+
+    def leave(self):
+        with self.condition:
+            self.members -= 1
+            self.condition.notify_all()
+
+    def try_acquire(self, limit, held):
+        """全体でlimit未満、かつ呼び出し側の投入数heldが割り当て未満なら1つ確保してTrueを返す"""
+        with self.condition:
+            share = -(-limit // max(1, self.members))
+            if self.in_flight >= limit or held >= share:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, count=1):
+        with self.condition:
+            self.in_flight -= count
+            self.condition.notify_all()
+
+    def wait(self, timeout):
+        """他の流れが確保した分を返すまで、最大timeout秒待つ"""
+        with self.condition:
+            self.condition.wait(timeout)
+
+
+class HostRateLimiter:
+    """ホストごとにTokenBucketを持ち、全ワーカーで共有するレート制限
+
+    in_flightは、同じレート制限を使う全てのシートで共有する投入数の上限。
+    """
+
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.in_flight = InFlightLimiter()
+
+    def get_bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.capacity)
+            return self.buckets[host]
+
+    def wait(self, url):
+        self.get_bucket(urlparse(url).netloc).acquire()
+
+
+class ThrottledError(Exception):
+    """サイトからアクセスを制限された（429・503、またはアクセス制限のページ）"""
+
+
+class AdaptiveRateController(HostRateLimiter):
+    """応答に応じてリクエストのレートと同時実行数を調整するレート制限（AIMD）
+
+    制限された応答（ThrottledError）があるとレートと同時実行数をdecrease_factor倍に下げ、
+    問題のない応答が同時実行数の分だけ続くごとにレートをincrease_step、同時実行数を1ずつ上げる。
+    応答がslow_latency秒より遅い場合は上げない。下げた直後のcooldown秒間は、
+    それ以前に送ったリクエストの制限で何度も下げないよう、続けて下げない。
+    rateとconcurrencyは上限でもあり、上げるのは下げた分を戻すときだけ（max_rateで上限を別に指定できる）。
+    rateが0（無制限）で始めた場合は、最初に制限されたときの同時実行数からレートを決める。
+    """
+
+    def __init__(self, rate=1.0, concurrency=1, max_rate=None, min_rate=0.1, max_concurrency=None,
+                 decrease_factor=0.5, increase_step=0.1, cooldown=5.0, slow_latency=5.0):
+        super().__init__(rate, capacity=concurrency)
+        self.max_rate = max_rate or rate or None
+        self.min_rate = min_rate
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency or concurrency
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.cooldown = cooldown
+        self.slow_latency = slow_latency
+        self.clean_streak = 0
+        self.last_decrease = 0.0
+        self.throttled_count = 0
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            buckets = list(self.buckets.values())
+        for bucket in buckets:
+            bucket.set_rate(rate)
+
+    def record(self, latency, throttled=False):
+        """1回の応答の結果を記録し、必要ならレートと同時実行数を変える"""
+        with self.lock:
+            old_rate, old_concurrency = self.rate, self.concurrency
+            now = time.monotonic()
+            if throttled:
+                self.throttled_count += 1
+                self.clean_streak = 0
+                if now - self.last_decrease < self.cooldown:
+                    return
+                self.last_decrease = now
+                base_rate = self.rate or self.concurrency
+                new_rate = max(self.min_rate, base_rate * self.decrease_factor)
+                self.concurrency = max(1, int(self.concurrency * self.decrease_factor))
+            else:
+                if latency > self.slow_latency:
+                    self.clean_streak = 0
+                    return
+                self.clean_streak += 1
+                if self.clean_streak < self.concurrency:
+                    return
+                self.clean_streak = 0
+                new_rate = self.rate + self.increase_step if self.rate else 0
+                if self.max_rate:
+                    new_rate = min(self.max_rate, new_rate)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+        if new_rate != old_rate:
+            self.set_rate(new_rate)
+        if (new_rate, self.concurrency) != (old_rate, old_concurrency):
+            log = logging.warning if throttled else logging.debug
+            log(f"{'Throttled' if throttled else 'Healthy'}: rate {old_rate:.2f} -> {new_rate:.2f} req/s, "
+                f"concurrency {old_concurrency} -> {self.concurrency}")
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from sheets_auth import app_data_dir, extract_spreadsheet_id
+
+# 実行ジャーナルの保存先（シートごとに1ファイル）
+JOURNAL_DIR = os.path.join(app_data_dir, 'journals')
+
+
+class RunJournal:
+    """スクレイピングの進捗を1行1レコードのJSON Linesで記録するジャーナル
+
+    レコードの種類:
+        start    実行の開始（シート・行の範囲）
+        parsed   行の取得・解析が終わった（書き込む結果を含む）
+        written  出力先への書き込みが確定した行
+        skipped  スキップした行
+        failed   取得に失敗した行
+    追記のみで書き換えないため、途中で落ちても最後に書けたレコードまでは残る。
+    parsedのあとにwrittenがない行が「書き込み待ち」で、再開時に書き込み直す。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    @classmethod
+    def for_sheet(cls, spreadsheet_url, sheet_name, journal_dir=JOURNAL_DIR):
+        """スプレッドシートとシート名ごとのジャーナルを返す"""
+        key = f"{extract_spreadsheet_id(spreadsheet_url) or spreadsheet_url}|{sheet_name}"
+        os.makedirs(journal_dir, exist_ok=True)
+        return cls(os.path.join(journal_dir, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.jsonl'))
+
+    def load(self):
+        """前回の実行の状態 {'start': dict or None, 'done': 行番号の集合, 'pending': {行番号: (URL, 結果)}} を返す"""
+        state = {'start': None, 'done': set(), 'pending': {}}
+        if not os.path.exists(self.path):
+            return state
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で落ちた最後の行は読み飛ばす
+                    continue
+                record_type = record.get('type')
+                if record_type == 'start':
+                    state['start'] = record
+                elif record_type == 'parsed':
+                    state['pending'][record['row']] = (record['url'], record['data'])
+                elif record_type == 'written':
+                    for row_num in record['rows']:
+                        state['pending'].pop(row_num, None)
+                        state['done'].add(row_num)
+                elif record_type == 'skipped':
+                    state['done'].add(record['row'])
+                elif record_type == 'failed':
+                    # 失敗した行は再開時に取得し直す
+                    state['pending'].pop(record['row'], None)
+        return state
+
+    def begin(self, resume=False, **fields):
+        """記録を開始する。resumeでなければ前回の記録を破棄する"""
+        with self.lock:
+            self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        self.append({'type': 'start', 'resume': resume, 'time': time.time(), **fields})
+
+    def append(self, record, sync=False):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def record_parsed(self, row_num, url, data):
+        self.append({'type': 'parsed', 'row': row_num, 'url': url, 'data': data})
+
+    def record_written(self, row_nums):
+        # 書き込みの確定は再開時に重複を防ぐ根拠になるので、ディスクまで同期する
+        self.append({'type': 'written', 'rows': sorted(row_nums)}, sync=True)
+
+    def record_skipped(self, row_num, reason):
+        self.append({'type': 'skipped', 'row': row_num, 'reason': reason})
+
+    def record_failed(self, row_num, url):
+        self.append({'type': 'failed', 'row': row_num, 'url': url})
+
+    def close(self, completed=False):
+        """記録を終える。最後まで処理して書き込み待ちがなければジャーナルを削除する"""
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.close()
+            self.file = None
+        if completed:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logging.warning(f"Could not remove run journal {self.path}: {e}")
@@ -0,0 +1,330 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from bs4 import BeautifulSoup
+from auction_parser import PARSER_BACKENDS, SELLER_URL_PREFIX, digits_only, is_block_page, parse_postage_text
+from auction_utils import extract_auction_id, parse_end_date, CANONICAL_AUCTION_URL
+from http_client import get_http_client, THROTTLE_STATUS_CODES
+from metrics import get_metrics
+from rate_limiter import AdaptiveRateController, HostRateLimiter, ThrottledError
+from sheets_auth import extract_spreadsheet_id
+from sinks import SheetsSource, SheetsSink, RESULT_FIELDS
+from yahoo_ac_scraper import scrape_yahoo_auction, get_skip_reason
+
+# 出品者の終了したオークションの一覧（1ページにLISTING_PAGE_SIZE件）
+SELLER_CLOSED_LISTING_URL = ('https://auctions.yahoo.co.jp/closedsearch/closedsearch'
+                             '?seller={seller_id}&b={offset}&n={page_size}')
+LISTING_PAGE_SIZE = 100
+
+# 一覧ページの各商品の要素
+LISTING_ITEM_SELECTOR = 'li.Product'
+LISTING_TITLE_SELECTOR = 'a.Product__titleLink'
+LISTING_PRICE_SELECTOR = 'span.Product__priceValue'
+LISTING_END_DATE_SELECTOR = 'span.Product__time'
+LISTING_POSTAGE_SELECTOR = 'span.Product__postage'
+LISTING_SELLER_SELECTOR = f'a[href^="{SELLER_URL_PREFIX}"]'
+
+WEEKDAYS = '月火水木金土日'
+
+
+def format_end_date(end_date):
+    """詳細ページと同じ表記（例: 2024.03.10（日）22:00）にする"""
+    return f"{end_date:%Y.%m.%d}（{WEEKDAYS[end_date.weekday()]}）{end_date:%H:%M}"
+
+
+def parse_listing_html(html, now=None):
+    """終了したオークションの一覧ページから、商品ごとの結果（一覧にない項目はNone）のリストを返す"""
+    soup = BeautifulSoup(html, 'lxml' if 'lxml' in PARSER_BACKENDS else 'html.parser')
+    items = []
+    for element in soup.select(LISTING_ITEM_SELECTOR):
+        title_link = element.select_one(LISTING_TITLE_SELECTOR)
+        auction_id = extract_auction_id(title_link.get('href')) if title_link else None
+        if not auction_id:
+            continue
+
+        price_element = element.select_one(LISTING_PRICE_SELECTOR)
+        price = digits_only(price_element.get_text()) if price_element else ''
+        end_date_element = element.select_one(LISTING_END_DATE_SELECTOR)
+        end_date_text = end_date_element.get_text(strip=True) if end_date_element else ''
+        end_date = parse_end_date(end_date_text, now)
+        postage_element = element.select_one(LISTING_POSTAGE_SELECTOR)
+        postage_text = postage_element.get_text(strip=True) if postage_element else ''
+        # 解釈できない送料の表記は一覧から取れなかった項目として扱い、詳細ページで補う
+        total_postage = parse_postage_text(postage_text) if postage_text else None
+        seller_link = element.select_one(LISTING_SELLER_SELECTOR)
+
+        items.append({
+            'url': CANONICAL_AUCTION_URL.format(auction_id),
+            'title': title_link.get_text(strip=True) or None,
+            'transaction_id': auction_id,
+            'seller_id': seller_link['href'].split('/seller/')[-1] if seller_link else None,
+            'seller_name': seller_link.get_text(strip=True) if seller_link else None,
+            'transaction_date': format_end_date(end_date) if end_date else (end_date_text or None),
+            'price': price or None,
+            # 一覧の落札価格は税込のため、詳細ページの解析と同じく価格と同じ値にする
+            'tax_included_price': price or None,
+            'total_postage': total_postage,
+            'postage_source': 'listing' if total_postage is not None else None
+        })
+    return items
+
+
+def fetch_listing_page(url, http_client, rate_limiter=None, max_requeues=3):
+    """一覧ページを取得する。アクセスが制限された場合はレート制限に記録し、速度を落としてmax_requeues回まで再試行する"""
+    for attempt in range(max_requeues + 1):
+        if rate_limiter:
+            with get_metrics().span('rate_limit_wait'):
+                rate_limiter.wait(url)
+        started = time.perf_counter()
+        with get_metrics().span('listing_fetch'):
+            response = http_client.get(url, retry_throttled=False)
+        throttled = response.status_code in THROTTLE_STATUS_CODES or (response.ok and is_block_page(response.text))
+        if hasattr(rate_limiter, 'record'):
+            rate_limiter.record(time.perf_counter() - started, throttled)
+        if not throttled:
+            return response
+        get_metrics().increment('throttled')
+        if attempt < max_requeues:
+            logging.warning(f"Access throttled (HTTP {response.status_code}): {url} "
+                            f"(retry {attempt + 1}/{max_requeues})")
+    raise ThrottledError(f"Access throttled (HTTP {response.status_code}): {url}")
+
+
+def iter_seller_listing(seller_id, http_client=None, rate_limiter=None, max_pages=20, page_size=LISTING_PAGE_SIZE,
+                        max_requeues=3):
+    """出品者の終了したオークションの一覧をページ送りし、商品ごとの結果を返すジェネレータ
+
+    アクセス制限が続いて一覧ページを取得できない場合はThrottledErrorを送出する。
+    """
+    http_client = http_client or get_http_client()
+    for page in range(max_pages):
+        url = SELLER_CLOSED_LISTING_URL.format(seller_id=seller_id, offset=page * page_size + 1, page_size=page_size)
+        response = fetch_listing_page(url, http_client, rate_limiter, max_requeues)
+        if not response.ok:
+            logging.warning(f"Could not fetch the closed listing of {seller_id} (page {page + 1}): "
+                            f"HTTP {response.status_code}")
+            return
+        with get_metrics().span('listing_parse'):
+            items = parse_listing_html(response.text)
+        get_metrics().increment('listing_page')
+        logging.info(f"Seller {seller_id}: {len(items)} items on closed listing page {page + 1}")
+        for item in items:
+            item['seller_id'] = item['seller_id'] or seller_id
+            yield item
+        if len(items) < page_size:
+            return
+
+
+def bulk_scraping(service, spreadsheet_url, sheet_name, start_row, end_row, is_scraping, seller_ids=None,
+                  append=True, max_pages=20, max_workers=1, requests_per_second=1.0, source=None, sink=None,
+                  flush_rows=50, flush_interval=10.0, incremental=True, force_refresh=False, cache=None,
+                  http_client=None, parser_backend='auto', browser_profile='scraping', on_progress=None,
+                  adaptive=True, store=None, max_requeues=3):
+    """出品者の終了したオークションの一覧ページから、まとめて結果を取得してシートに書き込む
+
+    seller_idsを省略した場合はシートのseller_id列に出てくる出品者を対象にする。
+    一覧に載っているオークションのうち、シートにある行はその行に、ない行はappendが有効なら末尾に追加する
+    （end_rowを指定した場合は、範囲外の行を上書きしないよう追加しない）。
+    シートの列のうち一覧から取れなかった項目（送料など）がある場合だけ、詳細ページを取得して補う。
+
+    戻り値はsmart_scrapingと同じ (書き込んだ行数, スキップした行数, 詳細)。
+    詳細の'listing_items'に一覧から取得した件数、'detail_fallbacks'に詳細ページを取得した件数、
+    'appended'に追加した行数、'throttled_sellers'にアクセス制限が続いて一覧を最後まで読めなかった出品者が入る。
+    store（TransactionStore）を渡すと、結果を取引データベースにも保存する。
+    """
+    if adaptive:
+        rate_limiter = AdaptiveRateController(rate=requests_per_second, concurrency=max_workers)
+    else:
+        rate_limiter = HostRateLimiter(rate=requests_per_second, capacity=max_workers)
+    http_client = http_client or get_http_client()
+    own_sink = sink is None
+    if source is None:
+        source = SheetsSource(service, spreadsheet_url, sheet_name)
+    if own_sink:
+        sink = SheetsSink(service, spreadsheet_url, sheet_name, flush_rows, flush_interval)
+    # 書き込んだ行数は、出力先への書き込みが確定した時点で数える（'written'の進捗もその時点で送る）
+    persisted_rows = set()
+    persisted_lock = threading.Lock()
+    buffered_urls = {}
+    sink_finished = False
+
+    def on_persisted(row_nums):
+        with persisted_lock:
+            persisted_rows.update(row_nums)
+            urls = [buffered_urls.pop(row_num, None) for row_num in row_nums]
+        for row_num, url in zip(row_nums, urls):
+            report('row', sheet=sheet_name, row=row_num, url=url, status='written')
+
+    def finish_sink():
+        """出力先を閉じる（渡された出力先はフラッシュだけ行う）。書き込めなかった行番号のリストを返す"""
+        nonlocal sink_finished
+        sink_finished = True
+        if own_sink:
+            return sink.close() or []
+        sink.flush()
+        sink.on_persisted = None
+        return sorted(getattr(sink, 'pending', None) or [])
+
+    sink.on_persisted = on_persisted
+
+    def report(event, **fields):
+        if on_progress:
+            on_progress({'event': event, 'sheet': sheet_name, **fields})
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    driver_pool = None
+    if browser_profile is not None:
+        from chrome_driver_setup import ChromeDriverPool
+        driver_pool = ChromeDriverPool(profile=browser_profile)
+
+    def scrape_detail(url):
+        if driver_pool is None:
+            return scrape_yahoo_auction(url, None, rate_limiter, cache, force_refresh, http_client, parser_backend,
+                                        None)
+        with driver_pool.session() as driver_session:
+            return scrape_yahoo_auction(url, driver_session, rate_limiter, cache, force_refresh, http_client,
+                                        parser_backend, browser_profile)
+
+    try:
+        with get_metrics().span('sheet_read'):
+            tags = source.read_tags()
+            rows = source.read_rows(start_row, end_row)
+        if 'url' not in tags:
+            raise ValueError("'url'タグが2行目に見つかりません。")
+        url_index = tags.index('url')
+        output_fields = [field for field in RESULT_FIELDS if field in tags]
+
+        # シートにあるオークション（オークションID -> 行番号）と、取得済みで更新不要な行
+        now = datetime.now()
+        row_by_auction = {}
+        done_rows = set()
+        sellers = list(seller_ids or [])
+        last_row = start_row - 1
+        for row_num, row in enumerate(rows, start=start_row):
+            row_data = row + [''] * (len(tags) - len(row))
+            if any(cell.strip() for cell in row_data):
+                last_row = row_num
+            auction_id = extract_auction_id(row_data[url_index].strip())
+            if not auction_id:
+                continue
+            row_by_auction.setdefault(auction_id, row_num)
+            if incremental and not force_refresh and get_skip_reason(row_data, tags, now):
+                done_rows.add(row_num)
+            if not seller_ids and 'seller_id' in tags:
+                seller_id = row_data[tags.index('seller_id')].strip()
+                if seller_id and seller_id != 'N/A' and seller_id not in sellers:
+                    sellers.append(seller_id)
+        if not sellers:
+            raise ValueError("出品者IDが指定されておらず、シートのseller_id列にもありません。")
+        report('start', sheet=sheet_name, rows=None)
+
+        skipped_count = failed_count = appended = listing_items = 0
+        detail_futures = {}
+        seen = set()
+        throttled_sellers = []
+
+        def write_row(row_num, result):
+            if store:
+                store.upsert(result, sheet_name, result['url'], extract_spreadsheet_id(spreadsheet_url))
+            with persisted_lock:
+                buffered_urls[row_num] = result['url']
+            if not sink.write(row_num, result['url'], tags, result):
+                with persisted_lock:
+                    buffered_urls.pop(row_num, None)
+
+        for seller_id in sellers:
+            try:
+                for item in iter_seller_listing(seller_id, http_client, rate_limiter, max_pages,
+                                                max_requeues=max_requeues):
+                    if not is_scraping():
+                        break
+                    auction_id = item['transaction_id']
+                    if auction_id in seen:
+                        continue
+                    seen.add(auction_id)
+                    listing_items += 1
+
+                    row_num = row_by_auction.get(auction_id)
+                    if row_num is None:
+                        if not append or end_row:
+                            continue
+                        last_row += 1
+                        row_num = last_row
+                        row_by_auction[auction_id] = row_num
+                        appended += 1
+                        result = dict(item)
+                    else:
+                        if row_num in done_rows:
+                            skipped_count += 1
+                            report('row', sheet=sheet_name, row=row_num, status='skipped', reason='complete')
+                            continue
+                        # 既存の行のURLはそのままにする
+                        result = {key: value for key, value in item.items() if key != 'url'}
+                        result['url'] = rows[row_num - start_row][url_index].strip()
+
+                    # 一覧になかった項目だけ詳細ページで補う
+                    if any(result.get(field) is None for field in output_fields):
+                        detail_futures[executor.submit(scrape_detail, item['url'])] = (row_num, result)
+                    else:
+                        write_row(row_num, result)
+            except ThrottledError as e:
+                # アクセス制限が続く出品者は諦め、次の出品者に進む
+                logging.warning(f"{e} (giving up the rest of {seller_id}'s listing)")
+                throttled_sellers.append(seller_id)
+            if not is_scraping():
+                logging.info("スクレイピングが中断されました。")
+                break
+
+        for future in as_completed(detail_futures):
+            if not is_scraping():
+                # 待っている詳細ページの取得（とブラウザでの送料の取得）は行わない
+                logging.info("スクレイピングが中断されました。")
+                for pending in detail_futures:
+                    pending.cancel()
+                break
+            row_num, result = detail_futures[future]
+            try:
+                detail = future.result()
+            except ThrottledError as e:
+                logging.warning(str(e))
+                detail = None
+            if detail:
+                for key, value in detail.items():
+                    if result.get(key) is None:
+                        result[key] = value
+            else:
+                failed_count += 1
+            # 詳細ページが取れなくても、一覧から取れた項目は書き込む
+            write_row(row_num, {key: ('' if value is None else value) for key, value in result.items()})
+        get_metrics().increment('listing_item', listing_items)
+        get_metrics().increment('listing_detail_fallback', len(detail_futures))
+        # 書き込めなかった行は失敗として数える
+        unwritten = finish_sink()
+        failed_count += len(unwritten)
+        for row_num in unwritten:
+            report('row', sheet=sheet_name, row=row_num, url=buffered_urls.get(row_num), status='failed',
+                   reason='write_error')
+        new_count = len(persisted_rows)
+
+        logging.info(f"Bulk scraping completed. Listing items: {listing_items}, written: {new_count}, "
+                     f"appended: {appended}, detail fallbacks: {len(detail_futures)}, failed: {failed_count}")
+        return new_count, skipped_count, {
+            'skip_reasons': {'complete': skipped_count} if skipped_count else {},
+            'failed': failed_count,
+            'unwritten': len(unwritten),
+            'duplicates_collapsed': 0,
+            'listing_items': listing_items,
+            'detail_fallbacks': len(detail_futures),
+            'appended': appended,
+            'throttled': getattr(rate_limiter, 'throttled_count', 0),
+            'throttled_sellers': throttled_sellers,
+            'metrics': get_metrics().summary()
+        }
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if driver_pool:
+            driver_pool.close()
+        if not sink_finished:
+            finish_sink()
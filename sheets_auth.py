@@ -2,12 +2,12 @@ import sys
 import os
 import os.path
 import re
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
 import appdirs
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+
+# googleのライブラリは読み込みに時間がかかるため、認証やクライアントの構築を行う関数の中で読み込む
 
 # スコープの設定
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
@@ -17,12 +17,19 @@ app_name = "ヤフオク売買履歴取得ツール"
 app_author = "YourCompanyName"
 app_data_dir = appdirs.user_data_dir(app_name, app_author)
 
-# ディレクトリが存在しない場合は作成
-os.makedirs(app_data_dir, exist_ok=True)
-
 # token.jsonのフルパスを生成
 token_path = os.path.join(app_data_dir, 'token.json')
 
+# 同梱の静的コピーがない場合に取得したディスカバリードキュメントの保存先
+DISCOVERY_URL = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
+discovery_cache_path = os.path.join(app_data_dir, 'sheets_v4_discovery.json')
+
+
+def get_app_data_dir():
+    """アプリのデータディレクトリを返す。存在しない場合は作成する（書き込む直前に呼ぶ）"""
+    os.makedirs(app_data_dir, exist_ok=True)
+    return app_data_dir
+
 
 def get_client_secret_file():
     if getattr(sys, 'frozen', False):
@@ -35,40 +42,176 @@ def get_client_secret_file():
     return os.path.join(application_path, 'client_secret.json')
 
 
-def get_sheets_service():
-    creds = None
+class SheetsAuthError(Exception):
+    """認証情報が無効で、対話的な再認証もできない場合のエラー"""
+
+
+def load_discovery_document():
+    """Sheets API v4のディスカバリードキュメントを返す
+
+    googleapiclientに同梱の静的コピーを優先し、ない場合（古いバージョンなど）は
+    アプリのデータディレクトリのキャッシュ、それもなければ取得してキャッシュする。
+    """
     try:
-        if os.path.exists(token_path):
+        from googleapiclient.discovery_cache import get_static_doc
+        document = get_static_doc('sheets', 'v4')
+    except ImportError:
+        document = None
+    if document:
+        return document
+
+    if os.path.exists(discovery_cache_path):
+        with open(discovery_cache_path, encoding='utf-8') as f:
+            return f.read()
+
+    import requests
+    response = requests.get(DISCOVERY_URL, timeout=(5, 30))
+    response.raise_for_status()
+    get_app_data_dir()
+    with open(discovery_cache_path, 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    return response.text
+
+
+def save_credentials(creds):
+    get_app_data_dir()
+    with open(token_path, 'w') as token:
+        token.write(creds.to_json())
+
+
+def load_credentials(interactive=True):
+    """保存済みのトークンを読み込み、必要なら更新する。無効な場合はinteractiveならブラウザで認証し直す
+
+    認証のやり直しは1回だけで、失敗した場合はSheetsAuthErrorを送出する。
+    """
+    from google.auth.exceptions import RefreshError
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    creds = None
+    if os.path.exists(token_path):
+        try:
             creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+        except ValueError as e:
+            logging.warning(f"Ignoring unreadable token file: {e}")
 
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                try:
-                    creds.refresh(Request())
-                except Exception:
-                    os.remove(token_path)
-                    return get_sheets_service()  # 再帰的に呼び出して新しい認証を開始
-            else:
-                client_secret_file = get_client_secret_file()
-                flow = InstalledAppFlow.from_client_secrets_file(client_secret_file, SCOPES)
-                creds = flow.run_local_server(port=0)
-
-            with open(token_path, 'w') as token:
-                token.write(creds.to_json())
-
-        return build('sheets', 'v4', credentials=creds)
-
-    except HttpError as error:
-        print(f"An error occurred: {error}")
-        if os.path.exists(token_path):
+    if creds and not creds.valid and creds.refresh_token:
+        try:
+            creds.refresh(Request())
+            save_credentials(creds)
+        except RefreshError as e:
+            logging.warning(f"Could not refresh the access token, re-authentication is required: {e}")
+            creds = None
             os.remove(token_path)
-        return get_sheets_service()  # 再帰的に呼び出して新しい認証を開始
 
+    if creds and creds.valid:
+        return creds
+
+    if not interactive:
+        raise SheetsAuthError("Googleの認証が必要です。GUIまたは--interactive-authで一度認証してください。")
+    try:
+        flow = InstalledAppFlow.from_client_secrets_file(get_client_secret_file(), SCOPES)
+        creds = flow.run_local_server(port=0)
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        if os.path.exists(token_path):
-            os.remove(token_path)
-        return get_sheets_service()  # 再帰的に呼び出して新しい認証を開始
+        raise SheetsAuthError(f"Googleの認証に失敗しました: {e}") from e
+    save_credentials(creds)
+    return creds
+
+
+class SheetsServiceProvider:
+    """プロセス全体で共有するSheets APIのクライアント
+
+    ディスカバリードキュメントの読み込みとクライアントの構築は最初の1回だけ行う。
+    httplib2の接続はスレッドセーフではないため、リクエストはスレッドごとに使い回す
+    認証済みの接続で送る。これにより1つのクライアントを複数のワーカーから同時に使える。
+    アクセストークンは期限切れの REFRESH_MARGIN 秒前に、1つのスレッドだけが更新する。
+    """
+
+    REFRESH_MARGIN = 300
+
+    def __init__(self, interactive=True):
+        self.interactive = interactive
+        self.credentials = None
+        self.service = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def get_service(self):
+        from googleapiclient.discovery import build_from_document
+
+        with self.lock:
+            if self.service is None:
+                self.credentials = load_credentials(self.interactive)
+                self.service = build_from_document(load_discovery_document(), credentials=self.credentials,
+                                                   requestBuilder=self.build_request)
+            return self.service
+
+    def needs_refresh(self):
+        creds = self.credentials
+        if not creds.valid:
+            return True
+        # credentials.expiryはタイムゾーンなしのUTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry is not None and creds.expiry - now < timedelta(seconds=self.REFRESH_MARGIN)
+
+    def ensure_fresh(self):
+        if not self.needs_refresh():
+            return
+        from google.auth.exceptions import RefreshError
+        from google.auth.transport.requests import Request
+
+        with self.lock:
+            # 待っている間に他のスレッドが更新していれば何もしない
+            if not self.needs_refresh():
+                return
+            creds = self.credentials
+            try:
+                creds.refresh(Request())
+            except RefreshError as e:
+                raise SheetsAuthError(f"アクセストークンを更新できませんでした: {e}") from e
+            save_credentials(creds)
+            logging.debug("Refreshed the Sheets access token")
+
+    def thread_http(self):
+        http = getattr(self.local, 'http', None)
+        if http is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=60))
+            self.local.http = http
+        return http
+
+    def build_request(self, http, *args, **kwargs):
+        # googleapiclientが各リクエストを作るときに呼ばれる（共有のhttpの代わりにスレッドごとの接続を使う）
+        from googleapiclient.http import HttpRequest
+
+        self.ensure_fresh()
+        return HttpRequest(self.thread_http(), *args, **kwargs)
+
+
+_service_provider = None
+_service_provider_lock = threading.Lock()
+
+
+def get_sheets_service(interactive=True):
+    """プロセス全体で共有するSheets APIのクライアントを返す（スレッドセーフ）
+
+    interactiveがFalseの場合、保存済みのトークンが使えなければブラウザでの認証を行わずSheetsAuthErrorを送出する。
+    """
+    global _service_provider
+    with _service_provider_lock:
+        if _service_provider is None:
+            _service_provider = SheetsServiceProvider(interactive)
+        provider = _service_provider
+    try:
+        return provider.get_service()
+    except SheetsAuthError:
+        # 次の呼び出しで認証をやり直せるようにする
+        with _service_provider_lock:
+            if _service_provider is provider:
+                _service_provider = None
+        raise
 
 
 def extract_spreadsheet_id(url):
@@ -78,6 +221,16 @@ def extract_spreadsheet_id(url):
     return None
 
 
+def column_letter(index):
+    """0始まりの列番号をA1表記の列文字（A, ..., Z, AA, AB, ...）に変換する"""
+    letters = ''
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
 def write_to_sheet(service, spreadsheet_url, data, range_name):
     spreadsheet_id = extract_spreadsheet_id(spreadsheet_url)
     if not spreadsheet_id:
@@ -90,6 +243,15 @@ def write_to_sheet(service, spreadsheet_url, data, range_name):
     return result
 
 
+def clear_sheet(service, spreadsheet_url, range_name):
+    spreadsheet_id = extract_spreadsheet_id(spreadsheet_url)
+    if not spreadsheet_id:
+        raise ValueError("Invalid spreadsheet URL")
+
+    return service.spreadsheets().values().clear(
+        spreadsheetId=spreadsheet_id, range=range_name, body={}).execute()
+
+
 def read_from_sheet(service, spreadsheet_url, range_name):
     spreadsheet_id = extract_spreadsheet_id(spreadsheet_url)
     if not spreadsheet_id:
@@ -0,0 +1,374 @@
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import get_metrics
+from sheets_auth import extract_spreadsheet_id, read_from_sheet, column_letter
+
+# ファイル出力時の列（スクレイピング結果のキー）
+RESULT_FIELDS = [
+    'title',
+    'transaction_id',
+    'seller_id',
+    'seller_name',
+    'transaction_date',
+    'price',
+    'tax_included_price',
+    'total_postage',
+    'postage_source'
+]
+
+
+class SheetsSource:
+    """Googleスプレッドシートから処理対象の行を読み込む入力元
+
+    iter_rowsは先読みのスレッドからもserviceを使うため、get_sheets_serviceのような
+    スレッドセーフなクライアントを渡すこと。
+    """
+
+    def __init__(self, service, spreadsheet_url, sheet_name):
+        if not extract_spreadsheet_id(spreadsheet_url):
+            raise ValueError("Invalid spreadsheet URL")
+        self.service = service
+        self.spreadsheet_url = spreadsheet_url
+        self.sheet_name = sheet_name
+
+    def read_tags(self):
+        # タグ行（2行目）を取得
+        return read_from_sheet(self.service, self.spreadsheet_url, f'{self.sheet_name}!2:2')[0]
+
+    def read_rows(self, start_row, end_row):
+        range_to_process = f'{self.sheet_name}!{start_row}:{end_row if end_row else ""}'
+        return read_from_sheet(self.service, self.spreadsheet_url, range_to_process)
+
+    def count_rows(self, start_row, col_index):
+        """col_indexの列を読み、start_row行目から最後に値がある行までの行数を返す（進捗の総数用）"""
+        column = column_letter(col_index)
+        values = read_from_sheet(self.service, self.spreadsheet_url,
+                                 f"{self.sheet_name}!{column}{start_row}:{column}")
+        return len(values)
+
+    def fetch_chunk(self, first_row, last_row, tags, column_runs):
+        """first_row〜last_row行目のcolumn_runsの列だけをbatchGetで読み込み、タグ行と同じ長さの行のリストを返す"""
+        ranges = [f"{self.sheet_name}!{column_letter(first_col)}{first_row}:{column_letter(last_col)}{last_row}"
+                  for first_col, last_col in column_runs]
+        with get_metrics().span('sheet_read'):
+            result = self.service.spreadsheets().values().batchGet(
+                spreadsheetId=extract_spreadsheet_id(self.spreadsheet_url), ranges=ranges).execute()
+        rows = [[''] * len(tags) for _ in range(last_row - first_row + 1)]
+        for (first_col, _), value_range in zip(column_runs, result.get('valueRanges', [])):
+            for offset, values in enumerate(value_range.get('values', [])):
+                rows[offset][first_col:first_col + len(values)] = values
+        return rows
+
+    def iter_rows(self, start_row, end_row, tags, columns, chunk_rows=500, key_column='url', on_count=None):
+        """columnsのタグの列だけをchunk_rows行ずつ読み込み、1行ずつ返すジェネレータ
+
+        読み込まない列は空文字になる。現在のページを処理している間に次のページを先読みする。
+        end_rowまで、またはend_rowがNoneならkey_columnの列に最後に値がある行まで読み進める
+        （途中に空行が続いても止まらないよう、最初のページと並行してkey_columnの列だけを最後まで読んで決める）。
+        read_rowsと同じく、最後のデータより後ろの空行は返さない。
+        on_count: key_columnの列を読んで分かった行数を受け取るコールバック（進捗の総数用。end_rowがNoneの場合のみ呼ぶ）
+        """
+        column_runs = []
+        for col_index in sorted({tags.index(tag) for tag in columns if tag in tags}):
+            if column_runs and column_runs[-1][1] == col_index - 1:
+                column_runs[-1][1] = col_index
+            else:
+                column_runs.append([col_index, col_index])
+
+        def fetch(first_row, last_row):
+            chunk_last_row = first_row + chunk_rows - 1
+            if last_row is not None:
+                chunk_last_row = min(chunk_last_row, last_row)
+            return self.fetch_chunk(first_row, chunk_last_row, tags, column_runs)
+
+        prefetcher = ThreadPoolExecutor(max_workers=2)
+        try:
+            last_row = end_row
+            last_row_future = None
+            if not end_row and key_column in tags:
+                last_row_future = prefetcher.submit(self.count_rows, start_row, tags.index(key_column))
+            first_row = start_row
+            next_chunk = prefetcher.submit(fetch, first_row, last_row)
+            # 直前のページ末尾の空行（後ろにデータがあると分かった時点で返す）
+            blank_rows = 0
+            while next_chunk is not None:
+                rows = next_chunk.result()
+                first_row += len(rows)
+                if last_row_future is not None:
+                    row_count = last_row_future.result()
+                    last_row = start_row + row_count - 1
+                    last_row_future = None
+                    if on_count:
+                        on_count(row_count)
+                if last_row is not None:
+                    has_more = first_row <= last_row
+                else:
+                    # 最後の行が分からない場合（key_columnがない）は、全体が空のページで止める
+                    has_more = any(any(row) for row in rows)
+                next_chunk = prefetcher.submit(fetch, first_row, last_row) if has_more else None
+
+                filled = [index for index, row in enumerate(rows) if any(row)]
+                if not filled:
+                    blank_rows += len(rows)
+                    continue
+                for _ in range(blank_rows):
+                    yield [''] * len(tags)
+                yield from rows[:filled[-1] + 1]
+                blank_rows = len(rows) - filled[-1] - 1
+        finally:
+            prefetcher.shutdown(wait=True, cancel_futures=True)
+
+
+class CsvSource:
+    """シートと同じレイアウト（1行目: ヘッダー、2行目: タグ）のCSVファイルから読み込む入力元"""
+
+    def __init__(self, path, encoding='utf-8-sig'):
+        self.path = path
+        self.encoding = encoding
+
+    def read_all(self):
+        with open(self.path, newline='', encoding=self.encoding) as f:
+            return list(csv.reader(f))
+
+    def read_tags(self):
+        return self.read_all()[1]
+
+    def read_rows(self, start_row, end_row):
+        return self.read_all()[start_row - 1:end_row if end_row else None]
+
+    def count_rows(self, start_row, col_index):
+        """start_row行目から、col_indexの列に最後に値がある行までの行数を返す"""
+        last_row = start_row - 1
+        with open(self.path, newline='', encoding=self.encoding) as f:
+            for row_num, row in enumerate(csv.reader(f), start=1):
+                if row_num >= start_row and len(row) > col_index and row[col_index].strip():
+                    last_row = row_num
+        return last_row - start_row + 1
+
+    def iter_rows(self, start_row, end_row, tags, columns, chunk_rows=500, key_column='url', on_count=None):
+        """ファイルを先頭から読み進め、start_row行目以降を1行ずつ返す（全体をメモリに載せない）"""
+        if not end_row and on_count and key_column in tags:
+            on_count(self.count_rows(start_row, tags.index(key_column)))
+        with open(self.path, newline='', encoding=self.encoding) as f:
+            for row_num, row in enumerate(csv.reader(f), start=1):
+                if end_row and row_num > end_row:
+                    break
+                if row_num >= start_row:
+                    yield row
+
+
+class SheetsSink:
+    """スクレイピング結果をGoogleスプレッドシートの該当行に書き込む出力先
+
+    結果はバッファに溜めておき、連続する行・列をまとめた範囲にして
+    flush_rows行ごと、またはflush_interval秒ごとに少数のbatchUpdateで書き込む。
+    書き込みが確定した行はon_persistedに知らせる（writeがTrueを返した時点ではまだ書き込まれていない）。
+    """
+
+    def __init__(self, service, spreadsheet_url, sheet_name, flush_rows=50, flush_interval=10.0,
+                 max_ranges_per_request=500):
+        self.spreadsheet_id = extract_spreadsheet_id(spreadsheet_url)
+        if not self.spreadsheet_id:
+            raise ValueError("Invalid spreadsheet URL")
+        self.service = service
+        self.sheet_name = sheet_name
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_ranges_per_request = max_ranges_per_request
+        # 書き込み待ちのセル（行番号 -> {列番号: 値}）
+        self.pending = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        # 書き込みが確定した行番号のリストを受け取るコールバック（書き込んだ行数の集計・実行ジャーナル用）
+        self.on_persisted = None
+        # 次の行が来なくてもflush_interval秒ごとに書き込むタイマーのスレッド（最初のwriteで起動する）
+        self.timer = None
+        self.stopped = threading.Event()
+
+    def start_timer(self):
+        def run():
+            while not self.stopped.wait(self.flush_interval):
+                with self.lock:
+                    due = self.pending and time.monotonic() - self.last_flush >= self.flush_interval
+                if due:
+                    self.flush()
+
+        self.timer = threading.Thread(target=run, daemon=True)
+        self.timer.start()
+
+    def write(self, row_num, url, tags, scraped_data):
+        """1行分の結果をバッファに追加する。書き込む列があればTrueを返す"""
+        # 更新が必要な列だけを特定する
+        cells = {}
+        for tag, value in scraped_data.items():
+            if tag in tags:
+                cells[tags.index(tag)] = value
+
+        if not cells:
+            return False
+
+        with self.lock:
+            self.pending.setdefault(row_num, {}).update(cells)
+            should_flush = (len(self.pending) >= self.flush_rows
+                            or time.monotonic() - self.last_flush >= self.flush_interval)
+            if self.timer is None and self.flush_interval and not self.stopped.is_set():
+                self.start_timer()
+        if should_flush:
+            self.flush()
+        return True
+
+    def build_updates(self, pending):
+        """書き込み待ちのセルを、連続する行・列ごとの矩形範囲にまとめる"""
+        blocks = []
+        for row_num in sorted(pending):
+            cells = pending[row_num]
+            # 行内で連続する列をまとめる
+            runs = []
+            for col_index in sorted(cells):
+                if runs and runs[-1][-1] == col_index - 1:
+                    runs[-1].append(col_index)
+                else:
+                    runs.append([col_index])
+            signature = [(run[0], run[-1]) for run in runs]
+            values = [[cells[col_index] for col_index in run] for run in runs]
+
+            # 直前の行と同じ列構成なら同じブロックに追加する
+            if blocks and blocks[-1]['end_row'] == row_num - 1 and blocks[-1]['signature'] == signature:
+                blocks[-1]['end_row'] = row_num
+                for run_values, new_values in zip(blocks[-1]['values'], values):
+                    run_values.append(new_values)
+            else:
+                blocks.append({
+                    'start_row': row_num,
+                    'end_row': row_num,
+                    'signature': signature,
+                    'values': [[run_values] for run_values in values]
+                })
+
+        updates = []
+        for block in blocks:
+            for (start_col, end_col), run_values in zip(block['signature'], block['values']):
+                range_name = (f"{self.sheet_name}!{column_letter(start_col)}{block['start_row']}:"
+                              f"{column_letter(end_col)}{block['end_row']}")
+                updates.append({
+                    'range': range_name,
+                    'values': run_values
+                })
+        return updates
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+
+        updates = self.build_updates(pending)
+        for start in range(0, len(updates), self.max_ranges_per_request):
+            chunk = updates[start:start + self.max_ranges_per_request]
+            # バッチ更新を実行
+            try:
+                body = {
+                    'valueInputOption': 'USER_ENTERED',
+                    'data': chunk
+                }
+                with get_metrics().span('write'):
+                    self.service.spreadsheets().values().batchUpdate(
+                        spreadsheetId=self.spreadsheet_id,
+                        body=body
+                    ).execute()
+                get_metrics().increment('sheets_batch_update')
+                logging.info(f"Successfully updated {len(pending)} rows in {len(chunk)} ranges")
+                logging.debug(f"Updated ranges: {[update['range'] for update in chunk]}")
+            except Exception as e:
+                logging.error(f"Error updating rows {min(pending)}-{max(pending)}: {str(e)}")
+                # 書き込めなかった行はバッファに戻し、次回のflushで再試行する
+                self.requeue(pending)
+                return
+        if self.on_persisted:
+            self.on_persisted(list(pending))
+
+    def requeue(self, pending):
+        with self.lock:
+            for row_num, cells in pending.items():
+                merged = dict(cells)
+                merged.update(self.pending.get(row_num, {}))
+                self.pending[row_num] = merged
+
+    def close(self):
+        """残りを書き込んでタイマーを止め、書き込めなかった行番号のリストを返す"""
+        self.stopped.set()
+        if self.timer is not None:
+            self.timer.join()
+        self.flush()
+        with self.lock:
+            unwritten = sorted(self.pending)
+        if unwritten:
+            logging.error(f"{len(unwritten)} rows could not be written to the sheet: {unwritten}")
+        return unwritten
+
+
+class CsvSink:
+    """結果を1行ずつCSVファイルに追記する出力先"""
+
+    def __init__(self, path, fields=None, encoding='utf-8-sig'):
+        self.fieldnames = ['row', 'url'] + (fields or RESULT_FIELDS)
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='', encoding=encoding)
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+        self.lock = threading.Lock()
+        self.on_persisted = None
+        if write_header:
+            self.writer.writeheader()
+
+    def write(self, row_num, url, tags, scraped_data):
+        with self.lock:
+            self.writer.writerow({'row': row_num, 'url': url, **scraped_data})
+            self.file.flush()
+        if self.on_persisted:
+            self.on_persisted([row_num])
+        return True
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        # 1行ずつ書き込んでいるため、書き込めずに残る行はない
+        with self.lock:
+            self.file.close()
+        return []
+
+
+class JsonlSink:
+    """結果を1行1レコードのJSON Lines形式で追記する出力先"""
+
+    def __init__(self, path, encoding='utf-8'):
+        self.file = open(path, 'a', encoding=encoding)
+        self.lock = threading.Lock()
+        self.on_persisted = None
+
+    def write(self, row_num, url, tags, scraped_data):
+        record = {'row': row_num, 'url': url, **scraped_data}
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+        if self.on_persisted:
+            self.on_persisted([row_num])
+        return True
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        # 1行ずつ書き込んでいるため、書き込めずに残る行はない
+        with self.lock:
+            self.file.close()
+        return []
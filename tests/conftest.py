@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'benchmarks', 'corpus')
+
+
+def load_corpus():
+    pages = []
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith('.html'):
+            with open(os.path.join(CORPUS_DIR, name), 'rb') as f:
+                pages.append(f.read())
+    return pages
+
+
+def listing_html(items):
+    """出品者の終了したオークションの一覧ページ（items: (オークションID, 価格, 終了日時, 送料の表記) のリスト）"""
+    elements = []
+    for auction_id, price, end_date, postage in items:
+        postage_element = f'<span class="Product__postage">{postage}</span>' if postage else ''
+        elements.append(
+            f'<li class="Product"><a class="Product__titleLink" '
+            f'href="https://page.auctions.yahoo.co.jp/jp/auction/{auction_id}">商品{auction_id}</a>'
+            f'<span class="Product__priceValue">{price:,}円</span><span class="Product__time">{end_date}</span>'
+            f'{postage_element}<a href="https://auctions.yahoo.co.jp/seller/sellerA">出品者A</a></li>')
+    return f'<html><body><ul>{"".join(elements)}</ul></body></html>'.encode('utf-8')
+
+
+class CorpusServer:
+    """benchmarks/corpus のページを返すローカルのHTTPサーバー
+
+    /jp/auction/b<番号> には corpus のページを順番に、/closedsearch?seller=...&b=...&n=... には
+    listings[出品者ID] の商品の一覧ページを返す。
+    throttle_next に数を入れると、その回数だけ429を返す（アクセス制限の再現用）。
+    errors に (ステータス, ヘッダーの辞書) を入れると、先頭から順にその応答を返す（リトライの確認用）。
+    latency 秒待ってから返し、同時に処理していたリクエストの最大数を max_active に記録する。
+    """
+
+    def __init__(self):
+        self.pages = load_corpus()
+        self.listings = {}
+        self.paths = []
+        self.throttle_next = 0
+        self.errors = []
+        self.latency = 0.0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        handler = self.build_handler()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def url(self, path):
+        return self.base_url + path
+
+    def auction_url(self, index):
+        return self.url(f'/jp/auction/b{index}')
+
+    def respond(self, path):
+        with self.lock:
+            self.paths.append(path)
+            if self.errors:
+                status, headers = self.errors.pop(0)
+                return status, b'', headers
+            if self.throttle_next:
+                self.throttle_next -= 1
+                return 429, b'', {}
+        if self.latency:
+            with self.lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            time.sleep(self.latency)
+            with self.lock:
+                self.active -= 1
+        parsed = urlparse(path)
+        match = re.search(r'/auction/b(\d+)', parsed.path)
+        if match:
+            return 200, self.pages[int(match.group(1)) % len(self.pages)], {}
+        if parsed.path == '/closedsearch':
+            query = parse_qs(parsed.query)
+            offset, page_size = int(query['b'][0]), int(query['n'][0])
+            items = self.listings.get(query['seller'][0], [])
+            return 200, listing_html(items[offset - 1:offset - 1 + page_size]), {}
+        return 404, b'', {}
+
+    def build_handler(self):
+        corpus_server = self
+
+        class CorpusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body, headers = corpus_server.respond(self.path)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return CorpusHandler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def corpus_server():
+    server = CorpusServer()
+    yield server
+    server.close()
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from auction_parser import PARSER_BACKENDS, parse_auction_html, parse_postage_text
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'benchmarks', 'corpus')
+
+
+def read_corpus(name):
+    with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_parse_postage_text():
+    assert parse_postage_text('1,200円') == '1200'
+    assert parse_postage_text('着払い') == '着払い'
+    assert parse_postage_text('落札者負担') == '着払い'
+    assert parse_postage_text('送料無料') == '0'
+    assert parse_postage_text('読み込み中') is None
+
+
+@pytest.mark.parametrize('backend', sorted(PARSER_BACKENDS))
+@pytest.mark.parametrize('name, total_postage, postage_source', [
+    ('static_postage_1.html', '1200', 'static_html'),
+    ('static_postage_2.html', '着払い', 'static_html'),
+    ('page_data_postage.html', '1100', 'page_data'),
+    ('no_postage_1.html', None, None),
+])
+def test_postage_from_static_html(backend, name, total_postage, postage_source):
+    result = parse_auction_html(read_corpus(name), backend)
+    assert (result['total_postage'], result['postage_source']) == (total_postage, postage_source)
+
+
+@pytest.mark.parametrize('backend', sorted(PARSER_BACKENDS))
+def test_unparseable_postage_text_falls_back_to_browser(backend):
+    # 読み込み中の仮の表示などは送料として使わず、Chromeで取り直す（Noneを返す）
+    html = read_corpus('static_postage_1.html').replace('1,200円', '読み込み中…')
+    result = parse_auction_html(html, backend)
+    assert (result['total_postage'], result['postage_source']) == (None, None)
@@ -0,0 +1,99 @@
+import json
+import signal
+
+import pytest
+
+import cli
+import yahoo_ac_scraper
+from fake_sheets import FakeSheetsService
+from sheets_auth import SheetsAuthError
+from sinks import RESULT_FIELDS
+
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url'] + RESULT_FIELDS
+OPTIONS = ['--sheet', 'S', '--rps', '0', '--no-browser', '--no-cache', '--no-journal', '--no-store']
+
+
+@pytest.fixture(autouse=True)
+def signal_handlers(monkeypatch):
+    """mainが登録するSIGINT・SIGTERMのハンドラー（テスト中はpytestのハンドラーを置き換えない）"""
+    handlers = {}
+    monkeypatch.setattr(cli.signal, 'signal', handlers.__setitem__)
+    return handlers
+
+
+def events(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def use_sheet(monkeypatch, urls):
+    service = FakeSheetsService({'S': [['ヘッダー'] * len(TAGS), list(TAGS)] + [[url] for url in urls]})
+    monkeypatch.setattr(yahoo_ac_scraper, 'get_sheets_service', lambda interactive_auth=True: service)
+    return service
+
+
+@pytest.mark.parametrize('arguments', [
+    ['--start-row', '2'],
+    ['--start-row', '5', '--end-row', '4'],
+    ['--workers', '0'],
+    ['--parse-processes', '-2'],
+    ['--history', 'unknown'],
+])
+def test_invalid_arguments_exit_with_usage_error(arguments):
+    with pytest.raises(SystemExit) as exc_info:
+        cli.main([SPREADSHEET_URL] + arguments)
+    assert exc_info.value.code == cli.EXIT_USAGE
+
+
+def test_successful_run_exits_ok(monkeypatch, capsys, corpus_server):
+    service = use_sheet(monkeypatch, [corpus_server.auction_url(index) for index in range(3, 6)])
+    assert cli.main([SPREADSHEET_URL, '--workers', '2'] + OPTIONS) == cli.EXIT_OK
+    summary = events(capsys)[-1]
+    assert (summary['event'], summary['new'], summary['failed'], summary['interrupted']) == ('summary', 3, 0, False)
+    assert service.cell('S', 3, TAGS.index('title'))
+
+
+def test_failed_rows_exit_with_row_failures(monkeypatch, capsys, corpus_server):
+    use_sheet(monkeypatch, [corpus_server.auction_url(3), corpus_server.url('/missing')])
+    assert cli.main([SPREADSHEET_URL] + OPTIONS) == cli.EXIT_ROW_FAILURES
+    assert events(capsys)[-1]['failed'] == 1
+
+
+def test_authentication_error_exits_with_config_error(monkeypatch, capsys):
+    def get_sheets_service(interactive_auth=True):
+        assert not interactive_auth
+        raise SheetsAuthError("保存済みのトークンがありません")
+
+    monkeypatch.setattr(yahoo_ac_scraper, 'get_sheets_service', get_sheets_service)
+    assert cli.main([SPREADSHEET_URL] + OPTIONS) == cli.EXIT_CONFIG_ERROR
+    event = events(capsys)[-1]
+    assert (event['event'], event['error']) == ('error', "保存済みのトークンがありません")
+
+
+def test_invalid_spreadsheet_url_exits_with_config_error(monkeypatch, capsys):
+    use_sheet(monkeypatch, [])
+    assert cli.main(['https://example.com/not-a-sheet'] + OPTIONS) == cli.EXIT_CONFIG_ERROR
+    assert events(capsys)[-1]['event'] == 'error'
+
+
+def test_interrupted_run_exits_130(monkeypatch, capsys, signal_handlers):
+    def run_job(targets, is_scraping, **options):
+        # 1回目のCtrl+Cでは処理中の行を書き込んでから止める
+        signal_handlers[signal.SIGINT](signal.SIGINT, None)
+        assert not is_scraping()
+        return 1, 0, {'failed': 0, 'duplicates_collapsed': 0, 'skip_reasons': {}, 'sheets': []}
+
+    monkeypatch.setattr(yahoo_ac_scraper, 'run_job', run_job)
+    assert cli.main([SPREADSHEET_URL] + OPTIONS) == cli.EXIT_INTERRUPTED
+    assert events(capsys)[-1]['interrupted'] is True
+
+
+def test_second_interrupt_exits_130_immediately(monkeypatch, capsys, signal_handlers):
+    def run_job(targets, is_scraping, **options):
+        signal_handlers[signal.SIGINT](signal.SIGINT, None)
+        # 2回目はKeyboardInterruptで処理を打ち切る
+        signal_handlers[signal.SIGTERM](signal.SIGTERM, None)
+
+    monkeypatch.setattr(yahoo_ac_scraper, 'run_job', run_job)
+    assert cli.main([SPREADSHEET_URL] + OPTIONS) == cli.EXIT_INTERRUPTED
+    assert events(capsys)[-1]['error'] == 'interrupted'
@@ -0,0 +1,67 @@
+import socket
+import time
+
+import pytest
+import requests
+
+from http_client import HttpClient
+
+
+def test_retries_server_errors_until_success(corpus_server):
+    corpus_server.errors = [(500, {}), (503, {})]
+    client = HttpClient(max_retries=3, backoff_base=0.01)
+    response = client.get(corpus_server.auction_url(0))
+    assert response.status_code == 200
+    assert client.retry_count == 2
+    assert len(corpus_server.paths) == 3
+
+
+def test_returns_the_last_response_after_max_retries(corpus_server):
+    corpus_server.errors = [(502, {})] * 3
+    client = HttpClient(max_retries=2, backoff_base=0.01)
+    assert client.get(corpus_server.auction_url(0)).status_code == 502
+    assert len(corpus_server.paths) == 3
+
+
+def test_does_not_retry_client_errors(corpus_server):
+    client = HttpClient(max_retries=3, backoff_base=0.01)
+    assert client.get(corpus_server.url('/missing')).status_code == 404
+    assert client.retry_count == 0
+
+
+def test_waits_for_retry_after(corpus_server):
+    corpus_server.errors = [(429, {'Retry-After': '1'})]
+    client = HttpClient(max_retries=1, backoff_base=0.01)
+    started = time.monotonic()
+    assert client.get(corpus_server.auction_url(0)).status_code == 200
+    assert time.monotonic() - started >= 1.0
+
+
+def test_retry_after_is_capped_by_backoff_max():
+    client = HttpClient(backoff_base=1.0, backoff_max=2.0)
+    response = requests.Response()
+    response.headers['Retry-After'] = '120'
+    assert client.backoff_delay(0, response) == 2.0
+    # Retry-Afterがなければ 0 〜 base * 2^attempt（backoff_maxまで）
+    assert all(0 <= client.backoff_delay(attempt) <= min(2.0, 2 ** attempt) for attempt in range(5))
+
+
+def test_throttled_response_is_returned_without_retry_when_asked(corpus_server):
+    corpus_server.throttle_next = 1
+    client = HttpClient(max_retries=3, backoff_base=0.01)
+    assert client.get(corpus_server.auction_url(0), retry_throttled=False).status_code == 429
+    # サーバーエラーは retry_throttled=False でも再試行する
+    corpus_server.errors = [(500, {})]
+    assert client.get(corpus_server.auction_url(0), retry_throttled=False).status_code == 200
+    assert client.retry_count == 1
+
+
+def test_connection_errors_are_retried_then_raised():
+    # 使われていないポート
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    client = HttpClient(max_retries=2, backoff_base=0.01, timeout=1)
+    with pytest.raises(requests.ConnectionError):
+        client.get(f'http://127.0.0.1:{port}/')
+    assert client.retry_count == 2
@@ -0,0 +1,70 @@
+import pytest
+
+import yahoo_ac_scraper
+from fake_sheets import FakeSheetsService
+from http_client import HttpClient
+from page_cache import PageCache
+from sinks import RESULT_FIELDS
+
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url'] + RESULT_FIELDS
+AUCTION_URL = 'https://page.auctions.yahoo.co.jp/jp/auction/x1'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    page_cache = PageCache(str(tmp_path / 'page_cache.sqlite3'), live_ttl=60)
+    yield page_cache
+    page_cache.close()
+
+
+def test_entries_are_keyed_by_auction_id(cache):
+    cache.put_html(AUCTION_URL, '<html>x1</html>')
+    cached = cache.get('https://auctions.yahoo.co.jp/jp/auction/x1?ref=top')
+    assert cached == {'html': '<html>x1</html>', 'result': None}
+    assert cache.get('https://page.auctions.yahoo.co.jp/jp/auction/x2') is None
+
+
+def test_live_auctions_expire_but_ended_ones_do_not(cache):
+    cache.put_html(AUCTION_URL, '<html>x1</html>')
+    cache.put_result(AUCTION_URL, {'transaction_date': '2099.01.01（木）22:00', 'title': '開催中'})
+    ended_url = 'https://page.auctions.yahoo.co.jp/jp/auction/x2'
+    cache.put_result(ended_url, {'transaction_date': '2024.03.10（日）22:00', 'title': '終了済み'})
+    # 取得してからlive_ttl秒より後にする
+    cache.connection.execute('UPDATE pages SET fetched_at = fetched_at - 120')
+    cache.connection.commit()
+    assert cache.get(AUCTION_URL) is None
+    assert cache.get(ended_url)['result']['title'] == '終了済み'
+
+
+def test_least_recently_used_pages_are_evicted(tmp_path):
+    cache = PageCache(str(tmp_path / 'page_cache.sqlite3'), max_bytes=250)
+    # 圧縮しにくい100バイト前後のページ
+    pages = {key: ''.join(chr(0x3040 + (index * 7 + ord(key)) % 80) for index in range(40)) for key in 'abc'}
+    cache.put_html('https://example.com/a', pages['a'])
+    cache.put_html('https://example.com/b', pages['b'])
+    # aを使ってからcを入れると、最後に使われたのが古いbが消える
+    assert cache.get('https://example.com/a')
+    cache.put_html('https://example.com/c', pages['c'])
+    assert cache.get('https://example.com/b') is None
+    assert cache.get('https://example.com/a')['html'] == pages['a']
+    assert cache.get('https://example.com/c')['html'] == pages['c']
+    cache.close()
+
+
+def test_second_run_is_served_from_the_cache(cache, corpus_server):
+    urls = [corpus_server.auction_url(index) for index in range(3, 6)]
+
+    def scrape():
+        service = FakeSheetsService({'S': [['ヘッダー'] * len(TAGS), list(TAGS)] + [[url] for url in urls]})
+        new_count, skipped_count, details = yahoo_ac_scraper.smart_scraping(
+            service, SPREADSHEET_URL, 'S', 3, None, lambda: True, requests_per_second=0, cache=cache,
+            http_client=HttpClient(max_retries=0), browser_profile=None)
+        assert new_count == 3
+        return service
+
+    first = scrape()
+    assert len(corpus_server.paths) == 3
+    second = scrape()
+    assert len(corpus_server.paths) == 3
+    assert second.sheets['S'] == first.sheets['S']
@@ -0,0 +1,46 @@
+from concurrent.futures import wait
+
+import pytest
+
+from auction_parser import parse_auction_html
+from metrics import start_run
+from parse_pool import ParsePool, ready
+from tests.conftest import load_corpus
+
+
+@pytest.fixture(scope='module')
+def parse_pool():
+    pool = ParsePool(2)
+    yield pool
+    pool.close()
+
+
+def test_warm_up_starts_every_process(parse_pool):
+    assert parse_pool.warm_up() == 2
+
+
+def test_results_match_parsing_in_process(parse_pool):
+    metrics = start_run()
+    pages = load_corpus()
+    futures = [parse_pool.submit(page) for page in pages]
+    # strで渡しても同じ結果になる
+    futures.append(parse_pool.submit(pages[0].decode('utf-8')))
+    assert [future.result(timeout=60) for future in futures] == \
+        [parse_auction_html(page) for page in pages] + [parse_auction_html(pages[0])]
+
+    stages = metrics.summary()['stages']
+    for stage in ('parse_wait', 'parse_cpu', 'parse_return', 'parse_roundtrip'):
+        assert stages[stage]['count'] == len(futures)
+    assert metrics.summary()['counters']['parse_bytes_in'] == sum(map(len, pages)) + len(pages[0])
+
+
+def test_cancelled_result_wakes_waiters(parse_pool):
+    # 全てのプロセスがふさがっている間に投入して取り消す
+    busy = [parse_pool.executor.submit(ready, 'auto', 0.5) for _ in range(parse_pool.max_workers)]
+    future = parse_pool.submit(load_corpus()[0])
+    # 中断で取り消した結果も、子プロセスの解析が終われば、wait()で待っている側には完了として見える
+    assert future.cancel()
+    done, _ = wait([future], timeout=60)
+    assert done == {future}
+    assert future.cancelled()
+    wait(busy)
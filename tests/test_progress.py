@@ -0,0 +1,73 @@
+from fake_sheets import FakeSheetsService
+from progress import ProgressQueue, ProgressTracker
+from sinks import SheetsSink
+from tests.test_sheets import SPREADSHEET_URL, TAGS, build_sheet, run_scraping
+
+
+def row_event(status, row=3):
+    return {'event': 'row', 'sheet': 'S', 'row': row, 'status': status}
+
+
+def test_tracker_counts_rate_and_eta():
+    tracker = ProgressTracker()
+    tracker.update({'event': 'start', 'sheet': 'S', 'rows': None}, now=100.0)
+    assert tracker.eta() is None
+    # 総数が分からないまま始めたシートの行数が後から分かる
+    tracker.update({'event': 'total', 'sheet': 'S', 'rows': 10}, now=100.0)
+    tracker.update({'event': 'start', 'sheet': 'T', 'rows': 10}, now=100.0)
+    for index, status in enumerate(['written', 'written', 'skipped', 'failed']):
+        tracker.update(row_event(status, row=3 + index), now=101.0 + index)
+    assert (tracker.total, tracker.done) == (20, 4)
+    assert tracker.counts == {'written': 2, 'unchanged': 0, 'skipped': 1, 'failed': 1}
+    assert tracker.rate() == 1.0
+    assert tracker.eta() == 16.0
+
+
+def test_tracker_rate_uses_recent_window():
+    tracker = ProgressTracker()
+    tracker.update({'event': 'start', 'sheet': 'S', 'rows': 100}, now=1000.0)
+    for second in range(1, 31):
+        # 最初の20秒は1秒に1行、その後は1秒に2行
+        for _ in range(1 if second <= 20 else 2):
+            tracker.update(row_event('written'), now=1000.0 + second)
+    assert tracker.rate() == 2.0
+
+
+def test_queue_drains_events_in_order():
+    progress_queue = ProgressQueue()
+    for row in range(5):
+        progress_queue(row_event('written', row))
+    events = progress_queue.drain(max_events=3)
+    assert [event['row'] for _, event in events] == [0, 1, 2]
+    assert [event['row'] for _, event in progress_queue.drain()] == [3, 4]
+
+
+def test_rows_are_reported_written_only_after_the_sheet_write():
+    service = FakeSheetsService({'S': []})
+    sink = SheetsSink(service, SPREADSHEET_URL, 'S', flush_rows=2)
+    persisted = []
+    sink.on_persisted = persisted.extend
+    sink.write(3, 'u', TAGS, {'title': 't3'})
+    assert persisted == []
+    sink.write(4, 'u', TAGS, {'title': 't4'})
+    assert persisted == [3, 4]
+
+    urls = [f'https://page.auctions.yahoo.co.jp/jp/auction/b{index}' for index in range(6)]
+    events = []
+    run_scraping(build_sheet(urls), on_progress=events.append)
+    rows = [event for event in events if event['event'] == 'row']
+    assert sorted((event['row'], event['url'], event['status']) for event in rows) == \
+        [(row_num, url, 'written') for row_num, url in enumerate(urls, start=3)]
+
+    # 書き込めなかった行は'written'を送らず、書き込みの失敗として送る
+    service = build_sheet(urls)
+    service.failing_methods.add('batchUpdate')
+    events = []
+    run_scraping(service, on_progress=events.append)
+    rows = [event for event in events if event['event'] == 'row']
+    assert sorted((event['row'], event['status'], event.get('reason')) for event in rows) == \
+        [(row_num, 'failed', 'write_error') for row_num in range(3, 9)]
+    tracker = ProgressTracker()
+    for event in events:
+        tracker.update(event)
+    assert (tracker.done, tracker.counts['failed'], tracker.counts['written']) == (6, 6, 0)
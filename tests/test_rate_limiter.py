@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import yahoo_ac_scraper
+from fake_sheets import FakeSheetsService
+from http_client import HttpClient
+from rate_limiter import AdaptiveRateController, HostRateLimiter, InFlightLimiter, TokenBucket
+from sinks import RESULT_FIELDS
+
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url'] + RESULT_FIELDS
+
+
+def test_token_bucket_allows_a_burst_then_paces_requests():
+    bucket = TokenBucket(rate=20, capacity=2)
+    started = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # 最初の2回はすぐに通り、残りの4回は1/20秒ずつ待つ
+    assert 0.18 <= time.monotonic() - started < 0.5
+
+
+def test_token_bucket_without_rate_does_not_wait():
+    bucket = TokenBucket(rate=0)
+    started = time.monotonic()
+    for _ in range(1000):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.1
+
+
+def test_host_rate_limiter_keeps_one_bucket_per_host():
+    limiter = HostRateLimiter(rate=5, capacity=1)
+    assert limiter.get_bucket('a.example') is limiter.get_bucket('a.example')
+    assert limiter.get_bucket('a.example') is not limiter.get_bucket('b.example')
+    started = time.monotonic()
+    # ホストが違えば待たない
+    limiter.wait('https://a.example/1')
+    limiter.wait('https://b.example/1')
+    assert time.monotonic() - started < 0.1
+    limiter.wait('https://a.example/2')
+    assert time.monotonic() - started >= 0.15
+
+
+def test_rows_run_concurrently_up_to_max_workers(corpus_server):
+    corpus_server.latency = 0.1
+    service = FakeSheetsService({'S': build_sheet([corpus_server.auction_url(index) for index in range(12)])})
+    started = time.monotonic()
+    new_count, skipped_count, details = scrape(service, 'S', adaptive=False)
+    assert new_count == 12
+    assert corpus_server.max_active == 4
+    # 1行ずつなら1.2秒以上かかる
+    assert time.monotonic() - started < 1.0
+
+
+def test_adaptive_backs_off_and_recovers_up_to_the_configured_rate():
+    controller = AdaptiveRateController(rate=2.0, concurrency=4, cooldown=0)
+    controller.record(0.1, throttled=True)
+    assert (controller.rate, controller.concurrency, controller.throttled_count) == (1.0, 2, 1)
+    # 同時実行数の分だけ問題のない応答が続くと1段階上げる
+    controller.record(0.1)
+    assert (controller.rate, controller.concurrency) == (1.0, 2)
+    controller.record(0.1)
+    assert (controller.rate, controller.concurrency) == (pytest.approx(1.1), 3)
+    # 設定したレート・同時実行数を超えては上げない
+    for _ in range(100):
+        controller.record(0.1)
+    assert (controller.rate, controller.concurrency) == (2.0, 4)
+    assert controller.get_bucket('example.com').rate == 2.0
+
+
+def test_adaptive_ignores_slow_responses_and_throttles_within_cooldown():
+    controller = AdaptiveRateController(rate=1.0, concurrency=2, cooldown=60, slow_latency=5.0)
+    controller.record(0.1, throttled=True)
+    controller.record(0.1, throttled=True)
+    assert (controller.rate, controller.concurrency, controller.throttled_count) == (0.5, 1, 2)
+    controller.record(10.0)
+    assert controller.rate == 0.5
+
+
+def test_adaptive_unlimited_rate_starts_from_concurrency():
+    controller = AdaptiveRateController(rate=0, concurrency=8, cooldown=0)
+    controller.record(0.1)
+    assert controller.rate == 0
+    controller.record(0.1, throttled=True)
+    assert (controller.rate, controller.concurrency) == (4.0, 4)
+
+
+def test_in_flight_limiter_shares_the_limit_between_members():
+    limiter = InFlightLimiter()
+    limiter.join()
+    limiter.join()
+    # 上限4を2つのシートで分け合う
+    assert limiter.try_acquire(4, held=0)
+    assert limiter.try_acquire(4, held=1)
+    assert not limiter.try_acquire(4, held=2)
+    assert limiter.try_acquire(4, held=0)
+    assert limiter.try_acquire(4, held=1)
+    assert not limiter.try_acquire(4, held=0)
+    limiter.release()
+    # 1つのシートが終わると、残ったシートが全体を使える
+    limiter.leave()
+    assert limiter.try_acquire(4, held=2)
+
+
+def build_sheet(urls):
+    return [['ヘッダー'] * len(TAGS), list(TAGS)] + [[url] for url in urls]
+
+
+def scrape(service, sheet_name, **options):
+    return yahoo_ac_scraper.smart_scraping(
+        service, SPREADSHEET_URL, sheet_name, 3, None, lambda: True, max_workers=4, requests_per_second=100,
+        http_client=HttpClient(max_retries=0), browser_profile=None, **options)
+
+
+def test_throttled_rows_are_requeued_instead_of_failing(corpus_server):
+    service = FakeSheetsService({'S': build_sheet([corpus_server.auction_url(index) for index in range(3, 9)])})
+    corpus_server.throttle_next = 3
+    new_count, skipped_count, details = scrape(service, 'S')
+    assert (new_count, details['failed'], details['throttle_requeues'], details['throttled']) == (6, 0, 3, 3)
+    assert service.cell('S', 3, TAGS.index('total_postage')) == '1200'
+
+
+def test_lowered_concurrency_is_enforced_across_sheets(corpus_server):
+    corpus_server.latency = 0.05
+    service = FakeSheetsService({
+        'A': build_sheet([corpus_server.auction_url(index) for index in range(0, 12)]),
+        'B': build_sheet([corpus_server.auction_url(index) for index in range(100, 112)])
+    })
+    # 制限されて同時実行数が2に下がった状態から始める（応答をslow_latencyより遅くし、途中で上げないようにする）
+    controller = AdaptiveRateController(rate=100, concurrency=4, cooldown=60, slow_latency=0.01)
+    controller.record(0.1, throttled=True)
+    assert controller.concurrency == 2
+    auction_futures = {}
+    results = []
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        threads = [threading.Thread(target=lambda name=name: results.append(scrape(
+            service, name, executor=executor, rate_limiter=controller, auction_futures=auction_futures)))
+            for name in ('A', 'B')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert sorted(result[0] for result in results) == [12, 12]
+    assert corpus_server.max_active <= 2
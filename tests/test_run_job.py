@@ -0,0 +1,59 @@
+import pytest
+
+import yahoo_ac_scraper
+from fake_sheets import FakeSheetsService
+from http_client import HttpClient
+from sinks import JsonlSink, RESULT_FIELDS
+
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url'] + RESULT_FIELDS
+OPTIONS = dict(use_cache=False, use_journal=False, use_store=False, browser_profile=None, max_workers=4,
+               requests_per_second=0)
+
+
+def build_sheet(urls):
+    return [['ヘッダー'] * len(TAGS), list(TAGS)] + [[url] for url in urls]
+
+
+def test_sheets_are_processed_in_one_run(monkeypatch, corpus_server):
+    service = FakeSheetsService({
+        'A': build_sheet([corpus_server.auction_url(index) for index in range(3, 7)]),
+        # 行3は空、行4〜はAと1件重なる
+        'B': build_sheet(['', corpus_server.auction_url(6), corpus_server.auction_url(7)])
+    })
+    monkeypatch.setattr(yahoo_ac_scraper, 'get_sheets_service', lambda interactive_auth=True: service)
+    targets = [(SPREADSHEET_URL, 'A', 3, None), (SPREADSHEET_URL, 'B', 3, None)]
+    new_count, skipped_count, details = yahoo_ac_scraper.run_job(
+        targets, lambda: True, http_client=HttpClient(max_retries=0), **OPTIONS)
+
+    assert (new_count, skipped_count, details['failed']) == (6, 1, 0)
+    assert details['skip_reasons']['empty_url'] == 1
+    assert [(sheet['sheet'], sheet['new'], sheet['skipped']) for sheet in details['sheets']] == [('A', 4, 0),
+                                                                                                ('B', 2, 1)]
+    # 両方のシートにあるオークションは1回だけ取得する
+    assert len(corpus_server.paths) == 5
+    assert details['duplicates_collapsed'] == 1
+    assert service.cell('B', 4, TAGS.index('title')) == service.cell('A', 6, TAGS.index('title'))
+
+
+def test_shared_throttled_count_is_reported_once(monkeypatch, corpus_server):
+    service = FakeSheetsService({
+        'A': build_sheet([corpus_server.auction_url(index) for index in range(3, 6)]),
+        'B': build_sheet([corpus_server.auction_url(index) for index in range(6, 9)])
+    })
+    monkeypatch.setattr(yahoo_ac_scraper, 'get_sheets_service', lambda interactive_auth=True: service)
+    corpus_server.throttle_next = 2
+    new_count, skipped_count, details = yahoo_ac_scraper.run_job(
+        [(SPREADSHEET_URL, 'A', 3, None), (SPREADSHEET_URL, 'B', 3, None)], lambda: True,
+        http_client=HttpClient(max_retries=0), **dict(OPTIONS, requests_per_second=100))
+    assert (new_count, details['failed']) == (6, 0)
+    # 共有のレート制限の回数をシートの数だけ足さない
+    assert details['throttled'] == 2
+
+
+def test_file_output_is_limited_to_one_sheet(tmp_path):
+    sink = JsonlSink(str(tmp_path / 'output.jsonl'))
+    targets = [(SPREADSHEET_URL, 'A', 3, None), (SPREADSHEET_URL, 'B', 3, None)]
+    with pytest.raises(ValueError):
+        yahoo_ac_scraper.run_job(targets, lambda: True, sink=sink, **OPTIONS)
+    sink.close()
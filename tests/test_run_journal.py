@@ -0,0 +1,101 @@
+import os
+
+import yahoo_ac_scraper
+from fake_sheets import FakeSheetsService
+from http_client import HttpClient
+from run_journal import RunJournal
+from sinks import RESULT_FIELDS
+
+URL = 'https://page.auctions.yahoo.co.jp/jp/auction/x1'
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url'] + RESULT_FIELDS
+
+
+def test_load_returns_unwritten_results_for_resume(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.jsonl'))
+    journal.begin(sheet='S', start_row=3, end_row=None)
+    journal.record_parsed(3, URL, {'title': 'a'})
+    journal.record_parsed(4, URL, {'title': 'b'})
+    journal.record_written([3])
+    journal.record_skipped(5, 'ended')
+    journal.record_parsed(6, URL, {'title': 'c'})
+    journal.record_failed(6, URL)
+    journal.close()
+    # 書き込み途中で落ちた最後の行は読み飛ばす
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "written", "rows": [')
+
+    state = journal.load()
+    assert state['start']['sheet'] == 'S'
+    assert state['done'] == {3, 5}
+    assert state['pending'] == {4: (URL, {'title': 'b'})}
+
+
+def test_resume_appends_and_completed_run_removes_journal(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.jsonl'))
+    journal.begin(sheet='S')
+    journal.record_parsed(3, URL, {'title': 'a'})
+    journal.close()
+
+    journal.begin(resume=True, sheet='S')
+    journal.record_written([3])
+    journal.close()
+    assert journal.load()['done'] == {3}
+
+    journal.begin(resume=True, sheet='S')
+    journal.close(completed=True)
+    assert not os.path.exists(journal.path)
+
+
+def build_sheet(urls):
+    return FakeSheetsService({'S': [['ヘッダー'] * len(TAGS), list(TAGS)] + [[url] for url in urls]})
+
+
+def scrape(service, journal, is_scraping=lambda: True, **options):
+    return yahoo_ac_scraper.smart_scraping(
+        service, SPREADSHEET_URL, 'S', 3, None, is_scraping, requests_per_second=0, journal=journal,
+        http_client=HttpClient(max_retries=0), browser_profile=None, **options)
+
+
+def test_resume_writes_pending_results_and_skips_done_rows(tmp_path, corpus_server):
+    urls = [corpus_server.auction_url(index) for index in range(3, 9)]
+    service = build_sheet(urls)
+    # 行3は解析まで済んで書き込む前に落ち、行4は書き込み済みだった前回の実行
+    journal = RunJournal(str(tmp_path / 'journal.jsonl'))
+    journal.begin(sheet='S', start_row=3, end_row=None)
+    journal.record_parsed(3, urls[0], {'title': '前回の結果'})
+    journal.record_parsed(4, urls[1], {'title': '書き込み済み'})
+    journal.record_written([4])
+    journal.close()
+
+    new_count, skipped_count, details = scrape(service, journal, resume=True)
+    assert details['skip_reasons']['resumed'] == 1
+    assert service.cell('S', 3, TAGS.index('title')) == '前回の結果'
+    assert service.cell('S', 4, TAGS.index('title')) in ('', None)
+    assert all(service.cell('S', row_num, TAGS.index('title')) for row_num in range(5, 9))
+    # 前回の結果を書き込んだ行・書き込み済みの行は取得し直さない
+    assert sorted(corpus_server.paths) == sorted(url[len(corpus_server.base_url):] for url in urls[2:])
+    # 最後まで書き込めたのでジャーナルは消える
+    assert not os.path.exists(journal.path)
+
+
+def test_interrupted_run_resumes_where_it_stopped(tmp_path, corpus_server):
+    urls = [corpus_server.auction_url(index) for index in range(3, 9)]
+    service = build_sheet(urls)
+    journal = RunJournal(str(tmp_path / 'journal.jsonl'))
+    state = {'scraping': True}
+
+    def stop_after_first_row(event):
+        if event['event'] == 'row':
+            state['scraping'] = False
+
+    scrape(service, journal, lambda: state['scraping'], on_progress=stop_after_first_row, flush_rows=1)
+    fetched = len(corpus_server.paths)
+    assert 1 <= fetched < len(urls)
+    assert os.path.exists(journal.path)
+
+    new_count, skipped_count, details = scrape(service, journal, resume=True)
+    assert details['skip_reasons']['resumed'] == fetched
+    assert new_count == len(urls) - fetched
+    assert len(corpus_server.paths) == len(urls)
+    assert all(service.cell('S', row_num, TAGS.index('title')) for row_num in range(3, 9))
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import yahoo_ac_scraper
+from auction_utils import auction_key, normalize_auction_url
+from fake_sheets import FakeSheetsService
+from http_client import HttpClient
+from sinks import RESULT_FIELDS
+from yahoo_ac_scraper import get_skip_reason
+
+CANONICAL_URL = 'https://page.auctions.yahoo.co.jp/jp/auction/x123456789'
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url', 'title', 'transaction_id', 'transaction_date', 'price']
+SHEET_TAGS = ['url'] + RESULT_FIELDS
+NOW = datetime(2024, 3, 15, 12, 0)
+
+
+def test_normalize_auction_url():
+    for url in (
+        CANONICAL_URL,
+        ' https://page.auctions.yahoo.co.jp/jp/auction/x123456789 ',
+        'https://page.auctions.yahoo.co.jp/jp/auction/x123456789?utm_source=mail&fr=top#description',
+        'https://auctions.yahoo.co.jp/jp/auction/x123456789',
+        'https://page.auctions.yahoo.co.jp/show/qa?aID=x123456789',
+    ):
+        assert normalize_auction_url(url) == CANONICAL_URL
+
+
+def test_normalize_keeps_other_urls_without_tracking_params():
+    assert normalize_auction_url('https://example.com/item?id=1&utm_campaign=a&gclid=b#top') == \
+        'https://example.com/item?id=1'
+
+
+def test_auction_key_matches_across_url_forms():
+    assert auction_key(CANONICAL_URL + '?fr=top') == auction_key('https://auctions.yahoo.co.jp/jp/auction/x123456789')
+
+
+def row(transaction_date='2024.03.10（日）22:00', price='1000'):
+    return [CANONICAL_URL, 'title', 'x123456789', transaction_date, price]
+
+
+def test_get_skip_reason():
+    assert get_skip_reason(row(), TAGS, NOW) == 'ended'
+    # 終了日時がまだ先のオークションは価格が変わる可能性があるため再取得する
+    assert get_skip_reason(row('2024.03.20（水）22:00'), TAGS, NOW) is None
+    assert get_skip_reason(row('不明'), TAGS, NOW) == 'complete'
+    # 出力列が空・N/Aの行は再取得する
+    assert get_skip_reason(row(price=''), TAGS, NOW) is None
+    assert get_skip_reason(row(price='N/A'), TAGS, NOW) is None
+    assert get_skip_reason(['url', '', '', '', ''], ['url', 'title'], NOW) is None
+
+
+def build_sheet(urls):
+    return [['ヘッダー'] * len(SHEET_TAGS), list(SHEET_TAGS)] + [[url] for url in urls]
+
+
+def scrape(service, sheet_name, **options):
+    return yahoo_ac_scraper.smart_scraping(
+        service, SPREADSHEET_URL, sheet_name, 3, None, lambda: True, max_workers=4, requests_per_second=0,
+        http_client=HttpClient(max_retries=0), browser_profile=None, **options)
+
+
+def test_duplicate_rows_are_fetched_once(corpus_server):
+    url = corpus_server.auction_url(3)
+    service = FakeSheetsService({'S': build_sheet(
+        [url, url + '?utm_source=mail', corpus_server.auction_url(4), url + '#description', url])})
+    new_count, skipped_count, details = scrape(service, 'S')
+    assert (new_count, details['duplicates_collapsed']) == (5, 3)
+    assert sorted(corpus_server.paths) == ['/jp/auction/b3', '/jp/auction/b4']
+    # 同じオークションの行には同じ結果を書き込む
+    titles = [service.cell('S', row_num, SHEET_TAGS.index('title')) for row_num in range(3, 8)]
+    assert titles[0] and titles[1:] == [titles[0], titles[2], titles[0], titles[0]]
+    assert titles[2] != titles[0]
+
+
+def test_sheets_sharing_auction_futures_fetch_each_auction_once(corpus_server):
+    service = FakeSheetsService({
+        'A': build_sheet([corpus_server.auction_url(index) for index in range(3, 6)]),
+        'B': build_sheet([corpus_server.auction_url(index) + '?fr=top' for index in range(4, 8)])
+    })
+    auction_futures = {}
+    assert scrape(service, 'A', auction_futures=auction_futures)[0] == 3
+    new_count, skipped_count, details = scrape(service, 'B', auction_futures=auction_futures)
+    assert (new_count, details['duplicates_collapsed']) == (4, 2)
+    assert len(corpus_server.paths) == 5
+    assert service.cell('B', 3, SHEET_TAGS.index('title')) == service.cell('A', 4, SHEET_TAGS.index('title'))
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pytest
+
+import seller_listing
+from fake_sheets import FakeSheetsService
+from http_client import HttpClient
+from sinks import RESULT_FIELDS
+from tests.conftest import listing_html
+
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url'] + RESULT_FIELDS
+NOW = datetime(2024, 3, 15, 12, 0)
+
+
+def test_parse_listing_html():
+    html = listing_html([('b1', 12000, '03/10 22:05', '送料無料'), ('b2', 800, '03/11 21:00', ''),
+                         ('b3', 500, '03/12 20:00', '読み込み中')])
+    items = seller_listing.parse_listing_html(html, NOW)
+    assert [item['transaction_id'] for item in items] == ['b1', 'b2', 'b3']
+    assert items[0] == {
+        'url': 'https://page.auctions.yahoo.co.jp/jp/auction/b1',
+        'title': '商品b1',
+        'transaction_id': 'b1',
+        'seller_id': 'sellerA',
+        'seller_name': '出品者A',
+        'transaction_date': '2024.03.10（日）22:05',
+        'price': '12000',
+        'tax_included_price': '12000',
+        'total_postage': '0',
+        'postage_source': 'listing'
+    }
+    # 送料が載っていない・解釈できない商品は、詳細ページで補うためNoneにする
+    assert (items[1]['total_postage'], items[1]['postage_source']) == (None, None)
+    assert (items[2]['total_postage'], items[2]['postage_source']) == (None, None)
+
+
+@pytest.fixture
+def listing_site(corpus_server, monkeypatch):
+    monkeypatch.setattr(seller_listing, 'SELLER_CLOSED_LISTING_URL',
+                        corpus_server.url('/closedsearch?seller={seller_id}&b={offset}&n={page_size}'))
+    monkeypatch.setattr(seller_listing, 'CANONICAL_AUCTION_URL', corpus_server.url('/jp/auction/{}'))
+    return corpus_server
+
+
+def run_bulk(service, is_scraping=lambda: True, **options):
+    return seller_listing.bulk_scraping(
+        service, SPREADSHEET_URL, 'S', 3, None, is_scraping, seller_ids=['sellerA'], requests_per_second=0,
+        browser_profile=None, http_client=HttpClient(max_retries=0), **options)
+
+
+def detail_requests(server):
+    return sum('/jp/auction/' in path for path in server.paths)
+
+
+def test_bulk_scraping_updates_rows_and_appends_new_auctions(listing_site):
+    # 偶数番号は一覧に送料があり、奇数番号は詳細ページ（corpusのページ）で送料を補う
+    listing_site.listings['sellerA'] = [(f'b{index}', 1000 + index, '03/10 22:00', '送料無料' if index % 2 == 0 else '')
+                                        for index in range(6)]
+    service = FakeSheetsService({'S': [['ヘッダー'] * len(TAGS), list(TAGS),
+                                       ['https://page.auctions.yahoo.co.jp/jp/auction/b2?fr=top']]})
+    events = []
+    new_count, skipped_count, details = run_bulk(service, on_progress=events.append)
+
+    assert (new_count, skipped_count, details['appended'], details['detail_fallbacks']) == (6, 0, 5, 3)
+    # 既存の行のURLはそのままにする
+    assert service.cell('S', 3, 0) == 'https://page.auctions.yahoo.co.jp/jp/auction/b2?fr=top'
+    assert service.cell('S', 3, TAGS.index('total_postage')) == '0'
+    assert [service.cell('S', row_num, TAGS.index('transaction_id')) for row_num in range(3, 9)] == \
+        ['b2', 'b0', 'b1', 'b3', 'b4', 'b5']
+    # 詳細ページ（b3: static_postage_1.html）の送料。送料のないページ（b1）はブラウザを使わないため空になる
+    assert service.cell('S', 6, TAGS.index('total_postage')) == '1200'
+    assert service.cell('S', 5, TAGS.index('total_postage')) == ''
+    assert {event['sheet'] for event in events} == {'S'}
+
+
+def test_bulk_scraping_stops_detail_fetches_when_interrupted(listing_site):
+    listing_site.listings['sellerA'] = [(f'b{index}', 1000, '03/10 22:00', '') for index in range(10)]
+    service = FakeSheetsService({'S': [['ヘッダー'] * len(TAGS), list(TAGS)]})
+
+    new_count, skipped_count, details = run_bulk(service, lambda: detail_requests(listing_site) < 2)
+    # 中断した時点で取得中だったもの以外の詳細ページは取得しない
+    assert details['detail_fallbacks'] == 10
+    assert detail_requests(listing_site) <= 3
+    assert new_count < 10
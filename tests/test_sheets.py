@@ -0,0 +1,117 @@
+import os
+from types import SimpleNamespace
+
+import yahoo_ac_scraper
+from fake_sheets import FakeSheetsService, column_to_index
+from sheets_auth import column_letter
+from sinks import SheetsSink, SheetsSource, RESULT_FIELDS
+
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+CORPUS_PAGE = os.path.join(os.path.dirname(__file__), os.pardir, 'benchmarks', 'corpus', 'static_postage_1.html')
+TAGS = ['url'] + RESULT_FIELDS
+
+
+class FakeHttpClient:
+    """どのURLにも同じページを返すHttpClientの代わり"""
+
+    def __init__(self, html):
+        self.html = html
+
+    def get(self, url, retry_throttled=True, **kwargs):
+        return SimpleNamespace(status_code=200, ok=True, text=self.html)
+
+
+def build_sheet(urls):
+    return FakeSheetsService({'S': [['ヘッダー'] * len(TAGS), list(TAGS)] + [[url] for url in urls]})
+
+
+def test_column_letter_past_z():
+    for index, letters in ((0, 'A'), (25, 'Z'), (26, 'AA'), (27, 'AB'), (51, 'AZ'), (52, 'BA'), (701, 'ZZ'),
+                           (702, 'AAA')):
+        assert column_letter(index) == letters
+        assert column_to_index(letters) == index
+
+
+def test_build_updates_coalesces_rows_and_columns():
+    sink = SheetsSink(FakeSheetsService(), SPREADSHEET_URL, 'S')
+    pending = {
+        4: {0: 'e', 1: 'f', 3: 'h'},
+        3: {0: 'a', 1: 'b', 3: 'd'},
+        6: {0: 'x'}
+    }
+    assert sink.build_updates(pending) == [
+        {'range': 'S!A3:B4', 'values': [['a', 'b'], ['e', 'f']]},
+        {'range': 'S!D3:D4', 'values': [['d'], ['h']]},
+        {'range': 'S!A6:A6', 'values': [['x']]}
+    ]
+
+
+def test_iter_rows_reads_past_blank_gap():
+    # chunk_rowsより長い空行の後ろの行も読む（最初の空のページで止まらない）
+    service = build_sheet(['u3', 'u4', 'u5'] + [''] * 12 + ['u18', '', 'u20'])
+    source = SheetsSource(service, SPREADSHEET_URL, 'S')
+    rows = list(source.iter_rows(3, None, TAGS, ('url',) + tuple(RESULT_FIELDS), chunk_rows=5))
+    assert len(rows) == len(source.read_rows(3, None)) == 18
+    assert [row[0] for row in rows if row[0]] == ['u3', 'u4', 'u5', 'u18', 'u20']
+
+
+def test_iter_rows_stops_at_end_row():
+    service = build_sheet([f'u{row_num}' for row_num in range(3, 30)])
+    source = SheetsSource(service, SPREADSHEET_URL, 'S')
+    rows = list(source.iter_rows(3, 10, TAGS, ('url',), chunk_rows=5))
+    assert [row[0] for row in rows] == [f'u{row_num}' for row_num in range(3, 11)]
+
+
+def test_iter_rows_reports_row_count_from_its_own_read():
+    service = build_sheet([f'u{row_num}' for row_num in range(3, 15)])
+    source = SheetsSource(service, SPREADSHEET_URL, 'S')
+    counts = []
+    rows = list(source.iter_rows(3, None, TAGS, ('url',), chunk_rows=5, on_count=counts.append))
+    assert len(rows) == counts[0] == 12
+    assert counts == [12]
+    # url列の数え上げ（get）は1回だけで、残りはページごとのbatchGet
+    assert service.request_counts['get'] == 1
+    assert service.request_counts['batchGet'] == 3
+
+
+def test_sink_close_returns_unwritten_rows():
+    service = FakeSheetsService({'S': []})
+    service.failing_methods.add('batchUpdate')
+    sink = SheetsSink(service, SPREADSHEET_URL, 'S', flush_rows=2)
+    persisted = []
+    sink.on_persisted = persisted.extend
+    for row_num in (3, 4, 5):
+        sink.write(row_num, 'u', TAGS, {'title': f't{row_num}'})
+    assert sink.close() == [3, 4, 5]
+    assert persisted == []
+
+
+def run_scraping(service, **options):
+    with open(CORPUS_PAGE, 'rb') as f:
+        http_client = FakeHttpClient(f.read().decode('utf-8'))
+    return yahoo_ac_scraper.smart_scraping(
+        service, SPREADSHEET_URL, 'S', 3, None, lambda: True, max_workers=2, requests_per_second=0,
+        flush_rows=4, http_client=http_client, browser_profile=None, **options)
+
+
+def test_rows_count_as_written_only_after_the_sheet_write():
+    urls = [f'https://page.auctions.yahoo.co.jp/jp/auction/b{index}' for index in range(6)]
+    service = build_sheet(urls)
+    new_count, skipped_count, details = run_scraping(service)
+    assert (new_count, details['failed'], details['unwritten']) == (6, 0, 0)
+    assert service.cell('S', 3, TAGS.index('total_postage')) == '1200'
+
+    # 書き込みが全て失敗した場合は、書き込んだ行として数えずに失敗として数える
+    service = build_sheet(urls)
+    service.failing_methods.add('batchUpdate')
+    new_count, skipped_count, details = run_scraping(service)
+    assert (new_count, details['failed'], details['unwritten']) == (0, 6, 6)
+
+
+def test_progress_total_comes_from_the_streamed_row_count():
+    service = build_sheet([f'https://page.auctions.yahoo.co.jp/jp/auction/b{index}' for index in range(6)])
+    events = []
+    run_scraping(service, on_progress=events.append)
+    assert [event['rows'] for event in events if event['event'] == 'total'] == [6]
+    # タグ行とurl列の2回だけ（url列を進捗のために読み直さない）
+    assert service.request_counts['get'] == 2
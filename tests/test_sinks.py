@@ -0,0 +1,70 @@
+import csv
+import json
+
+import yahoo_ac_scraper
+from http_client import HttpClient
+from sinks import CsvSink, CsvSource, JsonlSink, RESULT_FIELDS
+
+SPREADSHEET_URL = 'https://docs.google.com/spreadsheets/d/test/edit'
+TAGS = ['url'] + RESULT_FIELDS
+
+
+def write_input_csv(path, urls):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ヘッダー'] * len(TAGS))
+        writer.writerow(TAGS)
+        for url in urls:
+            writer.writerow([url])
+
+
+def scrape(source, sink):
+    return yahoo_ac_scraper.smart_scraping(
+        None, SPREADSHEET_URL, 'S', 3, None, lambda: True, max_workers=2, requests_per_second=0,
+        source=source, sink=sink, http_client=HttpClient(max_retries=0), browser_profile=None)
+
+
+def test_csv_source_reads_rows_like_a_sheet(tmp_path):
+    path = str(tmp_path / 'input.csv')
+    write_input_csv(path, ['https://example.com/1', '', 'https://example.com/3', ''])
+    source = CsvSource(path)
+    assert source.read_tags() == TAGS
+    counts = []
+    rows = list(source.iter_rows(3, None, TAGS, ['url'], on_count=counts.append))
+    assert [row[0] for row in rows] == ['https://example.com/1', '', 'https://example.com/3', '']
+    # 最後にurlがある行までの行数
+    assert counts == [3]
+    assert [row[0] for row in source.iter_rows(4, 4, TAGS, ['url'])] == ['']
+
+
+def test_csv_input_to_jsonl_output(tmp_path, corpus_server):
+    input_path = str(tmp_path / 'input.csv')
+    output_path = str(tmp_path / 'output.jsonl')
+    urls = [corpus_server.auction_url(index) for index in range(3, 6)]
+    write_input_csv(input_path, urls)
+
+    sink = JsonlSink(output_path)
+    new_count, skipped_count, details = scrape(CsvSource(input_path), sink)
+    assert sink.close() == []
+    assert (new_count, details['failed']) == (3, 0)
+    with open(output_path, encoding='utf-8') as f:
+        records = sorted((json.loads(line) for line in f), key=lambda record: record['row'])
+    assert [(record['row'], record['url']) for record in records] == [(3, urls[0]), (4, urls[1]), (5, urls[2])]
+    assert records[0]['total_postage'] == '1200'
+    assert set(RESULT_FIELDS) <= set(records[0])
+
+
+def test_csv_sink_appends_and_writes_the_header_once(tmp_path):
+    path = str(tmp_path / 'output.csv')
+    for row_num in (3, 4):
+        sink = CsvSink(path)
+        persisted = []
+        sink.on_persisted = persisted.extend
+        assert sink.write(row_num, f'https://example.com/{row_num}', TAGS, {'title': f'商品{row_num}', 'extra': 'x'})
+        assert persisted == [row_num]
+        assert sink.close() == []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['row'], row['url'], row['title']) for row in rows] == [
+        ('3', 'https://example.com/3', '商品3'), ('4', 'https://example.com/4', '商品4')]
+    assert 'extra' not in rows[0]
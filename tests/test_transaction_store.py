@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from fake_sheets import FakeSheetsService
+from transaction_store import SUMMARY_SHEET_NAME, TransactionStore
+
+URL_A = 'https://docs.google.com/spreadsheets/d/sheetA/edit'
+URL_B = 'https://docs.google.com/spreadsheets/d/sheetB/edit'
+
+
+def result(auction_id, seller_id='s1', date='2024.03.10（日）22:00', price='1,000', postage='500'):
+    return {'transaction_id': auction_id, 'title': f'商品{auction_id}', 'seller_id': seller_id,
+            'seller_name': f'出品者{seller_id}', 'transaction_date': date, 'price': price,
+            'tax_included_price': price, 'total_postage': postage, 'postage_source': 'static_html'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    transaction_store = TransactionStore(str(tmp_path / 'transactions.sqlite3'))
+    yield transaction_store
+    transaction_store.close()
+
+
+def test_upsert_normalizes_and_overwrites(store):
+    assert store.upsert(result('x1'), '購入履歴', spreadsheet_id='sheetA')
+    assert store.upsert(result('x1', price='2,000', postage='着払い'), '購入履歴', spreadsheet_id='sheetA')
+    # オークションIDはURLからも取る。取れない結果は保存しない
+    assert store.upsert(result('N/A'), '購入履歴', 'https://page.auctions.yahoo.co.jp/jp/auction/x2', 'sheetA')
+    assert not store.upsert(result('N/A'), '購入履歴', spreadsheet_id='sheetA')
+
+    rows = store.query(spreadsheet_id='sheetA')
+    assert [row['transaction_id'] for row in rows] == ['x1', 'x2']
+    assert (rows[0]['price'], rows[0]['total_postage'], rows[0]['postage_text']) == (2000, None, '着払い')
+    assert rows[0]['transaction_date'] == '2024-03-10T22:00'
+
+
+def test_aggregates_are_kept_per_spreadsheet(store):
+    store.upsert(result('x1', 's1', '2024.03.10（日）22:00', '1,000', '500'), '購入履歴', spreadsheet_id='sheetA')
+    store.upsert(result('x2', 's1', '2024.03.20（水）22:00', '2,000', '着払い'), '購入履歴', spreadsheet_id='sheetA')
+    store.upsert(result('x3', 's2', '2024.04.01（月）22:00', '3,000', '0'), '購入履歴', spreadsheet_id='sheetA')
+    # 同じオークションでも別のスプレッドシートの取引は別に数える
+    store.upsert(result('x1', 's1', '2024.03.10（日）22:00', '9,000', '500'), '購入履歴', spreadsheet_id='sheetB')
+    store.refresh_aggregates()
+
+    assert [(row['month'], row['count'], row['price'], row['total_postage'])
+            for row in store.monthly_totals(spreadsheet_id='sheetA')] == [('2024-03', 2, 3000, 500),
+                                                                        ('2024-04', 1, 3000, 0)]
+    assert [(row['seller_id'], row['count'], row['tax_included_price'])
+            for row in store.seller_totals(spreadsheet_id='sheetA')] == [('s1', 2, 3000), ('s2', 1, 3000)]
+    assert [row['price'] for row in store.monthly_totals(spreadsheet_id='sheetB')] == [9000]
+
+
+def test_export_summary_writes_only_that_spreadsheets_totals(store):
+    store.upsert(result('x1', price='1,000'), '購入履歴', spreadsheet_id='sheetA')
+    store.upsert(result('x2', price='5,000'), '売却履歴', spreadsheet_id='sheetB')
+    service_a = FakeSheetsService({SUMMARY_SHEET_NAME: [['古い集計'] * 14 for _ in range(5)]})
+    service_b = FakeSheetsService({SUMMARY_SHEET_NAME: []})
+
+    assert store.export_summary(service_a, URL_A) == 1
+    assert store.export_summary(service_b, URL_B) == 1
+    assert service_a.sheets[SUMMARY_SHEET_NAME][1][:4] == ['購入履歴', '2024-03', '1', '1000']
+    assert service_b.sheets[SUMMARY_SHEET_NAME][1][:4] == ['売却履歴', '2024-03', '1', '5000']
+    # 前回の集計の残りは消す
+    assert all(not any(row) for row in service_a.sheets[SUMMARY_SHEET_NAME][2:])
+
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'transactions.sqlite3')
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE transactions (transaction_id TEXT NOT NULL, sheet_name TEXT NOT NULL DEFAULT '', url TEXT,
+            title TEXT, seller_id TEXT, seller_name TEXT, transaction_date TEXT, transaction_date_text TEXT,
+            price INTEGER, tax_included_price INTEGER, total_postage INTEGER, postage_text TEXT,
+            postage_source TEXT, updated_at REAL NOT NULL, PRIMARY KEY (transaction_id, sheet_name));
+        CREATE INDEX transactions_seller_id ON transactions (seller_id, transaction_date);
+        CREATE TABLE monthly_totals (sheet_name TEXT NOT NULL, month TEXT NOT NULL, count INTEGER NOT NULL,
+            price INTEGER NOT NULL, tax_included_price INTEGER NOT NULL, total_postage INTEGER NOT NULL,
+            PRIMARY KEY (sheet_name, month));
+        INSERT INTO transactions (transaction_id, sheet_name, price, updated_at) VALUES ('x1', '購入履歴', 100, 0);
+    ''')
+    connection.close()
+
+    store = TransactionStore(path)
+    # どのスプレッドシートの取引か分からない古い取引は残すが、どのスプレッドシートの集計にも入れない
+    assert [(row['spreadsheet_id'], row['transaction_id']) for row in store.query()] == [('', 'x1')]
+    store.upsert(result('x1'), '購入履歴', spreadsheet_id='sheetA')
+    assert len(store.query()) == 2
+    store.refresh_aggregates()
+    assert [row['count'] for row in store.monthly_totals(spreadsheet_id='sheetA')] == [1]
+    indexes = {row[1] for row in store.connection.execute("SELECT * FROM sqlite_master WHERE type = 'index'")}
+    assert {'transactions_seller_id', 'transactions_transaction_date'} <= indexes
+    store.close()
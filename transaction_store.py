@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from sheets_auth import app_data_dir, clear_sheet, column_letter, extract_spreadsheet_id, write_to_sheet
+from auction_utils import extract_auction_id, parse_end_date
+
+# 取引データベースの既定の場所（page_cache.sqlite3と同じアプリのデータディレクトリ）
+DEFAULT_STORE_PATH = os.path.join(app_data_dir, 'transactions.sqlite3')
+# 集計を書き出すシート
+SUMMARY_SHEET_NAME = 'ヤフオク集計'
+
+MONTHLY_HEADER = ['シート', '月', '件数', '落札額', '税込額', '送料']
+SELLER_HEADER = ['シート', '出品者ID', '出品者名', '件数', '落札額', '税込額', '送料']
+
+
+def to_int(value):
+    """'1,234円' のような金額を整数にする。数字がない（'N/A'、'着払い'など）場合はNone"""
+    digits = re.sub(r'[^\d]', '', str(value)) if value is not None else ''
+    return int(digits) if digits else None
+
+
+def to_iso_date(value):
+    """'2024.03.10（日）22:00' のような終了日時をISO形式（2024-03-10T22:00）にする。解釈できなければNone"""
+    end_date = parse_end_date(value) if value else None
+    return end_date.isoformat(timespec='minutes') if end_date else None
+
+
+class TransactionStore:
+    """スクレイピング結果をローカルのSQLiteに保存し、シートを読まずに履歴の検索・集計をできるようにする
+
+    取引はスプレッドシート・シート名・オークションIDごとに1行で、同じ取引を取得し直すと上書きする。
+    データベースは全てのスプレッドシートで共有するため、集計・書き出しはスプレッドシートごとに行う。
+    金額は整数（円）、終了日時はISO形式に揃え、元の表記と解釈できなかった送料（着払いなど）も残す。
+    月別・出品者別の集計は refresh_aggregates で集計用のテーブルに作り直す（close でも作り直す）。
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, commit_every=100):
+        self.path = path
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # スプレッドシートを区別していなかった古いデータベースは、取引を引き継いで作り直す
+        columns = [row['name'] for row in self.connection.execute('PRAGMA table_info(transactions)')]
+        migrating = bool(columns) and 'spreadsheet_id' not in columns
+        if migrating:
+            self.connection.executescript('''
+                ALTER TABLE transactions RENAME TO transactions_old;
+                DROP INDEX IF EXISTS transactions_seller_id;
+                DROP INDEX IF EXISTS transactions_transaction_date;
+                DROP TABLE IF EXISTS monthly_totals;
+                DROP TABLE IF EXISTS seller_totals;
+            ''')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                spreadsheet_id TEXT NOT NULL DEFAULT '',
+                transaction_id TEXT NOT NULL,
+                sheet_name TEXT NOT NULL DEFAULT '',
+                url TEXT,
+                title TEXT,
+                seller_id TEXT,
+                seller_name TEXT,
+                transaction_date TEXT,
+                transaction_date_text TEXT,
+                price INTEGER,
+                tax_included_price INTEGER,
+                total_postage INTEGER,
+                postage_text TEXT,
+                postage_source TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (spreadsheet_id, sheet_name, transaction_id)
+            );
+            CREATE INDEX IF NOT EXISTS transactions_seller_id ON transactions (seller_id, transaction_date);
+            CREATE INDEX IF NOT EXISTS transactions_transaction_date ON transactions (transaction_date);
+            CREATE TABLE IF NOT EXISTS monthly_totals (
+                spreadsheet_id TEXT NOT NULL,
+                sheet_name TEXT NOT NULL,
+                month TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                tax_included_price INTEGER NOT NULL,
+                total_postage INTEGER NOT NULL,
+                PRIMARY KEY (spreadsheet_id, sheet_name, month)
+            );
+            CREATE TABLE IF NOT EXISTS seller_totals (
+                spreadsheet_id TEXT NOT NULL,
+                sheet_name TEXT NOT NULL,
+                seller_id TEXT NOT NULL,
+                seller_name TEXT,
+                count INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                tax_included_price INTEGER NOT NULL,
+                total_postage INTEGER NOT NULL,
+                PRIMARY KEY (spreadsheet_id, sheet_name, seller_id)
+            );
+        ''')
+        if migrating:
+            # どのスプレッドシートの取引かは分からないため、spreadsheet_idは空にする（どの集計シートにも書き出さない）
+            self.connection.executescript('''
+                INSERT INTO transactions (transaction_id, sheet_name, url, title, seller_id, seller_name,
+                    transaction_date, transaction_date_text, price, tax_included_price, total_postage,
+                    postage_text, postage_source, updated_at)
+                    SELECT transaction_id, sheet_name, url, title, seller_id, seller_name, transaction_date,
+                        transaction_date_text, price, tax_included_price, total_postage, postage_text,
+                        postage_source, updated_at
+                    FROM transactions_old;
+                DROP TABLE transactions_old;
+            ''')
+            logging.info(f"Migrated the transaction store to per-spreadsheet keys: {path}")
+        self.connection.commit()
+
+    def upsert(self, result, sheet_name='', url=None, spreadsheet_id=''):
+        """スクレイピング結果を1件保存する。オークションIDがない結果は保存せずFalseを返す"""
+        transaction_id = result.get('transaction_id')
+        if not transaction_id or transaction_id == 'N/A':
+            transaction_id = extract_auction_id(url or result.get('url'))
+        if not transaction_id:
+            return False
+
+        def text(key):
+            value = result.get(key)
+            return None if value in (None, '', 'N/A') else str(value)
+
+        record = (
+            spreadsheet_id or '', transaction_id, sheet_name or '', url or result.get('url'), text('title'),
+            text('seller_id'), text('seller_name'), to_iso_date(text('transaction_date')), text('transaction_date'),
+            to_int(text('price')), to_int(text('tax_included_price')), to_int(text('total_postage')),
+            text('total_postage'), text('postage_source'), time.time()
+        )
+        with self.lock:
+            self.connection.execute('''
+                INSERT INTO transactions (spreadsheet_id, transaction_id, sheet_name, url, title, seller_id,
+                    seller_name, transaction_date, transaction_date_text, price, tax_included_price, total_postage,
+                    postage_text, postage_source, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(spreadsheet_id, sheet_name, transaction_id) DO UPDATE SET url = excluded.url,
+                    title = excluded.title, seller_id = excluded.seller_id, seller_name = excluded.seller_name,
+                    transaction_date = excluded.transaction_date,
+                    transaction_date_text = excluded.transaction_date_text, price = excluded.price,
+                    tax_included_price = excluded.tax_included_price, total_postage = excluded.total_postage,
+                    postage_text = excluded.postage_text, postage_source = excluded.postage_source,
+                    updated_at = excluded.updated_at
+            ''', record)
+            # 1件ごとにコミットするとディスクへの同期で遅くなるため、まとめてコミットする
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.connection.commit()
+                self.uncommitted = 0
+        return True
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def query(self, sheet_name=None, seller_id=None, start=None, end=None, limit=None, spreadsheet_id=None):
+        """条件に合う取引を終了日時の順に返す（start / end は 'YYYY-MM-DD' などISO形式の文字列、endは含まない）"""
+        conditions, params = [], []
+        for column, operator, value in (('spreadsheet_id', '=', spreadsheet_id), ('sheet_name', '=', sheet_name),
+                                        ('seller_id', '=', seller_id),
+                                        ('transaction_date', '>=', start), ('transaction_date', '<', end)):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        sql = 'SELECT * FROM transactions'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY transaction_date, transaction_id'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def refresh_aggregates(self):
+        """月別・出品者別の集計テーブルを作り直す"""
+        with self.lock:
+            self.connection.executescript('''
+                DELETE FROM monthly_totals;
+                INSERT INTO monthly_totals
+                    SELECT spreadsheet_id, sheet_name, SUBSTR(transaction_date, 1, 7), COUNT(*),
+                        COALESCE(SUM(price), 0), COALESCE(SUM(tax_included_price), 0),
+                        COALESCE(SUM(total_postage), 0)
+                    FROM transactions WHERE transaction_date IS NOT NULL
+                    GROUP BY spreadsheet_id, sheet_name, SUBSTR(transaction_date, 1, 7);
+                DELETE FROM seller_totals;
+                INSERT INTO seller_totals
+                    SELECT spreadsheet_id, sheet_name, seller_id, MAX(seller_name), COUNT(*),
+                        COALESCE(SUM(price), 0), COALESCE(SUM(tax_included_price), 0),
+                        COALESCE(SUM(total_postage), 0)
+                    FROM transactions WHERE seller_id IS NOT NULL
+                    GROUP BY spreadsheet_id, sheet_name, seller_id;
+            ''')
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def totals_conditions(self, spreadsheet_id, sheet_name):
+        conditions, params = [], []
+        for column, value in (('spreadsheet_id', spreadsheet_id), ('sheet_name', sheet_name)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def monthly_totals(self, sheet_name=None, spreadsheet_id=None):
+        """月別の集計（refresh_aggregates 時点）を月の順に返す"""
+        where, params = self.totals_conditions(spreadsheet_id, sheet_name)
+        sql = f'SELECT * FROM monthly_totals{where} ORDER BY spreadsheet_id, sheet_name, month'
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def seller_totals(self, sheet_name=None, limit=None, spreadsheet_id=None):
+        """出品者別の集計（refresh_aggregates 時点）を税込額の多い順に返す"""
+        where, params = self.totals_conditions(spreadsheet_id, sheet_name)
+        sql = (f'SELECT * FROM seller_totals{where} '
+               'ORDER BY spreadsheet_id, sheet_name, tax_included_price DESC, seller_id')
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def summary_values(self, spreadsheet_id=None):
+        """集計シートに書き込む値（左に月別、1列空けて右に出品者別）を返す。spreadsheet_idを指定するとその分だけ"""
+        monthly = [MONTHLY_HEADER] + [
+            [row['sheet_name'], row['month'], row['count'], row['price'], row['tax_included_price'],
+             row['total_postage']] for row in self.monthly_totals(spreadsheet_id=spreadsheet_id)]
+        sellers = [SELLER_HEADER] + [
+            [row['sheet_name'], row['seller_id'], row['seller_name'] or '', row['count'], row['price'],
+             row['tax_included_price'], row['total_postage']]
+            for row in self.seller_totals(spreadsheet_id=spreadsheet_id)]
+        values = []
+        for index in range(max(len(monthly), len(sellers))):
+            left = monthly[index] if index < len(monthly) else [''] * len(MONTHLY_HEADER)
+            right = sellers[index] if index < len(sellers) else [''] * len(SELLER_HEADER)
+            values.append(left + [''] + right)
+        return values
+
+    def export_summary(self, service, spreadsheet_url, sheet_name=SUMMARY_SHEET_NAME):
+        """spreadsheet_urlのスプレッドシートで取得した取引の月別・出品者別の集計を、その集計シートに書き出す
+        （シートは作成しておく）
+
+        前回より集計が短くなった場合に古い行が残らないよう、集計の列を消してから書き込む。
+        """
+        self.refresh_aggregates()
+        values = self.summary_values(extract_spreadsheet_id(spreadsheet_url) or '')
+        clear_sheet(service, spreadsheet_url, f"{sheet_name}!A:{column_letter(len(values[0]) - 1)}")
+        write_to_sheet(service, spreadsheet_url, values, f"{sheet_name}!A1")
+        return len(values) - 1
+
+    def close(self):
+        self.refresh_aggregates()
+        with self.lock:
+            self.connection.close()
+
+
+if __name__ == "__main__":
+    # 使い方: python transaction_store.py monthly|sellers [シート名]
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'monthly'
+    store = TransactionStore()
+    store.refresh_aggregates()
+    rows = store.monthly_totals(*sys.argv[2:3]) if kind == 'monthly' else store.seller_totals(*sys.argv[2:3])
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    store.close()
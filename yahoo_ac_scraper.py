@@ -1,272 +1,850 @@
-import requests
-from bs4 import BeautifulSoup
 import time
-import re
-from sheets_auth import get_sheets_service, extract_spreadsheet_id, write_to_sheet, read_from_sheet
-from chrome_driver_setup import get_chrome_driver, quit_driver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from sheets_auth import get_sheets_service, extract_spreadsheet_id
+from rate_limiter import HostRateLimiter, AdaptiveRateController, ThrottledError
+from sinks import SheetsSource, SheetsSink, RESULT_FIELDS
+from auction_utils import parse_end_date, auction_key, normalize_auction_url
+from page_cache import PageCache
+from run_journal import RunJournal
+from transaction_store import TransactionStore
+from http_client import get_http_client, THROTTLE_STATUS_CODES
+from metrics import get_metrics, start_run
+from auction_parser import (parse_auction_html, parse_postage_text, is_block_page, resolve_backend, POSTAGE_SELECTORS,
+                            PARSED_FIELDS)
+
+# Selenium（chrome_driver_setup）は起動に時間がかかるため、ブラウザが必要になったときに読み込む
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # OAuth 2.0クライアントの設定
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
-def scrape_yahoo_auction(url):
-    driver = None
-    try:
-        print(f"Scraping URL: {url}")
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
+# 差分モードで取得済みかどうかを判定する出力列
+INCREMENTAL_OUTPUT_TAGS = ('transaction_id', 'price', 'transaction_date')
 
-        try:
-            title = soup.select_one('div.ProductTitle__title h1').text.strip()
-            print(f"Title: {title}")
-        except AttributeError:
-            print("Error: Could not find title")
-            title = 'N/A'
+# 投入数の上限に達している間、他のシートの分が空いたかを確かめる間隔（秒）
+IN_FLIGHT_POLL_INTERVAL = 0.1
 
-        try:
-            auction_id = soup.select_one('th:-soup-contains("オークションID") + td').text.strip()
-            print(f"Auction ID: {auction_id}")
-        except AttributeError:
-            print("Error: Could not find auction ID")
-            auction_id = 'N/A'
-
-        seller_link = soup.select_one('a[href^="https://auctions.yahoo.co.jp/seller/"][data-cl-params*="seller"]')
-        if seller_link and 'href' in seller_link.attrs:
-            seller_url = seller_link['href']
-            seller_id = seller_url.split('/seller/')[-1]
-            seller = seller_link.text.strip()
-            print(f"Seller ID: {seller_id}, Seller Name: {seller}")
-        else:
-            print("Error: Could not find seller information")
-            seller_id = 'N/A'
-            seller = 'N/A'
 
-        try:
-            end_date = soup.select_one('th:-soup-contains("終了日時") + td').text.strip()
-            print(f"End Date: {end_date}")
-        except AttributeError:
-            print("Error: Could not find end date")
-            end_date = 'N/A'
-
-        price_element = soup.select_one('dd.Price__value')
-        if price_element:
-            price_text = price_element.contents[0].strip()
-            price = re.sub(r'[^\d]', '', price_text)
-            print(f"Price: {price}")
-        else:
-            print("Error: Could not find price")
-            price = 'N/A'
+def extract_postage_with_selenium(url, driver_session, rate_limiter=None, timeout=10):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
-        try:
-            tax_included_price = soup.select_one('span.Price__tax').text.strip()
-            tax_included_price = re.sub(r'[^\d]', '', tax_included_price)
-            print(f"Tax Included Price: {tax_included_price}")
-        except AttributeError:
-            print("Error: Could not find tax included price")
-            tax_included_price = '0'
-
-        # tax_included_priceが'0'の場合、priceの値を使用
-        if tax_included_price == '0':
-            tax_included_price = price
-            print(f"Using price as tax included price: {tax_included_price}")
-
-        # 送料情報の抽出（Seleniumを使用）
-        driver = get_chrome_driver()
-        driver.get(url)
-        try:
-            # まず、JavaScriptが読み込まれるのを待つ
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "body"))
-            )
-
-            # 送料情報を取得するための複数のセレクタを試す
-            selectors = [
-                "span.PricepostageValue",
-                "span.Price__postageValue",
-                "dd.Price__postage",
-                "span[data-react-unit-name='PostageValue']"
-            ]
-
-            postage_element = None
-            for selector in selectors:
-                try:
-                    postage_element = WebDriverWait(driver, 5).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                    )
-                    if postage_element:
-                        break
-                except TimeoutException:
-                    continue
+    metrics = get_metrics()
+    if rate_limiter:
+        with metrics.span('rate_limit_wait'):
+            rate_limiter.wait(url)
+    driver = driver_session.load(url)
+    try:
+        # 全ての送料セレクタをまとめて1回だけ待つ
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ', '.join(POSTAGE_SELECTORS)))
+        )
+
+        # 複数見つかった場合はセレクタの優先順に選ぶ
+        postage_element = None
+        for selector in POSTAGE_SELECTORS:
+            elements = driver.find_elements(By.CSS_SELECTOR, selector)
+            if elements:
+                postage_element = elements[0]
+                if selector != POSTAGE_SELECTORS[0]:
+                    metrics.increment('postage_selector_fallback')
+                break
 
-            if postage_element:
-                postage_text = postage_element.text.strip()
-                print(f"Raw postage text (Selenium): {postage_text}")
-
-                postage_match = re.search(r'([\d,]+)円', postage_text)
-                if postage_match:
-                    total_postage = postage_match.group(1).replace(',', '')
-                    print(f"Extracted total postage: {total_postage}")
-                elif '着払い' in postage_text or '落札者負担' in postage_text:
-                    total_postage = '着払い'
-                    print("Total postage is buyer's responsibility or cash on delivery")
-                else:
-                    total_postage = postage_text
-                    print(f"Unrecognized total postage format: {postage_text}")
-            else:
-                print("Error: Could not find postage element")
-                total_postage = ''
-        except TimeoutException:
-            print("Error: Timed out waiting for postage element")
-            total_postage = ''
-        except NoSuchElementException:
-            print("Error: Postage element not found")
-            total_postage = ''
-        except Exception as e:
-            print(f"Error extracting total postage with Selenium: {str(e)}")
-            total_postage = ''
-
-        return {
-            'title': title,
-            'transaction_id': auction_id,
-            'seller_id': seller_id,
-            'seller_name': seller,
-            'transaction_date': end_date,
-            'price': price,
-            'tax_included_price': tax_included_price,
-            'total_postage': total_postage
-        }
+        if postage_element:
+            postage_text = postage_element.text.strip()
+            logging.debug(f"Raw postage text (Selenium): {postage_text}")
 
+            total_postage = parse_postage_text(postage_text)
+            if total_postage == '着払い':
+                logging.debug("Total postage is buyer's responsibility or cash on delivery")
+            elif total_postage is not None:
+                logging.debug(f"Extracted total postage: {total_postage}")
+            else:
+                total_postage = postage_text
+                logging.warning(f"Unrecognized total postage format: {postage_text}")
+            return total_postage
+        logging.warning("Could not find postage element")
+        return ''
+    except TimeoutException:
+        logging.warning(f"Timed out waiting for postage element: {url}")
+        metrics.increment('postage_wait_timeout')
+        return ''
+    except NoSuchElementException:
+        logging.warning(f"Postage element not found: {url}")
+        return ''
     except Exception as e:
-        print(f"Error processing URL: {url}. Error: {str(e)}")
+        logging.error(f"Error extracting total postage with Selenium: {str(e)}")
+        return ''
+
+
+def fetch_auction_page(url, rate_limiter=None, cache=None, refresh_cache=False, http_client=None):
+    """オークションページを取得する
+
+    キャッシュに解析結果があれば (結果, None)、なければ (None, HTML) を返す。
+    アクセスが制限された場合はN/Aとして書き込まず、呼び出し側で再試行できるようThrottledErrorを送出する。
+    """
+    metrics = get_metrics()
+    # キャッシュに解析結果があればページを取得しない
+    cached = cache.get(url) if cache and not refresh_cache else None
+    if cached and cached['result']:
+        logging.debug(f"Cache hit: {url}")
+        metrics.increment('cache_hit')
+        return cached['result'], None
+    if cache:
+        metrics.increment('cache_html_hit' if cached and cached['html'] else 'cache_miss')
+
+    logging.debug(f"Scraping URL: {url}")
+    if cached and cached['html']:
+        logging.debug(f"Using cached HTML: {url}")
+        return None, cached['html']
+
+    if rate_limiter:
+        with metrics.span('rate_limit_wait'):
+            rate_limiter.wait(url)
+    started = time.perf_counter()
+    with metrics.span('fetch'):
+        # アクセス制限はHttpClientの中で再試行せず、レート制限に記録してから呼び出し側で再試行する
+        response = (http_client or get_http_client()).get(url, retry_throttled=False)
+        html = response.text
+    throttled = response.status_code in THROTTLE_STATUS_CODES or is_block_page(html)
+    if hasattr(rate_limiter, 'record'):
+        rate_limiter.record(time.perf_counter() - started, throttled)
+    if throttled:
+        metrics.increment('throttled')
+        raise ThrottledError(f"Access throttled (HTTP {response.status_code}): {url}")
+    if cache and response.ok:
+        cache.put_html(url, html)
+    return None, html
+
+
+def complete_auction_result(url, parsed, driver_session=None, rate_limiter=None, cache=None):
+    """解析結果から書き込む結果を作る（HTMLに送料がなく、driver_sessionがあればSeleniumで送料を取得する）"""
+    metrics = get_metrics()
+    for key, label in (('title', 'Title'), ('transaction_id', 'Auction ID'), ('transaction_date', 'End Date'),
+                       ('price', 'Price')):
+        if parsed[key] == 'N/A':
+            logging.warning(f"Could not find {label.lower()}: {url}")
+        else:
+            logging.debug(f"{label}: {parsed[key]}")
+    if parsed['seller_id'] == 'N/A':
+        logging.warning(f"Could not find seller information: {url}")
+    else:
+        logging.debug(f"Seller ID: {parsed['seller_id']}, Seller Name: {parsed['seller_name']}")
+    logging.debug(f"Tax Included Price: {parsed['tax_included_price']}")
+
+    # 送料情報の抽出（まず取得済みのHTMLから探し、見つからない場合のみSeleniumを使用）
+    total_postage, postage_source = parsed['total_postage'], parsed['postage_source']
+    if total_postage is not None:
+        logging.debug(f"Extracted total postage ({postage_source}): {total_postage}")
+    elif driver_session is None:
+        logging.debug("Postage not found in HTML and browser rendering is disabled")
+        total_postage, postage_source = '', 'none'
+    else:
+        with metrics.span('render'):
+            total_postage = extract_postage_with_selenium(url, driver_session, rate_limiter)
+        postage_source = 'selenium' if total_postage else 'none'
+    metrics.increment(f'postage_{postage_source}')
+
+    result = {key: parsed[key] for key in PARSED_FIELDS}
+    result['total_postage'] = total_postage
+    result['postage_source'] = postage_source
+    # 送料が取れなかった結果はキャッシュしない（終了済みのオークションの結果は期限切れにならないため、
+    # 空の送料が残り続ける）。HTMLはキャッシュ済みなので、次回は解析と送料の取得だけをやり直す
+    if cache and postage_source != 'none':
+        cache.put_result(url, result)
+    return result
+
+
+def scrape_yahoo_auction(url, driver_session=None, rate_limiter=None, cache=None, refresh_cache=False,
+                         http_client=None, parser_backend='auto', browser_profile='scraping'):
+    metrics = get_metrics()
+    own_session = False
+    try:
+        cached_result, html = fetch_auction_page(url, rate_limiter, cache, refresh_cache, http_client)
+        if cached_result:
+            return cached_result
+        with metrics.span('parse'):
+            parsed = parse_auction_html(html, parser_backend)
+
+        # セッションが渡されない場合はこの呼び出しの中だけで使うセッションを作る（browser_profile=NoneならSeleniumを使わない）
+        own_session = driver_session is None and browser_profile is not None
+        if own_session:
+            from chrome_driver_setup import ChromeDriverSession
+            driver_session = ChromeDriverSession(profile=browser_profile)
+        return complete_auction_result(url, parsed, driver_session, rate_limiter, cache)
+
+    except ThrottledError:
+        raise
+    except Exception as e:
+        logging.error(f"Error processing URL: {url}. Error: {str(e)}")
+        metrics.increment('scrape_error')
         return None
     finally:
-        if driver:
-            quit_driver(driver)
+        if own_session:
+            driver_session.close()
+
+def get_skip_reason(row_data, tags, now=None):
+    """差分モードで行をスキップする理由を返す。再取得が必要な場合はNone
+
+    出力列（INCREMENTAL_OUTPUT_TAGS）が全て埋まっている行のうち、
+    終了日時が過去のものは'ended'、終了日時が読み取れないものは'complete'とする。
+    終了日時がまだ先のオークションは価格が変わる可能性があるため再取得する。
+    """
+    output_values = [row_data[tags.index(tag)].strip() for tag in INCREMENTAL_OUTPUT_TAGS if tag in tags]
+    if not output_values or any(value in ('', 'N/A') for value in output_values):
+        return None
 
-def smart_scraping(service, spreadsheet_url, sheet_name, start_row, end_row, is_scraping):
+    end_date = None
+    if 'transaction_date' in tags:
+        end_date = parse_end_date(row_data[tags.index('transaction_date')])
+    if end_date is None:
+        return 'complete'
+    if end_date <= (now or datetime.now()):
+        return 'ended'
+    return None
+
+
+def cancel_result(future):
+    """結果のFutureを取り消し、wait()でそのFutureを待っている他のシートにも知らせる
+
+    Future.cancel()だけでは待っている側が起きないため、set_running_or_notify_cancel()まで呼ぶ。
+    """
+    if future.cancel():
+        future.set_running_or_notify_cancel()
+
+
+def smart_scraping(service, spreadsheet_url, sheet_name, start_row, end_row, is_scraping,
+                   driver_max_pages=200, driver_max_memory_mb=1500,
+                   max_workers=1, requests_per_second=1.0, source=None, sink=None,
+                   flush_rows=50, flush_interval=10.0, incremental=True, force_refresh=False, cache=None,
+                   http_client=None, parser_backend='auto', browser_profile='scraping', on_progress=None,
+                   journal=None, resume=False, chunk_rows=500, auction_futures=None, adaptive=True,
+                   max_requeues=3, parse_pool=None, store=None, executor=None, rate_limiter=None,
+                   driver_pool=None):
+    """sheet_nameの行をスクレイピングし、結果を出力先に書き込む
+
+    source / sink を省略した場合はspreadsheet_urlのシートから読み込み、同じシートに書き込む。
+    incrementalが有効な場合は取得済みの行・終了済みのオークションをスキップする
+    （force_refreshで全行を再取得）。cacheにPageCacheを渡すと取得済みのページ・解析結果を再利用する。
+    browser_profileをNoneにすると、HTMLに送料がない場合もSeleniumでの取得を行わない。
+
+    戻り値は (新たに書き込んだ行数, スキップした行数, 詳細) で、
+    詳細の'skip_reasons'にスキップ理由ごとの件数、'failed'に失敗した行数が入る。
+    書き込んだ行数は出力先への書き込みが確定した行だけを数え、書き込めなかった行は'failed'に含めて'unwritten'にも入る。
+
+    on_progressを渡すと、行の処理が終わるたびに進捗の辞書（'event', 'row', 'status' など）で呼び出す。
+    書き込む行の'written'は出力先への書き込みが確定した時点で送り、書き込めなかった行は'failed'になる。
+
+    journalにRunJournalを渡すと各行の進捗を記録する。resumeを有効にすると前回の記録を読み込み、
+    書き込み待ちだった結果を先に書き込んでから、処理済みの行を飛ばして続きから処理する。
+
+    入力元がiter_rowsを持つ場合は、url列と出力列だけをchunk_rows行ずつ読み込みながら処理する。
+
+    同じオークションを指す行（URLの表記違いを含む）は1回だけ取得し、結果を全ての行に書き込む。
+    複数のシートを続けて処理する場合は、同じauction_futures（辞書）を渡すとシートをまたいで重複を省く。
+    まとめた行数は詳細の'duplicates_collapsed'に入る。
+
+    adaptiveが有効な場合は、アクセス制限（429・503・制限ページ）に応じてレートと同時実行数を自動で調整し
+    （requests_per_secondとmax_workersが上限で、それを超えては上げない）、制限で失敗した行はmax_requeues回まで再試行する。
+
+    parse_pool（ParsePool）を渡すと、ページの取得（スレッド）と解析（別プロセス）を別の段階にし、
+    解析を待たずに次のページを取得する。HTMLに送料がない行だけ、解析後にスレッドでブラウザを使う。
+
+    store（TransactionStore）を渡すと、取得した結果をローカルの取引データベースにも保存する。
+
+    executor / rate_limiter / driver_poolを渡すと、作らずにそれを使う（複数のシートで共有する場合。閉じない）。
+    """
+    # ブラウザはワーカーごとに1つだけ起動し、全ての行で使い回す
+    own_driver_pool = driver_pool is None and browser_profile is not None
+    if own_driver_pool:
+        from chrome_driver_setup import ChromeDriverPool
+        driver_pool = ChromeDriverPool(max_pages=driver_max_pages, max_memory_mb=driver_max_memory_mb,
+                                       profile=browser_profile)
+    # auctions.yahoo.co.jpへのアクセス間隔は全ワーカー共有のトークンバケットで制御する
+    if rate_limiter is None:
+        if adaptive:
+            rate_limiter = AdaptiveRateController(rate=requests_per_second, concurrency=max_workers)
+        else:
+            rate_limiter = HostRateLimiter(rate=requests_per_second, capacity=max_workers)
+    adaptive = hasattr(rate_limiter, 'concurrency')
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    # ページ取得は全ワーカーで1つのコネクションプールを共有する
+    if http_client is None:
+        http_client = get_http_client()
+
+    def scrape_row(url):
+        with get_metrics().span('row'):
+            return scrape_row_with_browser(url)
+
+    def scrape_row_with_browser(url):
+        if browser_profile is None:
+            return scrape_yahoo_auction(url, None, rate_limiter, cache, force_refresh, http_client, parser_backend,
+                                        None)
+        with driver_pool.session() as driver_session:
+            return scrape_yahoo_auction(url, driver_session, rate_limiter, cache, force_refresh, http_client,
+                                        parser_backend, browser_profile)
+
+    # parse_poolを使う場合の取得・送料の補完の段階（解析はparse_poolの子プロセスで行う）
+    def fetch_row(url):
+        try:
+            return fetch_auction_page(url, rate_limiter, cache, force_refresh, http_client)
+        except ThrottledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error processing URL: {url}. Error: {str(e)}")
+            get_metrics().increment('scrape_error')
+            return None, None
+
+    def render_row(url, parsed):
+        try:
+            with driver_pool.session() as driver_session:
+                return complete_auction_result(url, parsed, driver_session, rate_limiter, cache)
+        except Exception as e:
+            logging.error(f"Error processing URL: {url}. Error: {str(e)}")
+            get_metrics().increment('scrape_error')
+            return None
+
+    def report(event, **fields):
+        if on_progress:
+            on_progress({'event': event, 'sheet': sheet_name, **fields})
+
+    def finish_sink():
+        """出力先を閉じる（渡された出力先はフラッシュだけ行う）。書き込めなかった行番号のリストを返す"""
+        nonlocal sink_finished
+        sink_finished = True
+        if own_sink:
+            return sink.close() or []
+        sink.flush()
+        return sorted(getattr(sink, 'pending', None) or [])
+
+    # 呼び出し側から渡された出力先は閉じずにフラッシュだけ行う
+    own_sink = sink is None
+    completed = False
+    unwritten = []
+    sink_finished = False
+    rows = []
+    # 実行中のスクレイピング（future -> そのオークションを参照する [(行番号, URL), ...]、処理の段階）
+    pending = {}
+    future_stages = {}
+    # このシートで取得中のオークションの最終的な結果（オークションのキー -> Future）
+    final_futures = {}
+    # レート制限を共有するシートの間で分け合う投入数の枠（このシートが使っている数）
+    in_flight = rate_limiter.in_flight
+    slots_held = 0
+
+    in_flight.join()
     try:
-        print(f"Starting smart_scraping for sheet: {sheet_name}, rows: {start_row} to {end_row}")
+        logging.info(f"Starting smart_scraping for sheet: {sheet_name}, rows: {start_row} to {end_row}")
 
-        spreadsheet_id = extract_spreadsheet_id(spreadsheet_url)
-        if not spreadsheet_id:
-            raise ValueError("Invalid spreadsheet URL")
-        print(f"Extracted spreadsheet ID: {spreadsheet_id}")
+        if source is None:
+            source = SheetsSource(service, spreadsheet_url, sheet_name)
+        if own_sink:
+            sink = SheetsSink(service, spreadsheet_url, sheet_name, flush_rows, flush_interval)
 
         # タグ行（2行目）を取得
         try:
-            tags = read_from_sheet(service, spreadsheet_url, f'{sheet_name}!2:2')[0]
-            print(f"Retrieved tags: {tags}")
+            with get_metrics().span('sheet_read'):
+                tags = source.read_tags()
+            logging.debug(f"Retrieved tags: {tags}")
         except Exception as e:
-            print(f"Error retrieving tags: {str(e)}")
+            logging.error(f"Error retrieving tags: {str(e)}")
             raise
 
         # 'url' タグの列インデックスを取得
         try:
             url_index = tags.index('url')
-            print(f"URL index: {url_index}")
+            logging.debug(f"URL index: {url_index}")
         except ValueError:
-            print("Error: 'url' tag not found in the second row.")
+            logging.error("'url' tag not found in the second row.")
             raise ValueError("'url'タグが2行目に見つかりません。")
 
-        # 処理する行の範囲を決定
-        range_to_process = f'{sheet_name}!{start_row}:{end_row if end_row else ""}'
-        try:
-            rows = read_from_sheet(service, spreadsheet_url, range_to_process)
-            print(f"Retrieved {len(rows)} rows to process")
-        except Exception as e:
-            print(f"Error reading rows from sheet: {str(e)}")
-            raise
+        # 処理する行の範囲を決定（分割して読み込める入力元は、読み込みながら処理を始める）
+        if hasattr(source, 'iter_rows'):
+            # 行数が分からないまま処理を始め、入力元がurl列を読んで数えた行数を後から知らせる
+            rows = source.iter_rows(start_row, end_row, tags, ('url',) + tuple(RESULT_FIELDS), chunk_rows,
+                                    on_count=lambda row_count: report('total', sheet=sheet_name, rows=row_count))
+            logging.info(f"Streaming rows from {start_row} in chunks of {chunk_rows}")
+            report('start', sheet=sheet_name, rows=end_row - start_row + 1 if end_row else None)
+        else:
+            try:
+                with get_metrics().span('sheet_read'):
+                    rows = source.read_rows(start_row, end_row)
+                logging.info(f"Retrieved {len(rows)} rows to process")
+                report('start', sheet=sheet_name, rows=len(rows))
+            except Exception as e:
+                logging.error(f"Error reading rows from sheet: {str(e)}")
+                raise
 
-        new_data_count = 0
         skipped_count = 0
+        failed_count = 0
+        skip_reasons = Counter()
+        now = datetime.now()
+
+        # 書き込んだ行数は、出力先への書き込みが確定した時点で数える（SheetsSinkはタイマーのスレッドからも呼ぶ）
+        persisted_rows = set()
+        persisted_lock = threading.Lock()
+        # 出力先のバッファにあり、書き込みが確定していない行（行番号 -> URL）
+        buffered_urls = {}
+
+        def on_persisted(row_nums):
+            with persisted_lock:
+                persisted_rows.update(row_nums)
+                urls = [buffered_urls.pop(row_num, None) for row_num in row_nums]
+            if journal:
+                journal.record_written(row_nums)
+            for row_num, url in zip(row_nums, urls):
+                report('row', row=row_num, url=url, status='written')
+
+        def write_row(row_num, url, scraped_data):
+            """結果を出力先に渡す。書き込む列がなければFalseを返す（書き込みが確定したらon_persistedで知らせる）"""
+            # 出力先によってはwriteの中で書き込みまで終わるため、先にURLを登録しておく
+            with persisted_lock:
+                buffered_urls[row_num] = url
+            if sink.write(row_num, url, tags, scraped_data):
+                return True
+            with persisted_lock:
+                buffered_urls.pop(row_num, None)
+            return False
+
+        # 前回の実行の続きから再開する
+        resumed_rows = set()
+        replayed_rows = set()
+        if journal:
+            state = journal.load() if resume else {'start': None, 'done': set(), 'pending': {}}
+            journal.begin(resume, sheet=sheet_name, start_row=start_row, end_row=end_row)
+        sink.on_persisted = on_persisted
+        if journal:
+            if state['pending']:
+                logging.info(f"Writing {len(state['pending'])} results left unwritten by the previous run")
+            for row_num, (url, scraped_data) in sorted(state['pending'].items()):
+                write_row(row_num, url, scraped_data)
+            resumed_rows = state['done']
+            replayed_rows = set(state['pending'])
+
+        # 取得したオークション（オークションのキー -> 最終的な結果のFuture）。複数のシートで共有できるよう、
+        # 処理の段階や再試行で入れ替わるfutureではなく、結果が決まったときに完了するFutureを置く
+        if auction_futures is None:
+            auction_futures = {}
+        duplicates_collapsed = 0
+        # future -> オークションのキー、オークションのキー -> アクセス制限による再試行の回数
+        future_keys = {}
+        requeue_counts = Counter()
+        throttle_requeues = 0
+        # このシートで処理中のオークション（オークションのキー -> [(行番号, URL), ...]）
+        row_refs_by_key = {}
+        # parse_poolを使う場合の、オークションごとの処理の開始時刻
+        row_started = {}
+        in_progress = object()
+
+        def track(key, row_refs, future, stage):
+            row_refs_by_key[key] = row_refs
+            future_keys[future] = key
+            future_stages[future] = stage
+            pending[future] = row_refs
+
+        def launch(key, row_refs):
+            url = normalize_auction_url(row_refs[0][1])
+            if parse_pool:
+                row_started[key] = time.perf_counter()
+                track(key, row_refs, executor.submit(fetch_row, url), 'fetch')
+            else:
+                track(key, row_refs, executor.submit(scrape_row, url), 'scrape')
+
+        def advance(key, row_refs, stage, value):
+            """終わった段階の結果から次の段階を投入する。全ての段階が終わった場合は書き込む結果を返す"""
+            url = normalize_auction_url(row_refs[0][1])
+            if stage == 'fetch' and value[1] is not None:
+                track(key, row_refs, parse_pool.submit(value[1]), 'parse')
+                return in_progress
+            if stage == 'parse' and value['total_postage'] is None and driver_pool is not None:
+                track(key, row_refs, executor.submit(render_row, url, value), 'render')
+                return in_progress
+            if stage == 'fetch':
+                result = value[0]
+            elif stage == 'parse':
+                result = complete_auction_result(url, value, None, rate_limiter, cache)
+            else:
+                result = value
+            return result
+
+        def in_flight_limit():
+            # 同時実行数を調整する場合は、実行待ちを含めてその数までしか投入しない（調整しない場合はワーカー数の2倍）。
+            # 上限はレート制限を共有する全てのシートの合計
+            limit = rate_limiter.concurrency if adaptive else max_workers * 2
+            # 解析待ちのページはプロセス数の2倍まで溜めてよい（それを超えると取得を待つ）
+            if parse_pool:
+                limit += parse_pool.max_workers * 2
+            return limit
+
+        def settle(key):
+            """このシートで取得したオークションの処理を終え、投入数の枠を返して結果のFutureを返す"""
+            nonlocal slots_held
+            slots_held -= 1
+            in_flight.release()
+            return final_futures.pop(key)
+
+        def handle_completed(futures):
+            nonlocal throttle_requeues
+            for future in futures:
+                row_refs = pending.pop(future)
+                key = future_keys.pop(future)
+                stage = future_stages.pop(future)
+                if future.cancelled():
+                    row_refs_by_key.pop(key, None)
+                    row_started.pop(key, None)
+                    if key in final_futures:
+                        cancel_result(settle(key))
+                    continue
+                if stage == 'shared':
+                    # 他のシートが取得したオークションの結果
+                    row_refs_by_key.pop(key)
+                    for row_num, url in row_refs:
+                        handle_result(row_num, url, future.result())
+                    continue
+                try:
+                    scraped_data = future.result()
+                except ThrottledError as e:
+                    # アクセス制限で失敗した行はN/Aを書き込まず、レートを下げて再試行する
+                    requeue_counts[key] += 1
+                    if requeue_counts[key] <= max_requeues and is_scraping():
+                        logging.warning(f"{e} (retry {requeue_counts[key]}/{max_requeues})")
+                        launch(key, row_refs)
+                        throttle_requeues += 1
+                        continue
+                    logging.warning(f"Giving up after repeated throttling: {key}")
+                    scraped_data = None
+                except Exception as e:
+                    # 解析プロセスが異常終了した場合など
+                    logging.error(f"Error processing URL: {row_refs[0][1]}. Error: {str(e)}")
+                    get_metrics().increment('scrape_error')
+                    scraped_data = None
+                if parse_pool and scraped_data is not None:
+                    scraped_data = advance(key, row_refs, stage, scraped_data)
+                    if scraped_data is in_progress:
+                        continue
+                row_refs_by_key.pop(key)
+                # 失敗した行（アクセス制限で諦めた、解析プロセスが異常終了した）も含めて処理時間を記録する
+                if key in row_started:
+                    get_metrics().record('row', time.perf_counter() - row_started.pop(key))
+                settle(key).set_result(scraped_data)
+                for row_num, url in row_refs:
+                    handle_result(row_num, url, scraped_data)
+
+        def handle_result(row_num, url, scraped_data):
+            # シートへの書き込みはメインスレッドでのみ行う
+            nonlocal failed_count
+            if scraped_data:
+                logging.info(f"行 {row_num}: スクレイピング成功")
+                logging.debug(f"Scraped data: {scraped_data}")
+                if journal:
+                    journal.record_parsed(row_num, url, scraped_data)
+                if store:
+                    store.upsert(scraped_data, sheet_name, url, extract_spreadsheet_id(spreadsheet_url))
+                if not write_row(row_num, url, scraped_data):
+                    if journal:
+                        journal.record_skipped(row_num, 'unchanged')
+                    report('row', row=row_num, url=url, status='unchanged')
+            else:
+                logging.warning(f"行 {row_num}: スクレイピング失敗")
+                failed_count += 1
+                if journal:
+                    journal.record_failed(row_num, url)
+                report('row', row=row_num, url=url, status='failed')
 
         for row_num, row in enumerate(rows, start=start_row):
             if not is_scraping():
-                print("スクレイピングが中断されました。")
+                logging.info("スクレイピングが中断されました。")
                 break
 
-            print(f"\nProcessing row {row_num}")
+            logging.debug(f"Processing row {row_num}")
+            if row_num in replayed_rows:
+                continue
+            if row_num in resumed_rows:
+                skipped_count += 1
+                skip_reasons['resumed'] += 1
+                report('row', row=row_num, status='skipped', reason='resumed')
+                continue
+
             # 行のデータが足りない場合、空文字で埋める
             row_data = row + [''] * (len(tags) - len(row))
 
             if len(row_data) <= url_index or not row_data[url_index].strip():
-                print(f"行 {row_num}: URLが空です。スキップします。")
+                logging.debug(f"行 {row_num}: URLが空です。スキップします。")
                 skipped_count += 1
+                skip_reasons['empty_url'] += 1
+                if journal:
+                    journal.record_skipped(row_num, 'empty_url')
+                report('row', row=row_num, status='skipped', reason='empty_url')
                 continue
 
-            url = row_data[url_index].strip()
-            print(f"行 {row_num}: URL {url} の処理を開始します。")
-
-            # スクレイピング処理
-            scraped_data = scrape_yahoo_auction(url)
-
-            if scraped_data:
-                print(f"行 {row_num}: スクレイピング成功")
-                print(f"Scraped data: {scraped_data}")
-
-                # 更新が必要な列だけを特定してバッチ更新用のデータを準備
-                updates = []
-                for tag, value in scraped_data.items():
-                    if tag in tags:
-                        col_letter = chr(65 + tags.index(tag))  # A, B, C...の列文字を生成
-                        range_name = f'{sheet_name}!{col_letter}{row_num}'
-                        updates.append({
-                            'range': range_name,
-                            'values': [[value]]
-                        })
-
-                # バッチ更新を実行
-                if updates:
-                    try:
-                        body = {
-                            'valueInputOption': 'USER_ENTERED',
-                            'data': updates
-                        }
-                        service.spreadsheets().values().batchUpdate(
-                            spreadsheetId=spreadsheet_id,
-                            body=body
-                        ).execute()
-                        print(f"Successfully updated row {row_num} with specific columns")
-                        print(f"Updated ranges: {[update['range'] for update in updates]}")
-                        new_data_count += 1
-                    except Exception as e:
-                        print(f"Error updating row {row_num}: {str(e)}")
-                        continue
-
-            else:
-                print(f"行 {row_num}: スクレイピング失敗")
+            if incremental and not force_refresh:
+                skip_reason = get_skip_reason(row_data, tags, now)
+                if skip_reason:
+                    logging.debug(f"行 {row_num}: 取得済みのためスキップします。({skip_reason})")
+                    skipped_count += 1
+                    skip_reasons[skip_reason] += 1
+                    if journal:
+                        journal.record_skipped(row_num, skip_reason)
+                    report('row', row=row_num, status='skipped', reason=skip_reason)
+                    continue
 
-            # レート制限（1秒待機）
-            time.sleep(1)
+            url = row_data[url_index].strip()
+            logging.debug(f"行 {row_num}: URL {url} の処理を開始します。")
+
+            # 同じオークションを取得済み・取得中なら、その結果を使う
+            key = auction_key(url)
+            # 他のシートと同時に同じオークションを取得し始めないよう、結果のFutureの登録は1回の操作で行う
+            final_future = Future()
+            future = auction_futures.setdefault(key, final_future)
+            if future is not final_future and future.cancelled():
+                auction_futures[key] = future = final_future
+            if future is not final_future:
+                logging.debug(f"行 {row_num}: {key} は他の行と同じオークションです。")
+                duplicates_collapsed += 1
+                if key in row_refs_by_key:
+                    row_refs_by_key[key].append((row_num, url))
+                elif future.done():
+                    handle_result(row_num, url, future.result())
+                else:
+                    # 他のシートで取得中なら、その結果を待つ
+                    track(key, [(row_num, url)], future, 'shared')
+                continue
 
-        print(f"\nScraping completed. New data count: {new_data_count}, Skipped count: {skipped_count}")
-        return new_data_count, skipped_count
+            # 実行待ちが溜まりすぎないよう、in_flight_limitまでに抑える
+            final_futures[key] = final_future
+            while not in_flight.try_acquire(in_flight_limit(), slots_held):
+                if pending:
+                    done, _ = wait(pending, timeout=IN_FLIGHT_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    handle_completed(done)
+                else:
+                    # 枠を全て他のシートが使っている
+                    in_flight.wait(IN_FLIGHT_POLL_INTERVAL)
+            slots_held += 1
+
+            launch(key, [(row_num, url)])
+
+        # 中断された場合は未着手の行を取り消し、実行中の行だけ書き込む
+        if not is_scraping():
+            for future, stage in future_stages.items():
+                if stage != 'shared':
+                    future.cancel()
+        # 再試行で新しく投入された行も含めて、全て終わるまで待つ
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            handle_completed(done)
+        completed = is_scraping()
+
+        # 書き込み待ちの結果を書き込み、書き込めなかった行は失敗として数える（ジャーナルでは書き込み待ちのまま残る）
+        unwritten = finish_sink()
+        failed_count += len(unwritten)
+        for row_num in unwritten:
+            report('row', row=row_num, url=buffered_urls.get(row_num), status='failed', reason='write_error')
+        new_data_count = len(persisted_rows)
+
+        logging.info(f"Scraping completed. New data count: {new_data_count}, Skipped count: {skipped_count}, "
+                     f"Skip reasons: {dict(skip_reasons)}, Failed count: {failed_count}, "
+                     f"Duplicates collapsed: {duplicates_collapsed}, Throttle requeues: {throttle_requeues}")
+        return new_data_count, skipped_count, {
+            'skip_reasons': dict(skip_reasons),
+            'failed': failed_count,
+            'unwritten': len(unwritten),
+            'duplicates_collapsed': duplicates_collapsed,
+            'throttle_requeues': throttle_requeues,
+            'throttled': getattr(rate_limiter, 'throttled_count', 0),
+            'metrics': get_metrics().summary()
+        }
 
     except Exception as e:
-        print(f"Error in smart_scraping: {str(e)}")
+        logging.error(f"Error in smart_scraping: {str(e)}")
         raise
-
-def main(spreadsheet_url, start_row, end_row, sheet_name, is_scraping):
+    finally:
+        # 途中で抜けた場合も先読みのスレッドを止める
+        if hasattr(rows, 'close'):
+            rows.close()
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            # 共有のワーカーからは、このシートの未着手の行だけ取り消す
+            for future, stage in future_stages.items():
+                if stage != 'shared':
+                    future.cancel()
+        # 結果を待っている他のシートが止まらないよう、決まらなかった結果は取り消す
+        for final_future in final_futures.values():
+            cancel_result(final_future)
+        if slots_held:
+            in_flight.release(slots_held)
+        in_flight.leave()
+        if own_driver_pool:
+            driver_pool.close()
+        if sink is not None and not sink_finished:
+            finish_sink()
+        if journal:
+            # 最後まで処理して全て書き込めた場合だけジャーナルを消す（それ以外は次回再開できるよう残す）
+            journal.close(completed=completed and not unwritten)
+        if not own_sink and sink is not None:
+            sink.on_persisted = None
+
+def run_job(targets, is_scraping, force_refresh=False, use_cache=True, metrics_jsonl_path=None,
+            metrics_prometheus_path=None, resume=False, use_journal=True, interactive_auth=True, bulk=False,
+            parse_processes=0, use_store=True, export_summary=False, **options):
+    """複数のシート（別のスプレッドシートのシートも可）を1回の実行で処理する
+
+    targetsは (スプレッドシートのURL, シート名, 開始行, 終了行) のリスト。optionsはsmart_scrapingにそのまま渡す。
+    Sheetsのクライアント、HTTPのコネクションプール、ワーカー、レート制限、ブラウザ、ページキャッシュ、
+    取引データベースは全てのシートで共有し、準備は1回だけ行う。シートごとに行を読み進める処理を並行して動かし、
+    どのシートも同じ数までしか共有のワーカーに投入しないため、行はシートの間で交互に処理される。
+    同じオークションが複数のシートにある場合は1回だけ取得する。
+
+    use_journalが有効な場合は進捗をシートごとの実行ジャーナルに記録し、resumeで前回の続きから再開する。
+    interactive_authがFalseの場合、保存済みのトークンが使えなければブラウザでの認証を行わずにエラーにする。
+    bulkが有効な場合は、出品者の終了したオークションの一覧からまとめて取得する（seller_listing.bulk_scraping、
+    シートは1つずつ処理する）。parse_processesを指定すると、その数のプロセスでHTMLを解析する（-1でCPUのコア数）。
+    use_storeが有効な場合は結果をローカルの取引データベースにも保存し、export_summaryが有効なら
+    実行後にそのスプレッドシートで取得した取引の月別・出品者別の集計を集計シートに書き出す。
+
+    戻り値は全シートの合計の (書き込んだ行数, スキップした行数, 詳細) で、
+    詳細の'sheets'にシートごとの {'spreadsheet_url', 'sheet', 'new', 'skipped', 'failed', ...} のリストが入る。
+    """
+    if len(targets) > 1 and (options.get('source') is not None or options.get('sink') is not None):
+        raise ValueError("ファイルから読み込む・ファイルに書き込む場合は、1つのシートしか処理できません。")
+    # 使えないHTMLパーサーは、全ての行を取得してから失敗しないよう最初に確認する
+    resolve_backend(options.get('parser_backend', 'auto'))
+    metrics = start_run()
+    cache = PageCache() if use_cache else None
+    store = TransactionStore() if use_store else None
+    parse_pool = None
+    shared = {}
     try:
-        service = get_sheets_service()
-
-        new_count, skipped_count = smart_scraping(service, spreadsheet_url, sheet_name, start_row, end_row, is_scraping)
-
-        return new_count, skipped_count
+        # 入力元と出力先の両方がシート以外なら認証しない
+        service = None
+        if options.get('source') is None or options.get('sink') is None:
+            with metrics.span('sheets_auth'):
+                service = get_sheets_service(interactive_auth)
+
+        if bulk:
+            from seller_listing import bulk_scraping
+            results = []
+            for spreadsheet_url, sheet_name, start_row, end_row in targets:
+                if not is_scraping():
+                    break
+                results.append(bulk_scraping(service, spreadsheet_url, sheet_name, start_row, end_row, is_scraping,
+                                             force_refresh=force_refresh, cache=cache, store=store, **options))
+        else:
+            if parse_processes:
+                from parse_pool import ParsePool
+                parse_pool = ParsePool(parse_processes if parse_processes > 0 else None,
+                                       options.get('parser_backend', 'auto'))
+            if len(targets) > 1:
+                # 全てのシートで共有するワーカー・レート制限・ブラウザ（1つのシートならsmart_scrapingが作る）
+                max_workers = options.get('max_workers', 1)
+                requests_per_second = options.get('requests_per_second', 1.0)
+                shared['executor'] = ThreadPoolExecutor(max_workers=max_workers)
+                if options.get('adaptive', True):
+                    shared['rate_limiter'] = AdaptiveRateController(rate=requests_per_second, concurrency=max_workers)
+                else:
+                    shared['rate_limiter'] = HostRateLimiter(rate=requests_per_second, capacity=max_workers)
+                browser_profile = options.get('browser_profile', 'scraping')
+                if browser_profile is not None:
+                    from chrome_driver_setup import ChromeDriverPool
+                    shared['driver_pool'] = ChromeDriverPool(max_pages=options.get('driver_max_pages', 200),
+                                                             max_memory_mb=options.get('driver_max_memory_mb', 1500),
+                                                             profile=browser_profile)
+            auction_futures = {}
+
+            def run_target(target):
+                spreadsheet_url, sheet_name, start_row, end_row = target
+                journal = RunJournal.for_sheet(spreadsheet_url, sheet_name) if use_journal else None
+                return smart_scraping(service, spreadsheet_url, sheet_name, start_row, end_row, is_scraping,
+                                      force_refresh=force_refresh, cache=cache, journal=journal, resume=resume,
+                                      parse_pool=parse_pool, store=store, auction_futures=auction_futures,
+                                      **shared, **options)
+
+            if len(targets) == 1:
+                results = [run_target(targets[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=len(targets)) as sheet_executor:
+                    results = list(sheet_executor.map(run_target, targets))
+
+        if store and export_summary and service:
+            for spreadsheet_url in dict.fromkeys(target[0] for target in targets):
+                with metrics.span('summary_export'):
+                    logging.info(f"Exported {store.export_summary(service, spreadsheet_url)} rows of totals "
+                                 f"to the summary sheet")
+
+        if len(results) == 1:
+            new_count, skipped_count, details = results[0]
+            details['sheets'] = [dict(spreadsheet_url=targets[0][0], sheet=targets[0][1], new=new_count,
+                                      skipped=skipped_count, failed=details['failed'],
+                                      duplicates_collapsed=details['duplicates_collapsed'])]
+            return new_count, skipped_count, details
+        # 共有のレート制限の回数は全シートの合計なので、シートごとには足さない
+        return merge_results(targets, results, getattr(shared.get('rate_limiter'), 'throttled_count', None))
 
     except ValueError as e:
-        print(f"エラー: {str(e)}")
+        logging.error(f"エラー: {str(e)}")
         raise
     except Exception as e:
-        print(f"予期せぬエラーが発生しました: {str(e)}")
+        logging.exception(f"予期せぬエラーが発生しました: {str(e)}")
         raise
+    finally:
+        if 'executor' in shared:
+            shared['executor'].shutdown(wait=True, cancel_futures=True)
+        if 'driver_pool' in shared:
+            shared['driver_pool'].close()
+        if parse_pool:
+            parse_pool.close()
+        if store:
+            store.close()
+        if cache:
+            cache.close()
+        # 実行ごとのサマリーをログに出し、指定があればファイルに書き出す
+        metrics.log_summary()
+        if metrics_jsonl_path:
+            metrics.export_jsonl(metrics_jsonl_path)
+        if metrics_prometheus_path:
+            metrics.export_prometheus(metrics_prometheus_path)
+
+
+def merge_results(targets, results, throttled=None):
+    """シートごとの (書き込んだ行数, スキップした行数, 詳細) を合計し、詳細の'sheets'にシートごとの件数を入れる
+
+    throttledを渡すと、シートごとの'throttled'を足さずにその値を使う（レート制限を共有した場合）。
+    """
+    new_total = skipped_total = 0
+    skip_reasons = Counter()
+    sheets = []
+    merged = {'failed': 0, 'duplicates_collapsed': 0}
+    for (spreadsheet_url, sheet_name, _, _), (new_count, skipped_count, details) in zip(targets, results):
+        new_total += new_count
+        skipped_total += skipped_count
+        skip_reasons.update(details['skip_reasons'])
+        for key, value in details.items():
+            if isinstance(value, int):
+                merged[key] = merged.get(key, 0) + value
+        sheets.append(dict(spreadsheet_url=spreadsheet_url, sheet=sheet_name, new=new_count, skipped=skipped_count,
+                           failed=details['failed'], duplicates_collapsed=details['duplicates_collapsed']))
+    if throttled is not None:
+        merged['throttled'] = throttled
+    merged['skip_reasons'] = dict(skip_reasons)
+    merged['sheets'] = sheets
+    merged['metrics'] = get_metrics().summary()
+    return new_total, skipped_total, merged
+
+
+def main(spreadsheet_url, start_row, end_row, sheet_name, is_scraping, force_refresh=False, **options):
+    """1つのシートのスクレイピングを1回実行する（run_jobにそのまま渡す）"""
+    return run_job([(spreadsheet_url, sheet_name, start_row, end_row)], is_scraping, force_refresh, **options)
 
 if __name__ == "__main__":
-    # テスト用のURL（実際の使用時はGUIから渡される）
-    test_url = "https://docs.google.com/spreadsheets/d/your-spreadsheet-id/edit#gid=0"
-    new_count, skipped_count = main(test_url, 3, None, "ヤフオク購入履歴", lambda: True)
-    print(f"新たにスクレイピングしたURL数: {new_count}")
-    print(f"スキップしたURL数: {skipped_count}")
\ No newline at end of file
+    # コマンドラインからの実行は cli.py に任せる
+    import sys
+    from cli import main as cli_main
+    sys.exit(cli_main())
\ No newline at end of file